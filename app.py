@@ -1,20 +1,36 @@
-import sys, os, json, csv, datetime, calendar
+import sys, os, io, json, csv, gzip, datetime, calendar, threading, time, sqlite3, bisect, functools, importlib, collections, zlib, abc, itertools
+STARTUP_T0 = time.perf_counter(); IMPORT_TIMES = {}  # module -> seconds, reported by --profile-startup
+import numpy as np
+IMPORT_TIMES["numpy"] = time.perf_counter() - STARTUP_T0
 from PySide6.QtWidgets import (
     QApplication, QWidget, QVBoxLayout, QHBoxLayout,
     QLabel, QTableView, QHeaderView, QFrame, QSizePolicy, 
     QAbstractItemView, QPushButton, QMenu, QFileDialog, QMessageBox, 
     QGraphicsDropShadowEffect, QScrollArea, QDialog, QLineEdit, 
-    QFormLayout, QDialogButtonBox, QTabWidget, QAbstractScrollArea, QStyle,
-    QProgressBar
+    QFormLayout, QDialogButtonBox, QTabWidget, QStyle,
+    QProgressBar, QDateEdit, QComboBox, QCheckBox, QListWidget, QListWidgetItem
 )
 from PySide6.QtCore import (
-    Qt, QAbstractTableModel, QTimer, QRect, QPoint, Signal, 
-    QPropertyAnimation, QEasingCurve, QObject, QSize, QByteArray
+    Qt, QAbstractTableModel, QTimer, QRect, Signal, 
+    QEasingCurve, QObject, QSize, QByteArray, QEvent,
+    QDate, QRunnable, QThreadPool, QModelIndex
 )
-from PySide6.QtGui import QColor, QFont, QAction, QIcon
+from PySide6.QtGui import QColor, QFont, QAction, QIcon, QKeySequence
+IMPORT_TIMES["PySide6"] = time.perf_counter() - STARTUP_T0 - IMPORT_TIMES["numpy"]
 
 # --- CONFIGURATION ---
 DATA_FILE = "habit_data.json"
+JOURNAL_FILE = DATA_FILE + ".journal"
+JOURNAL_COMPACT_BYTES = 256 * 1024  # fold the journal back into DATA_FILE past this size
+SAVE_COALESCE_MS = 250  # snapshot requests arriving within this window become one write
+SQLITE_FILE = "habit_data.db"
+SHARD_DIR = "habit_data"  # one file per year plus MANIFEST_FILE
+MANIFEST_FILE = "manifest.json"
+STORAGE_BACKEND = os.environ.get("HABIT_STORAGE", "shards")  # "shards" (SHARD_DIR), "json" (DATA_FILE + journal) or "sqlite"
+UNDO_LIMIT_BYTES = 1 << 20  # undo + redo history budget; the oldest steps are dropped past it
+MONTH_CACHE_SIZE = 12  # computed month views kept by MonthViewCache
+IMPORT_JSON_LIMIT = 64 << 20  # characters; a .json document is parsed whole, larger ones must be CSV or JSON Lines
+GRID_VISIBLE_HABITS = 12  # habit rows shown before the grid scrolls internally instead of growing
 ICON_NAME = "icon.ico" 
 DEFAULT_HABITS = ["Workout", "Meditation", "Reading", "Coding", "Sleep 8h"]
 DEFAULT_TIMES = ["07:00 AM", "08:00 AM", "09:00 PM", "10:00 PM", "11:00 PM"]
@@ -34,7 +50,7 @@ THEME_LIGHT = {
     "btn_filter_bg": "#0EA5E9", "btn_filter_text": "#FFFFFF",
     "row_even": "#FFFFFF", "row_odd": "#F8FAFB",
     "weekend_text": "#D32F2F", "day_text": "#64748B", "date_text": "#1C1F26",
-    "undo_text": "#1C1F26", "undo_btn": "#2E7D32",
+    "undo_text": "#1C1F26", "undo_btn": "#2E7D32", "selection": "rgba(59, 130, 246, 70)",
     "clock_text": "#6366F1", "clock_bg": "#EEF2FF", "clock_border": "#E0E7FF"
 }
 
@@ -52,7 +68,7 @@ THEME_DARK = {
     "btn_filter_bg": "#1F6FEB", "btn_filter_text": "#FFFFFF",
     "row_even": "#161B22", "row_odd": "#0D1117",
     "weekend_text": "#FF5252", "day_text": "#8B949E", "date_text": "#C9D1D9",
-    "undo_text": "#FFFFFF", "undo_btn": "#58A6FF",
+    "undo_text": "#FFFFFF", "undo_btn": "#58A6FF", "selection": "rgba(88, 166, 255, 70)",
     "clock_text": "#A5B4FC", "clock_bg": "#1F2937", "clock_border": "#374151"
 }
 
@@ -72,6 +88,81 @@ KPI_STYLES_DARK = {
     "Total":   {"text": "#FFD54F"}
 }
 
+def button_css(selector, bg, text, is_dropdown=False):
+    """Rules for an AnimatedButton (solid fill, outline on hover, menu arrow for dropdowns)."""
+    padding, hover_padding = ("10px 35px 10px 20px", "8px 33px 8px 18px") if is_dropdown else ("10px 20px", "8px 18px")
+    return f"""
+        {selector} {{ background-color: {bg}; color: {text}; border-radius: 8px; padding: {padding}; font-weight: 600; font-size: 13px; border: none; text-align: center; }}
+        {selector}:hover {{ background-color: {bg}; border: 2px solid #FFFFFF50; padding: {hover_padding}; }}
+        {selector}::menu-indicator {{ subcontrol-origin: padding; subcontrol-position: center right; right: 12px; width: 8px; height: 8px; }}"""
+
+@functools.lru_cache(maxsize=2)
+def theme_sheets(is_dark):
+    """Every stylesheet string for one theme, built once; widgets are addressed by objectName.
+
+    "window" goes on HabitApp and "container" on the page container, so a theme switch is two
+    setStyleSheet calls; the rest are for the overlays and dialogs."""
+    theme = THEME_DARK if is_dark else THEME_LIGHT
+    nav_style = f"background-color: {theme['btn_nav_bg']}; color: {theme['btn_nav_text']}; border: 1px solid {theme['btn_nav_border']}; border-radius: 8px; font-weight: bold; font-size: 16px;"
+    kpi = []
+    for key in KPI_STYLES_LIGHT:
+        style_data = KPI_STYLES_DARK.get(key, {"text": "#FFFFFF"}) if is_dark else KPI_STYLES_LIGHT[key]
+        bg_style = f"background-color: {theme['card']};" if is_dark else f"background-color: {style_data['bg']}; border: 1px solid {style_data['border']};"
+        kpi.append(f"""
+        #kpi_{key}, #kpi_{key} QFrame {{ {bg_style} border-radius: 12px; }}
+        #kpi_{key} QLabel {{ border: none; background: transparent; color: {style_data['text']}; }}
+        #kpi_{key} #kpi_icon {{ font-size: 20px; }}
+        #kpi_{key} #kpi_title {{ font-size: 13px; font-weight: 800; }}
+        #kpi_{key} #kpi_value {{ font-size: 24px; font-weight: 800; }}""")
+    return {
+        "window": f"""
+            * {{ font-family: 'Segoe UI', sans-serif; }}
+            QMenu {{ background: {theme['card']}; border: 1px solid {theme['border']}; }}
+            QMenu::item {{ color: {theme['text_primary']}; padding: 6px 20px; }}
+            QMenu::item:selected {{ background: {theme.get('row_odd', '#EEE')}; }}
+            QTabWidget::pane {{ border: 1px solid {theme['border']}; background: {theme['card']}; border-radius: 8px; }}
+            QTabBar::tab {{ background: {theme['bg']}; color: {theme['text_secondary']}; padding: 10px 20px; margin-right: 4px; border-top-left-radius: 6px; border-top-right-radius: 6px; }}
+            QTabBar::tab:selected {{ background: {theme['card']}; color: {theme['text_primary']}; font-weight: bold; }}
+            #main_scroll, #main_scroll * {{ background-color: {theme['bg']}; border: none; }}
+        """,
+        "container": f"""
+            * {{ background-color: {theme['bg']}; }}
+            #title {{ color: {theme['text_primary']}; font-size: 34px; font-weight: 800; }}
+            #subtitle {{ color: {theme['text_secondary']}; font-size: 18px; }}
+            #stats_title {{ color: {theme['text_primary']}; font-size: 26px; font-weight: 800; }}
+            #nav_prev, #nav_next {{ {nav_style} }}
+            #nav_prev:hover, #nav_next:hover {{ border-color: {theme['text_primary']}; }}
+            #month_badge {{ background-color: {theme['date_badge_bg']}; color: {theme['date_badge_text']}; border: 1px solid {theme['date_badge_border']}; border-radius: 8px; font-weight: 700; font-size: 15px; }}
+            #clock {{ background-color: {theme['clock_bg']}; color: {theme['clock_text']}; border: 1px solid {theme['clock_border']}; border-radius: 8px; font-weight: 700; font-size: 15px; }}
+            #theme_button {{ background-color: {theme['card']}; border: 1px solid {theme['border']}; border-radius: 19px; font-size: 16px; }}
+            #theme_button:hover {{ border: 1px solid {theme['text_secondary']}; }}
+            {button_css("#btn_add", theme['btn_add'], "#FFFFFF")}
+            {button_css("#btn_export", theme['btn_export'], "#FFFFFF", is_dropdown=True)}
+            {button_css("#btn_filter", theme['btn_filter_bg'], theme['btn_filter_text'], is_dropdown=True)}
+            #grid_container, #grid_container *, #chart_container, #chart_container * {{ background: {theme['card']}; border: 1px solid {theme['border']}; border-radius: 12px; }}
+            #grid_container QTableView {{ border: none; background: {theme['card']}; gridline-color: transparent; border-radius: 12px; selection-background-color: {theme['selection']}; }}
+            #grid_container QHeaderView::section {{ background: {theme['card']}; color: {theme['text_primary']}; border: none; border-bottom: 1px solid {theme['border']}; border-right: 1px solid {theme['border']}; padding-left: 10px; }}
+            {"".join(kpi)}
+        """,
+        "undo_bar": f"""
+            QWidget {{ background: transparent; }}
+            QLabel {{ color: {theme['undo_text']}; font-weight: bold; font-size: 14px; margin-right: 15px; }}
+            QPushButton {{ color: {theme['undo_btn']}; font-weight: 900; font-size: 14px; border: none; background: transparent; text-align: right; }}
+            QPushButton:hover {{ text-decoration: underline; }}
+        """,
+        "task_bar": f"""
+            QWidget {{ background: transparent; }}
+            QLabel {{ color: {theme['undo_text']}; font-weight: bold; font-size: 14px; }}
+            QProgressBar {{ background: {theme['border']}; border: none; border-radius: 4px; }}
+            QProgressBar::chunk {{ background: {theme['btn_export']}; border-radius: 4px; }}
+            QPushButton {{ color: {theme['undo_btn']}; font-weight: 900; font-size: 14px; border: none; background: transparent; }}
+            QPushButton:hover {{ text-decoration: underline; }}
+        """,
+        "habit_dialog": f"QDialog {{ background-color: {theme['card']}; }} QLabel {{ color: {theme['text_primary']}; font-weight: 600; font-size: 13px; }} QLineEdit {{ background: {theme['bg']}; color: {theme['text_primary']}; border: 1px solid {theme['border']}; padding: 8px; border-radius: 6px; }} QPushButton {{ background: {theme['btn_add']}; color: white; padding: 8px 16px; border-radius: 6px; border: none; font-weight: bold; }}",
+        "leaderboard_dialog": f"QDialog {{ background-color: {theme['card']}; }} QTableView {{ background: {theme['bg']}; color: {theme['text_primary']}; border: 1px solid {theme['border']}; border-radius: 6px; gridline-color: {theme['border']}; selection-background-color: {theme['selection']}; selection-color: {theme['text_primary']}; }} QHeaderView::section {{ background: {theme['card']}; color: {theme['text_primary']}; font-weight: bold; border: none; border-bottom: 1px solid {theme['border']}; padding: 6px; }} QPushButton {{ background: {theme['btn_add']}; color: white; padding: 8px 16px; border-radius: 6px; border: none; font-weight: bold; }}",
+        "export_dialog": f"QDialog {{ background-color: {theme['card']}; }} QLabel, QCheckBox {{ color: {theme['text_primary']}; font-weight: 600; font-size: 13px; }} QDateEdit, QComboBox, QListWidget {{ background: {theme['bg']}; color: {theme['text_primary']}; border: 1px solid {theme['border']}; padding: 6px; border-radius: 6px; }} QPushButton {{ background: {theme['btn_add']}; color: white; padding: 8px 16px; border-radius: 6px; border: none; font-weight: bold; }}",
+    }
+
 def resource_path(relative_path):
     try: base_path = sys._MEIPASS
     except Exception: base_path = os.path.dirname(os.path.abspath(__file__))
@@ -85,15 +176,1468 @@ def apply_shadow(widget, blur=15, offset=4, color="#50000000"):
     shadow.setColor(QColor(color))
     widget.setGraphicsEffect(shadow)
 
+# --- CALENDAR ---
+class CalendarIndex:
+    """Day-of-year lookups for one year, built once and shared through `CalendarIndex.of(year)` (bounded LRU).
+
+    Hot paths index these tables instead of building date objects: day d is day-of-year d (0-based)."""
+
+    def __init__(self, year):
+        self.year = year; self.days = 366 if calendar.isleap(year) else 365
+        self.jan1 = datetime.date(year, 1, 1).toordinal()
+        self.month_lengths = tuple(calendar.monthrange(year, m)[1] for m in range(1, 13))
+        self.month_starts = tuple(int(s) for s in np.cumsum((0,) + self.month_lengths[:-1]))
+        self.day_month = np.repeat(np.arange(1, 13, dtype=np.uint8), self.month_lengths)  # day -> month 1..12
+        self.weekdays = ((np.arange(self.days) + calendar.weekday(year, 1, 1)) % 7).astype(np.uint8)  # Monday = 0
+        self.iso = [f"{year:04d}-{m:02d}-{d:02d}" for m, n in enumerate(self.month_lengths, 1) for d in range(1, n + 1)]
+
+    @staticmethod
+    @functools.lru_cache(maxsize=32)
+    def of(year): return CalendarIndex(year)
+
+    @staticmethod
+    def day_of(date):
+        """Day-of-year index of a date (0 = Jan 1)."""
+        return CalendarIndex.of(date.year).month_starts[date.month - 1] + date.day - 1
+
+    def day(self, month, dom=1): return self.month_starts[month - 1] + dom - 1
+
+    @staticmethod
+    def shift_month(year, month, delta):
+        """(year, month) moved by `delta` months."""
+        year, month = divmod(year * 12 + month - 1 + delta, 12)
+        return year, month + 1
+
+# --- HISTORY STORE ---
+class HistoryStore:
+    """Bit-packed completion history: one bytearray row per habit per year, bit d = day-of-year d.
+
+    With a `loader` (year -> list[bytearray]), years listed in `known_years` stay on disk until first touched.
+    Deleting or re-inserting a habit only rewrites loaded years: an unloaded year queues the edit in `pending`
+    and applies it when loaded, unless `habit_loader` (habit index -> {year: packed row}) can read the habit's
+    rows directly from a backend whose loader already reflects every logged edit."""
+
+    versions = itertools.count(1)  # shared by every store, so one that replaces another never repeats a version
+
+    def __init__(self, loader=None, known_years=(), pending=None, habit_loader=None):
+        self._years = {}  # int year -> list[bytearray]
+        self.loader = loader; self.known_years = set(known_years); self.habit_loader = habit_loader
+        self.pending = {int(y): [list(op) for op in ops] for y, ops in (pending or {}).items()}  # year -> ["pop", idx] / ["insert", idx, hex or None]
+        self.detached = {}  # year -> rows taken out by queued pops when the year loaded, newest last
+        self.version = next(self.versions)  # renewed on every change, used as a cache key by derived data
+        self.dirty = set()  # years changed since the last take_dirty()
+
+    @staticmethod
+    def days_in(year): return 366 if calendar.isleap(year) else 365
+
+    @staticmethod
+    def row_size(year): return (HistoryStore.days_in(year) + 7) // 8
+
+    def __contains__(self, year): return int(year) in self._years or int(year) in self.known_years
+    def years(self): return sorted(set(self._years) | self.known_years)
+    def is_loaded(self, year): return year in self._years
+    def row_count(self, year): return len(self._years.get(year, ()))
+
+    def _load(self, year):
+        if year not in self._years and self.loader and year in self.known_years:
+            rows = self._years[year] = self.loader(year) or []
+            for op, idx, *row in self.pending.pop(year, ()):
+                if op == "pop": self.detached.setdefault(year, []).append(rows.pop(idx) if idx < len(rows) else None)
+                elif row and row[0]: rows.extend(bytearray(self.row_size(year)) for _ in range(idx - len(rows))); rows.insert(idx, bytearray.fromhex(row[0]))
+                else: rows.insert(min(idx, len(rows)), bytearray(self.row_size(year)))
+                self.dirty.add(year)  # the file on disk predates the queued edits
+
+    def load_all(self):
+        for year in self.known_years: self._load(year)
+
+    def ensure(self, year, n_rows):
+        """Creates the year if needed and pads/trims it to exactly n_rows habit rows."""
+        self._load(year)
+        rows = self._years.setdefault(year, [])
+        if len(rows) < n_rows:
+            size = self.row_size(year)
+            rows.extend(bytearray(size) for _ in range(n_rows - len(rows))); self.version = next(self.versions); self.dirty.add(year)
+        elif len(rows) > n_rows:
+            del rows[n_rows:]; self.version = next(self.versions); self.dirty.add(year)
+
+    # --- Cell access ---
+    def get(self, year, habit, day):
+        return (self._years[year][habit][day >> 3] >> (day & 7)) & 1
+
+    def set(self, year, habit, day, val):
+        row = self._years[year][habit]
+        if val: row[day >> 3] |= 1 << (day & 7)
+        else: row[day >> 3] &= ~(1 << (day & 7)) & 0xFF
+        self.version = next(self.versions); self.dirty.add(year)
+
+    def write_mask(self, year, habit, mask, mode):
+        """Sets ("fill"), clears ("clear") or flips ("invert") the days whose bits are set in `mask`, in one
+        pass over the row; returns the mask of days that actually changed."""
+        row = self._years[year][habit]; old = int.from_bytes(row, "little")
+        new = old | mask if mode == "fill" else old & ~mask if mode == "clear" else old ^ mask
+        if new != old: row[:] = new.to_bytes(len(row), "little"); self.version = next(self.versions); self.dirty.add(year)
+        return old ^ new
+
+    def _bits(self, year, habit, start=0, stop=None):
+        """Returns the row as an int holding days [start, stop) in its low bits."""
+        stop = self.days_in(year) if stop is None else stop
+        bits = int.from_bytes(self._years[year][habit], "little") >> start
+        return bits & ((1 << max(stop - start, 0)) - 1)
+
+    def range(self, year, habit, start=0, stop=None):
+        stop = self.days_in(year) if stop is None else stop
+        bits = self._bits(year, habit, start, stop)
+        return [(bits >> i) & 1 for i in range(stop - start)]
+
+    def packed_row(self, year, habit): return bytes(self._years[year][habit])
+
+    @staticmethod
+    def _iter_bits(row):
+        bits = row if isinstance(row, int) else int.from_bytes(row, "little")
+        while bits:
+            low = bits & -bits; yield low.bit_length() - 1; bits ^= low
+
+    # --- Aggregates ---
+    def popcount(self, year, habit=None, start=0, stop=None):
+        """Completed cells in [start, stop) for one habit, or for every habit when habit is None."""
+        habits = range(self.row_count(year)) if habit is None else (habit,)
+        return sum(self._bits(year, h, start, stop).bit_count() for h in habits)
+
+    # --- Structural changes ---
+    def pop_habit(self, idx):
+        """Removes a habit from every year and returns its packed rows keyed by year; a year that is not
+        loaded maps to None (the removal is queued) unless habit_loader can read its row."""
+        self.version = next(self.versions); self.dirty.update(self._years)
+        popped = {y: rows.pop(idx) for y, rows in self._years.items() if idx < len(rows)}
+        unloaded = self.known_years.difference(self._years)
+        if unloaded and self.habit_loader:
+            popped.update((y, row) for y, row in self.habit_loader(idx).items() if y in unloaded)
+        else:
+            for y in unloaded: self.pending.setdefault(y, []).append(["pop", idx]); popped[y] = None
+        return popped
+
+    def insert_habit(self, idx, packed_rows=None):
+        """Inserts a habit row into every loaded year (from `packed_rows` where given, else zeros). A None row
+        takes back what pop_habit queued or detached for that year. Returns the rows actually placed."""
+        packed_rows = packed_rows or {}; self.version = next(self.versions); self.dirty.update(self._years); placed = {}
+        for y, rows in self._years.items():
+            row = packed_rows.get(y)
+            if y in packed_rows and row is None: row = (self.detached.get(y) or [None]).pop()
+            if row is not None: rows.extend(bytearray(self.row_size(y)) for _ in range(idx - len(rows)))  # a short year keeps the row at its index
+            at = min(idx, len(rows)); rows.insert(at, bytearray(row) if row is not None else bytearray(self.row_size(y)))
+            if y in packed_rows: placed[y] = bytes(rows[at])
+        for y in self.known_years.difference(self._years).intersection(packed_rows):
+            placed[y] = row = packed_rows[y]
+            if self.habit_loader: continue  # the backend writes the row itself
+            queue = self.pending.setdefault(y, [])
+            if row is None and queue and queue[-1] == ["pop", idx]: queue.pop()
+            else: queue.append(["insert", idx, bytes(row).hex() if row is not None else None])
+        return placed
+
+    def take_dirty(self):
+        """Returns the years changed since the previous call and starts tracking afresh."""
+        dirty, self.dirty = self.dirty, set()
+        return dirty
+
+    def to_array(self, year):
+        """Unpacks a year into a habits x days uint8 matrix."""
+        rows = self._years[year]; days = self.days_in(year)
+        if not rows: return np.zeros((0, days), dtype=np.uint8)
+        packed = np.frombuffer(b"".join(rows), dtype=np.uint8).reshape(len(rows), self.row_size(year))
+        return np.unpackbits(packed, axis=1, bitorder="little")[:, :days]
+
+    def year_array(self, year, n_rows):
+        """to_array() padded or trimmed to n_rows, leaving the store untouched (a missing year reads as zeros)."""
+        self._load(year); m = np.zeros((n_rows, self.days_in(year)), dtype=np.uint8)
+        if self._years.get(year): rows = self.to_array(year)[:n_rows]; m[:len(rows)] = rows
+        return m
+
+    def put_array(self, year, m):
+        """Replaces a whole year with a habits x days 0/1 matrix."""
+        self._years[year] = [bytearray(row) for row in np.packbits(m, axis=1, bitorder="little")]; self.version = next(self.versions); self.dirty.add(year)
+
+    def copy(self, years=None):
+        """Fully materialized, detached copy (safe to hand to another thread), optionally of `years` only."""
+        if years is None: self.load_all(); years = self._years
+        else:
+            for y in years: self._load(y)
+        clone = HistoryStore()
+        clone._years = {y: [bytearray(row) for row in self._years[y]] for y in years if y in self._years}
+        return clone
+
+    # --- JSON layout ({"2026": [[0, 1, ...], ...]}) ---
+    def to_json(self):
+        self.load_all()
+        return {str(y): [self.range(y, h) for h in range(len(rows))] for y, rows in sorted(self._years.items())}
+
+    @classmethod
+    def from_json(cls, history):
+        store = cls()
+        for y_str, year_rows in (history or {}).items():
+            year = int(y_str); days = cls.days_in(year); packed = []
+            for values in year_rows:
+                row = bytearray(cls.row_size(year))
+                for d, v in enumerate(values[:days]):
+                    if v: row[d >> 3] |= 1 << (d & 7)
+                packed.append(row)
+            store._years[year] = packed
+        return store
+
+# --- STATS ENGINE ---
+class StatsEngine:
+    """Computes the KPI cards from habits x days matrices, one per year touched.
+
+    Per-day sums are vectorized; the few remaining averages are reduced with Python's
+    sequential float sum so results match the old per-day loop digit for digit."""
+
+    def __init__(self, history, n_habits):
+        self.history = history; self.n = n_habits; self._matrices = {}
+        self._series_cache = {}  # (year, habit_idx, history.version) -> chart series
+
+    def matrix(self, year):
+        if year not in self._matrices: self._matrices[year] = self.history.year_array(year, self.n)  # padded locally, so reading never dirties the store
+        return self._matrices[year]
+
+    def daily_values(self, year, habit_idx=None):
+        """Per-day score: fraction of habits done, or the selected habit's 0/1 row."""
+        m = self.matrix(year)
+        if habit_idx is not None: return m[habit_idx]
+        return m.sum(axis=0) / self.n if self.n else np.zeros(m.shape[1])
+
+    def span_values(self, first, last, habit_idx=None):
+        """Per-day scores from `first` to `last` inclusive, crossing year boundaries if needed."""
+        vals = []
+        for year in range(first.year, last.year + 1):
+            start = CalendarIndex.day_of(first) if year == first.year else 0
+            stop = CalendarIndex.day_of(last) + 1 if year == last.year else HistoryStore.days_in(year)
+            vals.extend(self.daily_values(year, habit_idx)[start:stop].tolist())
+        return vals
+
+    @staticmethod
+    def run_edges(mask):
+        """Start (inclusive) and end (exclusive) indices of every run of True values."""
+        edges = np.diff(np.concatenate(([0], mask.astype(np.int8), [0])))
+        return np.flatnonzero(edges == 1), np.flatnonzero(edges == -1)
+
+    @staticmethod
+    def longest_run(mask):
+        if not mask.any(): return 0
+        starts, ends = StatsEngine.run_edges(mask)
+        return int((ends - starts).max())
+
+    def done_mask(self, year, habit_idx=None):
+        """Days where the habit was done, or where every habit was done."""
+        m = self.matrix(year)
+        return m.all(axis=0) if habit_idx is None else m[habit_idx].astype(bool)
+
+    def total(self, year, habit_idx=None):
+        m = self.matrix(year)
+        return int(m.sum()) if habit_idx is None else int(m[habit_idx].sum())
+
+    def best_streak(self, year, habit_idx, limit):
+        """Longest completed run within the first `limit` days of the year."""
+        return self.longest_run(self.done_mask(year, habit_idx)[:limit])
+
+    def average(self, first, last, habit_idx=None):
+        vals = self.span_values(first, last, habit_idx)
+        return sum(vals) / len(vals)
+
+    def chart_series(self, year, habit_idx=None):
+        """Daily completion % for the year plus the 12 monthly means, summed per month with reduceat.
+
+        Cached per (year, habit filter, data version) so theme toggles and repeated redraws are free."""
+        key = (year, habit_idx, self.history.version)
+        series = self._series_cache.get(key)
+        if series is None:
+            cal = CalendarIndex.of(year); daily = self.daily_values(year, habit_idx) * 100.0
+            if len(self._series_cache) >= 32: self._series_cache.clear()
+            series = self._series_cache[key] = {"daily": daily, "monthly": np.add.reduceat(daily, cal.month_starts) / cal.month_lengths, "month_starts": cal.month_starts}
+        return series
+
+    def span_matrix(self, first, last):
+        """habits x days matrix from `first` to `last` inclusive, crossing year boundaries if needed."""
+        parts = []
+        for year in range(first.year, last.year + 1):
+            start = CalendarIndex.day_of(first) if year == first.year else 0
+            stop = CalendarIndex.day_of(last) + 1 if year == last.year else HistoryStore.days_in(year)
+            parts.append(self.matrix(year)[:, start:stop])
+        return np.concatenate(parts, axis=1)
+
+    @staticmethod
+    def longest_runs(m):
+        """Longest run of ones in each row of a 0/1 matrix; a zero pad column keeps runs from wrapping rows."""
+        rows, days = m.shape; padded = np.zeros((rows, days + 1), dtype=bool); padded[:, :days] = m
+        starts, ends = StatsEngine.run_edges(padded.ravel())
+        best = np.zeros(rows, dtype=np.int64); np.maximum.at(best, starts // (days + 1), ends - starts)
+        return best
+
+    @staticmethod
+    def ref_date(view_year, view_month, today):
+        # ref_date follows the UI navigation for Monthly, Total and Streak; Today and Weekly stay on the real date
+        if view_year == today.year and view_month == today.month: return today
+        return datetime.date(view_year, view_month, CalendarIndex.of(view_year).month_lengths[view_month - 1])
+
+    def stats(self, habit_idx, view_year, view_month, today=None):
+        if self.n == 0: return {}
+        today = today or datetime.date.today(); ref_date = self.ref_date(view_year, view_month, today)
+
+        today_score = self.span_values(today, today, habit_idx)[0]
+        weekly_avg = self.average(today - datetime.timedelta(days=today.weekday()), today, habit_idx)
+        monthly_avg = self.average(datetime.date(view_year, view_month, 1), ref_date, habit_idx)
+        streak = self.best_streak(view_year, habit_idx, CalendarIndex.day_of(ref_date) + 1)
+        return {
+            "today": f"{int(today_score * 100)}%",                # Always real-world today
+            "streak": f"{streak} Days",                           # Context-aware best streak
+            "weekly": f"{int(weekly_avg * 100)}%",                # Always real-world week
+            "monthly": f"{int(monthly_avg * 100)}%",              # Context-aware month avg
+            "total": str(self.total(view_year, habit_idx))        # Context-aware year total
+        }
+
+    @staticmethod
+    def trailing_runs(m):
+        """Run of ones ending at the last column, per row of a 0/1 matrix."""
+        missed = m[:, ::-1] == 0
+        return np.where(missed.any(axis=1), missed.argmax(axis=1), m.shape[1])
+
+    def leaderboard(self, view_year, view_month, today=None):
+        """Every habit's KPIs as numeric arrays (today 0/1, weekly and monthly rates, year total, best and
+        current streak up to the reference date), from whole-matrix reductions instead of one call per habit."""
+        today = today or datetime.date.today(); ref_date = self.ref_date(view_year, view_month, today)
+        m = self.matrix(view_year); upto = m[:, :CalendarIndex.day_of(ref_date) + 1]
+        return {"today": self.span_matrix(today, today)[:, 0],
+                "weekly": self.span_matrix(today - datetime.timedelta(days=today.weekday()), today).mean(axis=1),
+                "monthly": self.span_matrix(datetime.date(view_year, view_month, 1), ref_date).mean(axis=1),
+                "total": m.sum(axis=1), "best": self.longest_runs(upto), "current": self.trailing_runs(upto)}
+
+    def habit_stats(self, view_year, view_month, today=None):
+        """stats(h, ...) for every habit h, formatted from leaderboard()."""
+        if self.n == 0: return []
+        b = self.leaderboard(view_year, view_month, today)
+        return [{"today": f"{int(b['today'][h]) * 100}%", "streak": f"{b['best'][h]} Days", "weekly": f"{int(b['weekly'][h] * 100)}%",
+                 "monthly": f"{int(b['monthly'][h] * 100)}%", "total": str(b['total'][h])} for h in range(self.n)]
+
+    def habit_series(self, year):
+        """chart_series() data for every habit at once: habits x days daily % and habits x 12 monthly means."""
+        cal = CalendarIndex.of(year); daily = self.matrix(year) * 100.0
+        return daily, np.add.reduceat(daily, cal.month_starts, axis=1) / cal.month_lengths
+
+class KpiAggregates(StatsEngine):
+    """StatsEngine whose per-year state is kept in sync cell by cell.
+
+    Holds per-day completion counts, per-habit and global year totals, per-habit month sums
+    and the completed-day runs, all patched in O(1) by apply_toggle (a split or merge of the one
+    affected run). insert_habit/remove_habit shift one row in or out of the cached years; only a
+    restore or import needs a fresh instance."""
+
+    def __init__(self, history, n_habits):
+        super().__init__(history, n_habits)
+        self._aggs = {}  # year -> {"counts", "habit_totals", "total", "month_sums", "month_starts"}
+        self._runs = {}  # (year, habit_idx or None) -> [starts, ends, lengths]
+
+    def _agg(self, year):
+        agg = self._aggs.get(year)
+        if agg is None:
+            m = self.matrix(year)
+            month_starts = CalendarIndex.of(year).month_starts
+            habit_totals = m.sum(axis=1, dtype=np.int64)
+            agg = self._aggs[year] = {"counts": m.sum(axis=0, dtype=np.int32), "habit_totals": habit_totals, "total": int(habit_totals.sum()),
+                                      "month_sums": np.add.reduceat(m, month_starts, axis=1, dtype=np.int32), "month_starts": month_starts}
+        return agg
+
+    def _run_index(self, year, habit_idx):
+        runs = self._runs.get((year, habit_idx))
+        if runs is None:
+            starts, ends = self.run_edges(self.done_mask(year, habit_idx))
+            runs = self._runs[(year, habit_idx)] = [starts.tolist(), ends.tolist(), (ends - starts).tolist()]
+        return runs
+
+    def _set_run_day(self, year, habit_idx, day, done):
+        """Merges `day` into its neighbouring runs, or splits the run holding it."""
+        runs = self._runs.get((year, habit_idx))
+        if runs is None: return
+        starts, ends, lengths = runs
+        i = bisect.bisect_right(starts, day) - 1  # last run starting at or before day
+        if done:
+            joins_left = i >= 0 and ends[i] == day
+            joins_right = i + 1 < len(starts) and starts[i + 1] == day + 1
+            if joins_left and joins_right:
+                ends[i] = ends[i + 1]; del starts[i + 1], ends[i + 1], lengths[i + 1]
+            elif joins_left: ends[i] = day + 1
+            elif joins_right: i += 1; starts[i] = day
+            else: i += 1; starts.insert(i, day); ends.insert(i, day + 1); lengths.insert(i, 1); return
+            lengths[i] = ends[i] - starts[i]
+        else:
+            pieces = [(a, b) for a, b in ((starts[i], day), (day + 1, ends[i])) if b > a]
+            starts[i:i + 1] = [a for a, _ in pieces]; ends[i:i + 1] = [b for _, b in pieces]; lengths[i:i + 1] = [b - a for a, b in pieces]
+
+    def apply_toggle(self, year, habit_idx, day, val):
+        """Folds one changed cell into every cached aggregate for its year."""
+        m = self._matrices.get(year)
+        if m is None or m[habit_idx, day] == val: return  # not cached yet: built fresh from the store when needed
+        agg = self._agg(year); delta = 1 if val else -1
+        m[habit_idx, day] = val
+        was_full = agg["counts"][day] == self.n
+        agg["counts"][day] += delta; agg["habit_totals"][habit_idx] += delta; agg["total"] += delta
+        agg["month_sums"][habit_idx, bisect.bisect_right(agg["month_starts"], day) - 1] += delta
+        if was_full != (agg["counts"][day] == self.n): self._set_run_day(year, None, day, bool(val))
+        self._set_run_day(year, habit_idx, day, bool(val))
+
+    def remove_habit(self, habit_idx):
+        """Takes a habit's row out of every cached year (after HistoryStore.pop_habit)."""
+        self.n -= 1
+        for year, m in self._matrices.items():
+            row = m[habit_idx]; self._matrices[year] = np.delete(m, habit_idx, axis=0)
+            agg = self._aggs.get(year)
+            if agg is None: continue
+            agg["counts"] -= row; agg["total"] -= int(agg["habit_totals"][habit_idx])
+            agg["habit_totals"] = np.delete(agg["habit_totals"], habit_idx); agg["month_sums"] = np.delete(agg["month_sums"], habit_idx, axis=0)
+        self._shift_runs(habit_idx, -1)
+
+    def insert_habit(self, habit_idx):
+        """Adds the habit's row, as now stored in the history, to every cached year (after HistoryStore.insert_habit)."""
+        self.n += 1
+        for year, m in self._matrices.items():
+            if habit_idx < self.history.row_count(year): row = np.unpackbits(np.frombuffer(self.history.packed_row(year, habit_idx), dtype=np.uint8), bitorder="little")[:m.shape[1]]
+            else: row = np.zeros(m.shape[1], dtype=np.uint8)  # the store pads short years lazily, with zeros
+            self._matrices[year] = np.insert(m, habit_idx, row, axis=0)
+            agg = self._aggs.get(year)
+            if agg is None: continue
+            agg["counts"] += row; agg["total"] += int(row.sum())
+            agg["habit_totals"] = np.insert(agg["habit_totals"], habit_idx, row.sum())
+            agg["month_sums"] = np.insert(agg["month_sums"], habit_idx, np.add.reduceat(row, agg["month_starts"], dtype=np.int32), axis=0)
+        self._shift_runs(habit_idx, 1)
+
+    def _shift_runs(self, habit_idx, step):
+        """Renumbers the per-habit run indexes past habit_idx; the all-habits runs are rebuilt on demand."""
+        self._runs = {(y, h if h < habit_idx else h + step): runs for (y, h), runs in self._runs.items()
+                      if h is not None and (step > 0 or h != habit_idx)}
+
+    # --- StatsEngine lookups served from the aggregates ---
+    def done_mask(self, year, habit_idx=None):
+        if habit_idx is None: return self._agg(year)["counts"] == self.n
+        return super().done_mask(year, habit_idx)
+
+    def daily_values(self, year, habit_idx=None):
+        if habit_idx is not None: return self.matrix(year)[habit_idx]
+        counts = self._agg(year)["counts"]
+        return counts / self.n if self.n else np.zeros(len(counts))
+
+    def total(self, year, habit_idx=None):
+        agg = self._agg(year)
+        return agg["total"] if habit_idx is None else int(agg["habit_totals"][habit_idx])
+
+    def best_streak(self, year, habit_idx, limit):
+        starts, ends, lengths = self._run_index(year, habit_idx)
+        k = bisect.bisect_right(ends, limit)  # runs finished within the limit
+        best = max(lengths[:k], default=0)
+        if k < len(starts) and starts[k] < limit: best = max(best, limit - starts[k])
+        return best
+
+    def average(self, first, last, habit_idx=None):
+        # A whole month of one habit is a single month-sum lookup (0/1 values, so the result is exact)
+        if habit_idx is not None and first.year == last.year and first.day == 1 and first.month == last.month \
+                and last.day == CalendarIndex.of(last.year).month_lengths[last.month - 1]:
+            return int(self._agg(first.year)["month_sums"][habit_idx, first.month - 1]) / last.day
+        return super().average(first, last, habit_idx)
+
+# --- CHANGE JOURNAL ---
+class ChangeJournal:
+    """Append-only JSON-lines log of edits made since the last full snapshot of DATA_FILE.
+
+    Every record carries a sequence number; the snapshot stores the last sequence it
+    already contains, so records at or below it are skipped on replay."""
+
+    def __init__(self, path):
+        self.path = path; self.seq = 0; self.bytes = 0; self._fh = None
+
+    def read(self, after_seq=0):
+        records = []
+        if not os.path.exists(self.path): return records
+        with open(self.path, "r") as f:
+            for line in f:
+                try: rec = json.loads(line)
+                except json.JSONDecodeError: break  # torn final line from a crash mid-append
+                if rec.get("seq", 0) > after_seq: records.append(rec)
+        self.bytes = os.path.getsize(self.path)
+        return records
+
+    def append(self, op, **fields):
+        self.seq += 1
+        line = json.dumps({"seq": self.seq, "op": op, **fields}, separators=(",", ":")) + "\n"
+        if self._fh is None: self._fh = open(self.path, "a")
+        self._fh.write(line); self._fh.flush()
+        self.bytes += len(line)
+
+    def truncate_through(self, seq):
+        """Drops records already folded into a committed snapshot, keeping anything logged since.
+
+        The survivors go to a temp file that is fsynced and renamed over the journal, so a crash midway
+        leaves the old journal (whose extra records replay as no-ops) rather than a truncated one."""
+        self.close()
+        keep = self.read(seq); tmp_path = self.path + ".tmp"
+        try:
+            with open(tmp_path, "w") as f:
+                for rec in keep: f.write(json.dumps(rec, separators=(",", ":")) + "\n")
+                f.flush(); os.fsync(f.fileno())
+            os.replace(tmp_path, self.path)
+        except OSError:
+            if os.path.exists(tmp_path): os.remove(tmp_path)
+            return # The full journal stays in place; the next snapshot retries
+        self.bytes = os.path.getsize(self.path)
+
+    def close(self):
+        if self._fh is not None: self._fh.close(); self._fh = None
+
+class SnapshotWriter(QObject):
+    """Writes full DATA_FILE snapshots on a worker thread.
+
+    Submissions within SAVE_COALESCE_MS collapse into one write of the newest snapshot, which is
+    serialized off the UI thread and committed through a temp file, fsync and an atomic rename."""
+    saved = Signal(int)  # journal_seq of the snapshot now on disk
+
+    def __init__(self, path, delay_ms=SAVE_COALESCE_MS):
+        super().__init__()
+        self.path = path; self.delay = delay_ms / 1000; self.last_error = None
+        self._cond = threading.Condition(); self._pending = None; self._busy = False; self._flushing = False; self._closed = False
+        self._carry = None  # a snapshot whose write failed, folded into the next one
+        self._thread = threading.Thread(target=self._run, name="SnapshotWriter", daemon=True); self._thread.start()
+
+    @property
+    def pending(self):
+        with self._cond: return self._pending is not None or self._busy
+
+    def submit(self, snapshot):
+        """Queues a snapshot dict; its "history" may be a HistoryStore copy, packed rows are expanded on the worker."""
+        with self._cond:
+            if self._carry is not None: snapshot = self._merge(self._carry, snapshot); self._carry = None
+            if self._closed: self._commit(snapshot); return  # late save after close(): write inline
+            if self._pending is not None: snapshot = self._merge(self._pending, snapshot)
+            self._pending = snapshot; self._cond.notify_all()
+
+    def flush(self):
+        """Blocks until every submitted snapshot is on disk."""
+        with self._cond:
+            if self._carry is not None and self._pending is None: self._pending, self._carry = self._carry, None  # retry a failed write
+            self._flushing = True; self._cond.notify_all()
+            while self._pending is not None or self._busy: self._cond.wait()
+            self._flushing = False
+
+    def close(self):
+        self.flush()
+        with self._cond: self._closed = True; self._cond.notify_all()
+        self._thread.join()
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while self._pending is None and not self._closed: self._cond.wait()
+                if self._pending is None: return
+                # Let a burst of requests settle so only the newest snapshot gets written
+                deadline = time.monotonic() + self.delay
+                while not (self._flushing or self._closed) and deadline > time.monotonic(): self._cond.wait(deadline - time.monotonic())
+                snapshot, self._pending = self._pending, None; self._busy = True
+            try:
+                self._commit(snapshot); self.last_error = None
+                self.saved.emit(snapshot.get("journal_seq", 0))
+            except Exception as e:  # not only OSError: a serialization error must not end the thread flush() waits on
+                self.last_error = e
+                with self._cond:
+                    if self._pending is not None: self._pending = self._merge(snapshot, self._pending)
+                    else: self._carry = snapshot
+            finally:
+                with self._cond: self._busy = False; self._cond.notify_all()
+
+    def _merge(self, older, newer):
+        """Combines two queued snapshots; a full snapshot supersedes the older one."""
+        return newer
+
+    def _commit(self, snapshot): write_json_atomic(self.path, snapshot)
+
+class ShardWriter(SnapshotWriter):
+    """SnapshotWriter for ShardedStorage: writes the changed year files, then the manifest that names them,
+    then removes shard files no manifest refers to any more."""
+
+    def _merge(self, older, newer): return {**newer, "shards": {**older["shards"], **newer["shards"]}}
+
+    def _commit(self, snapshot):
+        for name, (year, rows) in snapshot["shards"].items():
+            write_json_atomic(os.path.join(self.path, name), {"year": year, "rows": [row.hex() for row in rows]})
+        write_json_atomic(os.path.join(self.path, MANIFEST_FILE), snapshot["manifest"])
+        live = set(snapshot["manifest"]["files"].values())
+        for name in os.listdir(self.path):
+            if name.startswith("history-") and name not in live: os.remove(os.path.join(self.path, name))
+
+def write_json_atomic(path, snapshot):
+    """Serializes a snapshot dict (expanding a packed HistoryStore) via temp file + fsync + rename."""
+    if isinstance(snapshot.get("history"), HistoryStore): snapshot = {**snapshot, "history": snapshot["history"].to_json()}
+    payload = json.dumps(snapshot)
+    tmp_path = path + ".tmp"
+    try:
+        with open(tmp_path, "w") as f: f.write(payload); f.flush(); os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except OSError:
+        if os.path.exists(tmp_path): os.remove(tmp_path)
+        raise
+
+def apply_change(state, rec):
+    """Replays one journal record onto a state dict with names/times/history/theme keys."""
+    names, times, history = state["names"], state["times"], state["history"]
+    op = rec["op"]
+    if op == "toggle":
+        history.ensure(rec["y"], len(names)); history.set(rec["y"], rec["h"], rec["d"], rec["v"])
+    elif op == "cells":
+        history.ensure(rec["y"], len(names))
+        for h, d, v in rec["cells"]: history.set(rec["y"], h, d, v)
+    elif op == "add":
+        names.append(rec["name"]); times.append(rec["time"])
+    elif op == "edit":
+        names[rec["h"]] = rec["name"]; times[rec["h"]] = rec["time"]
+    elif op == "delete":
+        names.pop(rec["h"]); times.pop(rec["h"]); history.pop_habit(rec["h"])
+    elif op == "insert":
+        idx = min(rec["h"], len(names))
+        names.insert(idx, rec["name"]); times.insert(idx, rec["time"])
+        history.insert_habit(idx, {int(y): bytes.fromhex(row) if row is not None else None for y, row in rec["rows"].items()})
+    elif op == "theme":
+        state["theme"] = rec["v"]
+
+# --- STORAGE BACKENDS ---
+def read_json_state(path, journal=None):
+    """Parses a DATA_FILE snapshot (current or legacy "data" layout) and replays `journal` on top of it."""
+    state = {"names": [], "times": [], "theme": False, "window_geometry": None, "window_maximized": False}
+    history = {}; snapshot_seq = 0
+    if os.path.exists(path):
+        try:
+            with open(path, "r") as f: 
+                d = json.load(f)
+                state["names"] = d.get("names", DEFAULT_HABITS.copy())
+                state["times"] = d.get("times", [])
+                state["theme"] = d.get("theme", False)
+                state["window_geometry"] = d.get("window_geometry")
+                state["window_maximized"] = d.get("window_maximized", False)
+                raw_data = d.get("data", [])
+                if raw_data and isinstance(raw_data[0], list): history = {"2026": raw_data}
+                else: history = d.get("history", {})
+                snapshot_seq = d.get("journal_seq", 0)
+        except: pass
+    try: state["history"] = HistoryStore.from_json(history)
+    except (TypeError, ValueError): state["history"] = HistoryStore()
+    if not state["names"]: state["names"] = DEFAULT_HABITS.copy()
+    while len(state["times"]) < len(state["names"]): state["times"].append("Any Time")
+
+    if journal is not None: replay_journal(state, journal, snapshot_seq)
+    return state
+
+def replay_journal(state, journal, after_seq):
+    """Applies edits logged after the snapshot (which already holds everything through `after_seq`)."""
+    journal.seq = after_seq
+    for rec in journal.read(after_seq):
+        try: apply_change(state, rec)
+        except (KeyError, IndexError, TypeError, ValueError): continue
+        journal.seq = rec["seq"]
+
+class Storage(abc.ABC):
+    """Persistence backend used by HabitApp (see open_storage)."""
+    @abc.abstractmethod
+    def load(self):
+        """Returns a state dict: names, times, history (HistoryStore), theme, window_geometry, window_maximized."""
+    @abc.abstractmethod
+    def log(self, op, **fields):
+        """Persists one edit (same records as ChangeJournal); returns True when a full save() is due."""
+    @abc.abstractmethod
+    def save(self, state, full=False):
+        """Writes settings, or the whole dataset when `full` (e.g. after a restore swapped everything)."""
+    def flush(self): pass
+    def close(self): pass
+
+class JsonStorage(Storage):
+    """DATA_FILE snapshot plus append-only change journal; snapshots go through SnapshotWriter."""
+
+    def __init__(self, path=DATA_FILE, journal_path=JOURNAL_FILE):
+        self.path = path; self.journal = ChangeJournal(journal_path)
+        self.writer = SnapshotWriter(path); self.writer.saved.connect(self.journal.truncate_through, Qt.QueuedConnection)
+
+    def load(self): return read_json_state(self.path, self.journal)
+
+    def log(self, op, **fields):
+        self.journal.append(op, **fields)
+        return self.journal.bytes > JOURNAL_COMPACT_BYTES and not self.writer.pending
+
+    def save(self, state, full=False):
+        self.writer.submit({**state, "names": list(state["names"]), "times": list(state["times"]), "history": state["history"].copy(), "journal_seq": self.journal.seq})
+
+    def flush(self): self.writer.flush()
+
+    def close(self):
+        self.writer.close() # Blocks until the last snapshot is committed
+        if self.writer.last_error is None: self.journal.truncate_through(self.journal.seq)
+
+class ShardedStorage(JsonStorage):
+    """SHARD_DIR: a small manifest (names, times, settings, file per year) plus one packed file per year.
+
+    Years are read the first time something touches them, and a snapshot rewrites only the years
+    changed since the previous one. Shard files are never overwritten: each write uses a new
+    generation name and the manifest is replaced last, so it always names a complete set."""
+
+    def __init__(self, root=SHARD_DIR, migrate_from=DATA_FILE):
+        os.makedirs(root, exist_ok=True)
+        self.root = root; self.migrate_from = migrate_from; self.files = {}; self.generation = 0  # year -> shard file name
+        self.journal = ChangeJournal(os.path.join(root, "journal.jsonl"))
+        self.writer = ShardWriter(root); self.writer.saved.connect(self.journal.truncate_through, Qt.QueuedConnection)
+
+    def load(self):
+        manifest_path = os.path.join(self.root, MANIFEST_FILE)
+        if not os.path.exists(manifest_path):
+            # One-shot import of the JSON snapshot + journal (legacy "data" layout included)
+            state = read_json_state(self.migrate_from, ChangeJournal(self.migrate_from + ".journal"))
+            self.save(state, full=True); self.writer.flush()
+            return state
+        with open(manifest_path, "r") as f: m = json.load(f)
+        self.files = {int(y): name for y, name in m.get("files", {}).items()}; self.generation = m.get("generation", 0)
+        state = {"names": m.get("names") or DEFAULT_HABITS.copy(), "times": m.get("times", []), "theme": m.get("theme", False),
+                 "window_geometry": m.get("window_geometry"), "window_maximized": m.get("window_maximized", False),
+                 "history": HistoryStore(loader=self._load_year, known_years=self.files, pending=m.get("pending"))}
+        while len(state["times"]) < len(state["names"]): state["times"].append("Any Time")
+        replay_journal(state, self.journal, m.get("journal_seq", 0))
+        return state
+
+    def _load_year(self, year):
+        with open(os.path.join(self.root, self.files[year]), "r") as f: return [bytearray.fromhex(row) for row in json.load(f)["rows"]]
+
+    def save(self, state, full=False):
+        history = state["history"]
+        if full: history.load_all(); self.files = {}; history.take_dirty(); years = history.years()
+        else: years = history.take_dirty()
+        self.generation += 1; shards = {}
+        for y in years:
+            name = self.files[y] = f"history-{y}.{self.generation}.json"
+            shards[name] = (y, [history.packed_row(y, h) for h in range(history.row_count(y))])
+        manifest = {"names": list(state["names"]), "times": list(state["times"]), "theme": state["theme"],
+                    "window_geometry": state["window_geometry"], "window_maximized": state["window_maximized"],
+                    "files": {str(y): name for y, name in sorted(self.files.items())}, "generation": self.generation, "journal_seq": self.journal.seq,
+                    "pending": {str(y): [list(op) for op in ops] for y, ops in sorted(history.pending.items()) if ops}}  # habit deletes/inserts the shard files predate
+        self.writer.submit({"manifest": manifest, "shards": shards, "journal_seq": self.journal.seq})
+
+class SqliteStorage(Storage):
+    """Habits, completions indexed by (habit_id, date) and settings in a WAL-mode SQLite database.
+
+    Each edit is one small transaction, and history years are materialized lazily with a range
+    scan over the date index, so neither startup nor a click touches the whole dataset."""
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS habits (id INTEGER PRIMARY KEY, position INTEGER NOT NULL, name TEXT NOT NULL, time TEXT NOT NULL DEFAULT '');
+        CREATE TABLE IF NOT EXISTS completions (
+            habit_id INTEGER NOT NULL REFERENCES habits(id) ON DELETE CASCADE, date TEXT NOT NULL,
+            PRIMARY KEY (habit_id, date)) WITHOUT ROWID;
+        CREATE INDEX IF NOT EXISTS completions_by_date ON completions (date, habit_id);
+        CREATE TABLE IF NOT EXISTS settings (key TEXT PRIMARY KEY, value TEXT);
+    """
+
+    def __init__(self, path=SQLITE_FILE, migrate_from=DATA_FILE):
+        self.path = path; self.migrate_from = migrate_from; self._ids = []  # habit position -> habits.id
+        self.db = sqlite3.connect(path)
+        self.db.execute("PRAGMA journal_mode=WAL"); self.db.execute("PRAGMA synchronous=NORMAL"); self.db.execute("PRAGMA foreign_keys=ON")
+        self.db.executescript(self.SCHEMA)
+
+    @staticmethod
+    def _iso(year, day): return CalendarIndex.of(year).iso[day]
+
+    def _setting(self, key, default=None):
+        row = self.db.execute("SELECT value FROM settings WHERE key = ?", (key,)).fetchone()
+        return json.loads(row[0]) if row else default
+
+    def _set_settings(self, **values):
+        self.db.executemany("INSERT OR REPLACE INTO settings (key, value) VALUES (?, ?)", [(k, json.dumps(v)) for k, v in values.items()])
+
+    def _insert_habit(self, position, name, time_str):
+        return self.db.execute("INSERT INTO habits (position, name, time) VALUES (?, ?, ?)", (position, name, time_str)).lastrowid
+
+    def _insert_rows(self, hid, packed_rows):
+        self.db.executemany("INSERT OR IGNORE INTO completions (habit_id, date) VALUES (?, ?)",
+                            ((hid, self._iso(y, d)) for y, row in packed_rows.items() if row is not None for d in HistoryStore._iter_bits(row)))
+
+    def _write_all(self, state):
+        history = state["history"]; history.load_all() # Read lazily loaded years before their rows are deleted
+        self.db.execute("DELETE FROM completions"); self.db.execute("DELETE FROM habits")
+        self._ids = [self._insert_habit(i, n, t) for i, (n, t) in enumerate(zip(state["names"], state["times"]))]
+        for y in history.years():
+            for h in range(min(history.row_count(y), len(self._ids))): self._insert_rows(self._ids[h], {y: history.packed_row(y, h)})
+        self._set_settings(theme=state["theme"], window_geometry=state["window_geometry"], window_maximized=state["window_maximized"])
+
+    def load(self):
+        if self._setting("migrated_from") is None:
+            # One-shot import of the JSON snapshot + journal (legacy "data" layout included)
+            state = read_json_state(self.migrate_from, ChangeJournal(self.migrate_from + ".journal"))
+            with self.db: self._write_all(state); self._set_settings(migrated_from=self.migrate_from)
+        rows = self.db.execute("SELECT id, name, time FROM habits ORDER BY position").fetchall()
+        self._ids = [r[0] for r in rows]
+        first, last = self.db.execute("SELECT MIN(date), MAX(date) FROM completions").fetchone()
+        known_years = range(int(first[:4]), int(last[:4]) + 1) if first else ()
+        state = {"names": [r[1] for r in rows] or DEFAULT_HABITS.copy(), "times": [r[2] for r in rows], "theme": self._setting("theme", False),
+                 "window_geometry": self._setting("window_geometry"), "window_maximized": self._setting("window_maximized", False),
+                 "history": HistoryStore(loader=self._load_year, known_years=known_years, habit_loader=self.habit_rows)}
+        while len(state["times"]) < len(state["names"]): state["times"].append("Any Time")
+        if not rows:  # the defaults need habit ids before the first edit is logged against them
+            with self.db: self._ids = [self._insert_habit(i, n, t) for i, (n, t) in enumerate(zip(state["names"], state["times"]))]
+        return state
+
+    def load_days(self, start, days):
+        """Packed rows for a date window, read through completions_by_date; backs the lazy per-year loads."""
+        pos = {hid: i for i, hid in enumerate(self._ids)}; first = start.toordinal()
+        rows = [bytearray((days + 7) // 8) for _ in self._ids]
+        end = datetime.date.fromordinal(first + days)
+        for hid, iso in self.db.execute("SELECT habit_id, date FROM completions WHERE date >= ? AND date < ?", (start.isoformat(), end.isoformat())):
+            cal = CalendarIndex.of(int(iso[:4])); i = cal.jan1 + cal.day(int(iso[5:7]), int(iso[8:10])) - first
+            rows[pos[hid]][i >> 3] |= 1 << (i & 7)
+        return rows
+
+    def _load_year(self, year): return self.load_days(datetime.date(year, 1, 1), HistoryStore.days_in(year))
+
+    def habit_rows(self, position):
+        """One habit's packed rows for every year it has completions in, via the (habit_id, date) key."""
+        rows = {}
+        for (iso,) in self.db.execute("SELECT date FROM completions WHERE habit_id = ?", (self._ids[position],)):
+            year = int(iso[:4]); d = CalendarIndex.of(year).day(int(iso[5:7]), int(iso[8:10]))
+            row = rows.setdefault(year, bytearray(HistoryStore.row_size(year))); row[d >> 3] |= 1 << (d & 7)
+        return rows
+
+    def log(self, op, **f):
+        with self.db:
+            if op == "toggle":
+                args = (self._ids[f["h"]], self._iso(f["y"], f["d"]))
+                if f["v"]: self.db.execute("INSERT OR IGNORE INTO completions (habit_id, date) VALUES (?, ?)", args)
+                else: self.db.execute("DELETE FROM completions WHERE habit_id = ? AND date = ?", args)
+            elif op == "cells":
+                rows = [(v, (self._ids[h], self._iso(f["y"], d))) for h, d, v in f["cells"]]
+                self.db.executemany("INSERT OR IGNORE INTO completions (habit_id, date) VALUES (?, ?)", [a for v, a in rows if v])
+                self.db.executemany("DELETE FROM completions WHERE habit_id = ? AND date = ?", [a for v, a in rows if not v])
+            elif op == "add":
+                self._ids.append(self._insert_habit(len(self._ids), f["name"], f["time"]))
+            elif op == "edit":
+                self.db.execute("UPDATE habits SET name = ?, time = ? WHERE id = ?", (f["name"], f["time"], self._ids[f["h"]]))
+            elif op == "delete":
+                self.db.execute("DELETE FROM habits WHERE id = ?", (self._ids.pop(f["h"]),))
+                self.db.execute("UPDATE habits SET position = position - 1 WHERE position > ?", (f["h"],))
+            elif op == "insert":
+                idx = min(f["h"], len(self._ids))
+                self.db.execute("UPDATE habits SET position = position + 1 WHERE position >= ?", (idx,))
+                self._ids.insert(idx, self._insert_habit(idx, f["name"], f["time"]))
+                self._insert_rows(self._ids[idx], {int(y): bytes.fromhex(row) for y, row in f["rows"].items()})
+            elif op == "theme":
+                self._set_settings(theme=f["v"])
+        return False
+
+    def save(self, state, full=False):
+        with self.db:
+            if full: self._write_all(state)
+            else: self._set_settings(theme=state["theme"], window_geometry=state["window_geometry"], window_maximized=state["window_maximized"])
+
+    def close(self): self.db.close()
+
+def open_storage(backend=STORAGE_BACKEND):
+    if backend == "sqlite": return SqliteStorage(SQLITE_FILE, migrate_from=DATA_FILE)
+    if backend == "json": return JsonStorage(DATA_FILE, JOURNAL_FILE)
+    return ShardedStorage(SHARD_DIR, migrate_from=DATA_FILE)
+
+# --- EXPORT ---
+def csv_chunks(history, names, habits, first, last, long=False):
+    """Yields (rows, days covered) for the dates first..last, one month-sized chunk at a time.
+
+    `history` must be private to the caller (years are padded in place). Wide rows are
+    date + one Yes/No per habit in `habits`; long rows are (date, habit, done)."""
+    picked = [names[h] for h in habits]; labels = np.array(["No", "Yes"], dtype=object)
+    if long: yield [["date", "habit", "done"]], 0
+    else: yield [["--- HABIT DATA ---"], ["Date"] + picked], 0
+    for year in range(first.year, last.year + 1):
+        cal = CalendarIndex.of(year); history.ensure(year, len(names))
+        start = CalendarIndex.day_of(first) if year == first.year else 0
+        stop = CalendarIndex.day_of(last) + 1 if year == last.year else cal.days
+        matrix = history.to_array(year)[habits]
+        bounds = [start] + [s for s in cal.month_starts if start < s < stop] + [stop]
+        for a, b in zip(bounds, bounds[1:]):
+            days = zip(cal.iso[a:b], labels[matrix[:, a:b].T].tolist())
+            if long: yield [[iso, name, done] for iso, row in days for name, done in zip(picked, row)], b - a
+            else: yield [[iso] + row for iso, row in days], b - a
+
+def write_csv(path, history, names, habits, first, last, long=False, compress=False, progress=None, cancel=None):
+    """Streams csv_chunks() into `path` (gzip if `compress`) through a .part file renamed on success.
+
+    Returns False, leaving nothing behind, if the `cancel` event is set midway."""
+    total = last.toordinal() - first.toordinal() + 1; done = 0; tmp_path = path + ".part"
+    try:
+        with (gzip.open(tmp_path, "wt", newline="") if compress else open(tmp_path, "w", newline="", buffering=1 << 16)) as f:
+            writer = csv.writer(f)
+            for rows, days in csv_chunks(history, names, habits, first, last, long):
+                if cancel is not None and cancel.is_set(): break
+                writer.writerows(rows); done += days
+                if progress is not None and days: progress(done, total)
+        if cancel is not None and cancel.is_set(): os.remove(tmp_path); return False
+        os.replace(tmp_path, path); return True
+    except BaseException:
+        if os.path.exists(tmp_path): os.remove(tmp_path)
+        raise
+
+class TaskSignals(QObject):
+    """Signals for QRunnable jobs; emitted on the worker, delivered on the UI thread."""
+    progress = Signal(int, int)  # done, total
+    finished = Signal(object)  # result, or None when cancelled
+    failed = Signal(str)
+
+class PdfReport:
+    """Report pages drawn straight onto a reportlab canvas: text plus the two charts as vector paths, no images."""
+    MONTHS = [calendar.month_abbr[m] for m in range(1, 13)]
+
+    def __init__(self, path, year, theme):
+        from reportlab.lib import colors; from reportlab.lib.pagesizes import letter; from reportlab.pdfgen import canvas
+        self.c = canvas.Canvas(path, pagesize=letter); self.w, self.h = letter; self.year = year
+        self.colors = {k: colors.HexColor(theme[k]) for k in ("chart_bg", "chart_line", "chart_bar", "text_primary", "text_secondary", "border")}
+        fill = colors.HexColor(theme["chart_fill"]); self.colors["fill"] = colors.Color(fill.red, fill.green, fill.blue, alpha=0.15)
+
+    def add_page(self, subtitle, stats, series, chart_title):
+        c = self.c; h = self.h
+        c.setFillColorRGB(0, 0, 0); c.setFont("Helvetica-Bold", 24); c.drawString(50, h-50, f"Habit Report {self.year}")
+        c.setFont("Helvetica", 12); c.drawString(50, h-90, f"• Report: {subtitle}")
+        y_start = h - 120; c.drawString(50, y_start, f"• Today's Completion: {stats.get('today', 'N/A')}"); c.drawString(300, y_start, f"• Best Streak: {stats.get('streak', 'N/A')}")
+        y_start -= 25; c.drawString(50, y_start, f"• Weekly Average: {stats.get('weekly', 'N/A')}"); c.drawString(300, y_start, f"• Monthly Average: {stats.get('monthly', 'N/A')}")
+        y_start -= 25; c.drawString(50, y_start, f"• Total Completions: {stats.get('total', 'N/A')}")
+        if series is None: c.drawString(50, y_start - 50, "No habits yet, so there is nothing to chart.")
+        else:
+            self.annual_chart(50, h-400, 500, 190, series, chart_title)
+            self.monthly_chart(50, h-650, 500, 190, series, f"Success Rate by Month ({self.year})")
+        c.showPage()
+
+    def save(self): self.c.save()
+
+    def _axes(self, x, y, w, h, title, y_max, ylabel, left_spine=True):
+        """Background, title, y ticks and spines; returns the plot rectangle."""
+        c = self.c; col = self.colors; px, py, pw, ph = x + 45, y + 22, w - 60, h - 52
+        c.setFillColor(col["chart_bg"]); c.rect(x, y, w, h, stroke=0, fill=1)
+        c.setFillColor(col["text_primary"]); c.setFont("Helvetica-Bold", 10); c.drawCentredString(px + pw / 2, y + h - 20, title)
+        c.setFillColor(col["text_secondary"]); c.setFont("Helvetica", 7)
+        for t in range(0, 101, 20): c.drawRightString(px - 4, py + t * ph / y_max - 2, str(t))
+        c.saveState(); c.translate(x + 12, py + ph / 2); c.rotate(90); c.setFont("Helvetica", 8); c.drawCentredString(0, 0, ylabel); c.restoreState()
+        c.setStrokeColor(col["border"]); c.setLineWidth(0.8); c.line(px, py, px + pw, py)
+        if left_spine: c.line(px, py, px, py + ph)
+        return px, py, pw, ph
+
+    def annual_chart(self, x, y, w, h, series, title):
+        c = self.c; col = self.colors; daily = series["daily"]; days = len(daily)
+        px, py, pw, ph = self._axes(x, y, w, h, title, 105, "Completion Rate (%)")
+        xs = (px + np.arange(days) * pw / days).tolist(); ys = (py + np.asarray(daily) * ph / 105).tolist()
+        area = c.beginPath(); area.moveTo(px, py)
+        for a, b in zip(xs, ys): area.lineTo(a, b)
+        area.lineTo(xs[-1], py); area.close()
+        c.setFillColor(col["fill"]); c.drawPath(area, stroke=0, fill=1)
+        line = c.beginPath(); line.moveTo(xs[0], ys[0])
+        for a, b in zip(xs[1:], ys[1:]): line.lineTo(a, b)
+        c.setStrokeColor(col["chart_line"]); c.setLineWidth(1.5); c.drawPath(line, stroke=1, fill=0)
+        c.setFillColor(col["text_secondary"]); c.setFont("Helvetica", 7)
+        for label, start in zip(self.MONTHS, series["month_starts"]): c.drawCentredString(px + start * pw / days, py - 10, label)
+
+    def monthly_chart(self, x, y, w, h, series, title):
+        c = self.c; col = self.colors
+        px, py, pw, ph = self._axes(x, y, w, h, title, 115, "Average (%)", left_spine=False); slot = pw / 12
+        for i, (label, v) in enumerate(zip(self.MONTHS, series["monthly"])):
+            bx = px + i * slot; top = v * ph / 115
+            c.setFillColor(col["chart_bar"]); c.rect(bx + slot * 0.1, py, slot * 0.8, top, stroke=0, fill=1)
+            c.setFillColor(col["text_secondary"]); c.setFont("Helvetica", 7); c.drawCentredString(bx + slot / 2, py - 10, label)
+            if v > 1: c.setFillColor(col["text_primary"]); c.setFont("Helvetica-Bold", 7); c.drawCentredString(bx + slot / 2, py + top + 3, f"{int(v)}%")
+
+def write_pdf(path, history, names, year, month, habit_idx=None, all_habits=False, theme=THEME_LIGHT, today=None, progress=None, cancel=None):
+    """Builds the report for `year`/`month` from a private `history` copy through a .part file renamed on success.
+
+    One page for the selected view (global, or `habit_idx`); with `all_habits`, the global overview followed by one
+    page per habit, all taken from a single habit_stats()/habit_series() pass. Returns False if `cancel` is set midway."""
+    engine = StatsEngine(history, len(names)); today = today or datetime.date.today(); tmp_path = path + ".part"
+    cal = CalendarIndex.of(year); pages = []  # (subtitle, stats, series, chart title) builders, called lazily
+    if all_habits or habit_idx is None:
+        pages.append(lambda: ("Global Overview", engine.stats(None, year, month, today), engine.chart_series(year) if names else None, f"Consistency Trend: Global ({year})"))
+    if all_habits and names:
+        habit_stats = engine.habit_stats(year, month, today); daily, monthly = engine.habit_series(year)
+        pages += [lambda h=h: (names[h], habit_stats[h], {"daily": daily[h], "monthly": monthly[h], "month_starts": cal.month_starts},
+                               f"Consistency Trend: {names[h]} ({year})") for h in range(len(names))]
+    elif habit_idx is not None:
+        pages.append(lambda: (names[habit_idx], engine.stats(habit_idx, year, month, today), engine.chart_series(year, habit_idx),
+                              f"Consistency Trend: {names[habit_idx]} ({year})"))
+    report = PdfReport(tmp_path, year, theme)
+    try:
+        for i, page in enumerate(pages, 1):
+            if cancel is not None and cancel.is_set(): return False
+            report.add_page(*page())
+            if progress is not None: progress(i, len(pages))
+        report.save(); os.replace(tmp_path, path); return True
+    except BaseException:
+        if os.path.exists(tmp_path): os.remove(tmp_path)
+        raise
+
+class ExportTask(QRunnable):
+    """Runs an export writer (write_csv, write_pdf) on a QThreadPool worker; its data arguments must be private copies."""
+
+    def __init__(self, writer, path, *args, **kwargs):
+        super().__init__()
+        self.writer = writer; self.path = path; self.args = args; self.kwargs = kwargs
+        self.signals = TaskSignals(); self.cancel = threading.Event()
+
+    def run(self):
+        try: ok = self.writer(self.path, *self.args, progress=self.signals.progress.emit, cancel=self.cancel, **self.kwargs)
+        except Exception as e: self.signals.failed.emit(str(e)); return
+        self.signals.finished.emit(self.path if ok else None)
+
+# --- BACKGROUND STATS ---
+class StatsSignals(QObject):
+    """StatsTask signals: finished carries the result dict, failed the generation of the failed request and the error."""
+    finished = Signal(object)
+    failed = Signal(int, str)
+
+class StatsTask(QRunnable):
+    """Computes the KPI cards and chart series for one dashboard view on a worker, from a private HistoryStore copy.
+
+    `key` is the view's MonthViewCache key, (year, month, habit filter, today, data version). The task carries
+    the generation of the request that made it; `is_current(generation)` is checked between steps so a task
+    for a view already left stops early, and the UI drops any result that still arrives stale."""
+
+    def __init__(self, key, generation, is_current, history, n_habits, charts=True):
+        super().__init__()
+        self.key = key; self.generation = generation; self.is_current = is_current
+        self.engine = StatsEngine(history, n_habits); self.charts = charts; self.signals = StatsSignals()
+
+    def run(self):
+        year, month, habit_idx, today, _ = self.key
+        try:
+            if not self.is_current(self.generation): return
+            stats = self.engine.stats(habit_idx, year, month, today)
+            if not self.is_current(self.generation): return
+            series = self.engine.chart_series(year, habit_idx) if self.charts else None
+        except Exception as e: self.signals.failed.emit(self.generation, str(e)); return
+        self.signals.finished.emit({"key": self.key, "generation": self.generation, "stats": stats, "series": series})
+
+class MonthViewCache:
+    """LRU of computed month views ({"stats", "series"}) keyed like StatsTask, so an edit, a new day or another
+    habit filter simply misses. Entries for an older data version are purged as soon as a newer one is stored."""
+
+    def __init__(self, size=MONTH_CACHE_SIZE):
+        self.size = size; self.entries = collections.OrderedDict(); self.hits = self.misses = 0
+
+    def __contains__(self, key): return key in self.entries
+
+    def get(self, key, need_series=True):
+        entry = self.entries.get(key)
+        if entry is None or (need_series and entry["series"] is None): self.misses += 1; return None
+        self.entries.move_to_end(key); self.hits += 1
+        return entry
+
+    def put(self, key, stats, series):
+        version = key[-1]
+        for old in [k for k in self.entries if k[-1] != version]: del self.entries[old]
+        self.entries[key] = {"stats": stats, "series": series}; self.entries.move_to_end(key)
+        while len(self.entries) > self.size: self.entries.popitem(last=False)
+
+    def counters(self): return {"hits": self.hits, "misses": self.misses, "entries": len(self.entries)}
+
+# --- IMPORT ---
+IMPORT_DONE = {"yes": 1, "y": 1, "true": 1, "1": 1, "done": 1, "x": 1, "✓": 1, "no": 0, "n": 0, "false": 0, "0": 0, "": 0, "-": 0}
+
+def parse_done(value):
+    """1/0 for a completion flag (bool, number or a word like Yes/No/done), None if unrecognised."""
+    if isinstance(value, (bool, int, float)): return int(bool(value))
+    return IMPORT_DONE.get(str(value).strip().lower())
+
+def csv_records(f):
+    """(date, habit, done) from a wide export_csv file, or a long one whose header is exactly date, habit (or name)
+    and optionally done, completed or value. Any other header is wide, even one with a habit called "habit"."""
+    reader = csv.reader(f); header = next(reader, None)
+    if header and header[0].startswith("---"): header = next(reader, None)  # export_csv's section marker
+    if not header: return
+    cols = [c.strip().lower() for c in header]
+    if cols[:2] in (["date", "habit"], ["date", "name"]) and (len(cols) == 2 or (len(cols) == 3 and cols[2] in ("done", "completed", "value"))):
+        for row in reader:
+            if len(row) >= 2: yield row[0], row[1], row[2] if len(cols) == 3 and len(row) > 2 else 1
+    else:
+        habits = header[1:]
+        for row in reader:
+            if row and row[0].startswith("---"): break  # a later section
+            for habit, done in zip(habits, row[1:]): yield row[0], habit, done
+
+def json_records(d):
+    """(date, habit, done) from a backup/data file, {"habits": [{"name", "dates"}]} or a list of date/habit records."""
+    if isinstance(d, dict) and "history" in d:
+        names = d.get("names", []); raw = d.get("data", [])
+        history = {"2026": raw} if raw and isinstance(raw[0], list) else d["history"]
+        for y_str, rows in history.items():
+            iso = CalendarIndex.of(int(y_str)).iso
+            for name, values in zip(names, rows): yield from zip(iso, [name] * len(iso), values)
+    elif isinstance(d, dict) and isinstance(d.get("habits"), list):
+        for habit in d["habits"]:
+            name = habit.get("name") or habit.get("title")
+            for entry in habit.get("dates") or habit.get("completions") or habit.get("checkins") or []:
+                yield (entry.get("date"), name, entry.get("done", 1)) if isinstance(entry, dict) else (entry, name, 1)
+    elif isinstance(d, list):
+        for rec in d: yield from json_records(rec)
+    elif isinstance(d, dict) and "date" in d:
+        yield d["date"], d.get("habit") or d.get("name"), next((d[k] for k in ("done", "completed", "value") if k in d), 1)
+
+def import_records(f, path):
+    """(date, habit, done) from any supported file: CSV and JSON Lines are streamed; a JSON document has to be
+    parsed whole, so one over IMPORT_JSON_LIMIT is refused rather than loaded."""
+    name = path.lower().removesuffix(".gz")
+    if name.endswith((".jsonl", ".ndjson")):
+        for line in f:
+            if line.strip(): yield from json_records(json.loads(line))
+    elif name.endswith(".json"):
+        text = f.read(IMPORT_JSON_LIMIT + 1)
+        if len(text) > IMPORT_JSON_LIMIT: raise ValueError(f"This JSON file is larger than {IMPORT_JSON_LIMIT >> 20} MB. Convert it to CSV or JSON Lines (.jsonl), which are imported in bounded memory.")
+        yield from json_records(json.loads(text))
+    else: yield from csv_records(f)
+
+class ImportPlan:
+    """Everything an import file would change, staged without touching the live data.
+
+    Cells are staged per year in a habits x days uint8 matrix (0 = absent, 1 = not done, 2 = done), so memory
+    follows habits x years rather than the row count; records are parsed in batches of BATCH and scattered
+    into those matrices with one vectorized assignment per year. apply() then writes each year in one go."""
+    BATCH = 1 << 16
+
+    def __init__(self, names):
+        self.names = list(names); self.n_existing = len(self.names); self.index = {n: i for i, n in enumerate(self.names)}
+        self.staged = {}  # year -> uint8 matrix
+        self.records = 0; self.skipped = 0
+        self._dates = {}  # date text -> (year, day) or None; dates repeat once per habit, so parse each once
+        self._today = datetime.date.today()
+
+    @property
+    def new_habits(self): return self.names[self.n_existing:]
+
+    @classmethod
+    def read(cls, path, names, progress=None, cancel=None):
+        """Streams `path` (optionally gzipped) into a plan; None if `cancel` is set midway."""
+        plan = cls(names); batch = []
+        with open(path, "rb") as raw:
+            size = os.fstat(raw.fileno()).st_size or 1
+            f = io.TextIOWrapper(gzip.GzipFile(fileobj=raw) if path.lower().endswith(".gz") else raw, encoding="utf-8-sig", newline="")
+            for rec in import_records(f, path):
+                batch.append(rec)
+                if len(batch) < cls.BATCH: continue
+                if cancel is not None and cancel.is_set(): return None
+                plan.add(batch); batch = []
+                if progress is not None: progress(raw.tell(), size)
+            plan.add(batch)
+        return plan
+
+    def _date(self, text):
+        try: d = datetime.date.fromisoformat(str(text).strip()[:10])
+        except ValueError: return None
+        return (d.year, CalendarIndex.day_of(d)) if d <= self._today else None  # the grid never lets future days be ticked
+
+    def _matrix(self, year):
+        m = self.staged.get(year)
+        if m is None or len(m) < len(self.names):
+            grown = np.zeros((len(self.names), HistoryStore.days_in(year)), dtype=np.uint8)
+            if m is not None: grown[:len(m)] = m
+            m = self.staged[year] = grown
+        return m
+
+    def add(self, batch):
+        """Stages one batch of (date, habit, done) records; later records win."""
+        habits, years, days, values = [], [], [], []
+        for date, habit, done in batch:
+            pos = self._dates.get(date, False)
+            if pos is False:
+                if len(self._dates) > 100000: self._dates.clear()
+                pos = self._dates[date] = self._date(date)
+            val = parse_done(done); habit = str(habit or "").strip()
+            if pos is None or val is None or not habit: self.skipped += 1; continue
+            h = self.index.get(habit)
+            if h is None: h = self.index[habit] = len(self.names); self.names.append(habit)
+            habits.append(h); years.append(pos[0]); days.append(pos[1]); values.append(val + 1)
+        self.records += len(batch)
+        if not habits: return
+        habits, years, days, values = np.array(habits), np.array(years), np.array(days), np.array(values, dtype=np.uint8)
+        for year in np.unique(years).tolist():
+            sel = years == year; self._matrix(year)[habits[sel], days[sel]] = values[sel]
+
+    def compare(self, history):
+        """Against the live store: (cells set, cells that would change, conflicts = completed days the file marks not done)."""
+        cells = changes = conflicts = 0; n = len(self.names)
+        for year, staged in self.staged.items():
+            current = history.year_array(year, n)[:len(staged)]; present = staged > 0; new = staged.astype(np.int16) - 1
+            cells += int(present.sum()); changes += int((present & (new != current)).sum()); conflicts += int((present & (new == 0) & (current == 1)).sum())
+        return cells, changes, conflicts
+
+    def apply(self, names, times, history):
+        """Appends the new habits and rewrites each staged year once, merged over what is already there."""
+        names.extend(self.new_habits); times.extend(["Any Time"] * len(self.new_habits)); n = len(names)
+        for year, staged in self.staged.items():
+            m = history.year_array(year, n); k = len(staged)
+            m[:k] = np.where(staged > 0, staged - 1, m[:k]); history.put_array(year, m)
+
+class ImportTask(QRunnable):
+    """Runs ImportPlan.read() on a QThreadPool worker; finished carries the plan (None when cancelled)."""
+
+    def __init__(self, path, names):
+        super().__init__()
+        self.path = path; self.names = names
+        self.signals = TaskSignals(); self.cancel = threading.Event()
+
+    def run(self):
+        try: plan = ImportPlan.read(self.path, self.names, self.signals.progress.emit, self.cancel)
+        except Exception as e: self.signals.failed.emit(str(e)); return
+        self.signals.finished.emit(plan)
+
+# --- UNDO ---
+def pack_rows(rows):
+    """{year: packed row} -> one zlib blob: the years, a newline, then their rows back to back. A None row
+    (a year whose removal HistoryStore queued) is listed as "~year" and takes no bytes."""
+    years = sorted(rows)
+    header = ",".join(f"~{y}" if rows[y] is None else str(y) for y in years)
+    return zlib.compress(header.encode() + b"\n" + b"".join(bytes(rows[y]) for y in years if rows[y] is not None))
+
+def unpack_rows(blob):
+    header, data = zlib.decompress(blob).split(b"\n", 1); rows = {}; pos = 0
+    for y in (y for y in header.decode().split(",") if y):
+        if y.startswith("~"): rows[int(y[1:])] = None; continue
+        year = int(y); size = HistoryStore.row_size(year); rows[year] = data[pos:pos + size]; pos += size
+    return rows
+
+def pack_state(names, times, history):
+    """The whole dataset (names, times and every year of `history`) as one zlib blob, for undoing a restore or import."""
+    history.load_all(); years = history.years()
+    header = json.dumps({"names": list(names), "times": list(times), "years": [[y, history.row_count(y)] for y in years]})
+    return zlib.compress(header.encode() + b"\n" + b"".join(history.packed_row(y, h) for y in years for h in range(history.row_count(y))))
+
+def unpack_state(blob):
+    """Inverse of pack_state: (names, times, HistoryStore)."""
+    header, data = zlib.decompress(blob).split(b"\n", 1); d = json.loads(header); history = HistoryStore(); pos = 0
+    for year, count in d["years"]:
+        size = HistoryStore.row_size(year); history._years[year] = [bytearray(data[pos + i * size:pos + (i + 1) * size]) for i in range(count)]; pos += size * count
+    return d["names"], d["times"], history
+
+class UndoLog:
+    """Multi-level undo/redo of edit records, kept under `limit` bytes (estimated).
+
+    A record is (label, op, *fields): toggle keeps (year, habit, day, new value), cells (year, int32
+    blob of habit/day/new value triples) for a range edit, edit the old and new
+    name/time, add (index, name, time), delete (index, name, time, pack_rows blob) and state (pack_state
+    blobs from before and after a restore or import). Undoing a record moves it to the redo stack; a new
+    edit clears the redo stack. The oldest undo steps are dropped once both stacks together pass the
+    limit, and a single record larger than the limit clears the history instead of being kept."""
+    ENTRY_BYTES = 96  # rough per-record overhead for the size estimate
+
+    def __init__(self, limit=UNDO_LIMIT_BYTES):
+        self.limit = limit; self.undo_stack = collections.deque(); self.redo_stack = []; self.size = 0
+
+    @classmethod
+    def cost(cls, rec): return cls.ENTRY_BYTES + sum(len(f) for f in rec if isinstance(f, bytes))
+
+    def record(self, label, op, *fields):
+        """Pushes a new undo step; returns False (after clearing everything) when it alone exceeds the limit."""
+        for rec in self.redo_stack: self.size -= self.cost(rec)
+        self.redo_stack.clear()
+        rec = (label, op) + fields
+        if self.cost(rec) > self.limit: self.clear(); return False
+        self.undo_stack.append(rec); self.size += self.cost(rec)
+        while self.size > self.limit: self.size -= self.cost(self.undo_stack.popleft())
+        return True
+
+    def amend(self, *fields):
+        """Replaces the fields of the newest undo step (a redo that re-captured its data)."""
+        rec = self.undo_stack.pop(); self.size -= self.cost(rec)
+        rec = rec[:2] + fields; self.undo_stack.append(rec); self.size += self.cost(rec)
+
+    def undo(self):
+        if not self.undo_stack: return None
+        rec = self.undo_stack.pop(); self.redo_stack.append(rec); return rec
+
+    def redo(self):
+        if not self.redo_stack: return None
+        rec = self.redo_stack.pop(); self.undo_stack.append(rec); return rec
+
+    def can_undo(self): return bool(self.undo_stack)
+    def can_redo(self): return bool(self.redo_stack)
+    def clear(self): self.undo_stack.clear(); self.redo_stack.clear(); self.size = 0
+
+# --- SCHEDULER ---
+class Scheduler(QObject):
+    """Owns the app's recurring and deferred timers so they can be paused together.
+
+    The clock fires just after each wall-clock second boundary; deferred jobs coalesce per name. While
+    suspended (window hidden or minimized, session hidden) nothing fires, and resume() catches up with one
+    tick plus every job that came due meanwhile. Each timer firing is counted for wakeups_per_minute()."""
+    tick = Signal()  # once per wall-clock second while running, and once on resume
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.suspended = False
+        self.jobs = {}  # name -> [QTimer, callback, pending]
+        self.wakeups = collections.deque()  # (monotonic time, source) over the last minute
+        self.clock = QTimer(self); self.clock.setSingleShot(True); self.clock.setTimerType(Qt.PreciseTimer); self.clock.timeout.connect(self._on_clock)
+
+    def start(self):
+        if not self.suspended: self._arm_clock()
+
+    def _arm_clock(self): self.clock.start(1000 - int(time.time() * 1000) % 1000 + 1)
+
+    def _on_clock(self):
+        self.note_wakeup("clock"); self.tick.emit()
+        if not self.suspended: self._arm_clock()
+
+    def defer(self, name, ms, callback):
+        """Runs `callback` once, `ms` from now; calling again first restarts the wait."""
+        job = self.jobs.get(name)
+        if job is None:
+            timer = QTimer(self); timer.setSingleShot(True); timer.timeout.connect(lambda: self._run_job(name))
+            job = self.jobs[name] = [timer, callback, False]
+        job[1] = callback; job[2] = True
+        if not self.suspended: job[0].start(ms)
+
+    def cancel(self, name):
+        """Drops a deferred job that has not fired yet."""
+        job = self.jobs.get(name)
+        if job is not None: job[0].stop(); job[2] = False
+
+    def _run_job(self, name):
+        job = self.jobs[name]; self.note_wakeup(name)
+        if not self.suspended and job[2]: job[2] = False; job[1]()
+
+    def suspend(self):
+        if self.suspended: return
+        self.suspended = True; self.clock.stop()
+        for timer, _, _ in self.jobs.values(): timer.stop()
+
+    def resume(self):
+        if not self.suspended: return
+        self.suspended = False; self.tick.emit()  # one catch-up tick for the time spent away
+        for job in self.jobs.values():
+            if job[2]: job[2] = False; job[1]()
+        self._arm_clock()
+
+    def note_wakeup(self, source):
+        now = time.monotonic(); self.wakeups.append((now, source))
+        while self.wakeups[0][0] < now - 60: self.wakeups.popleft()
+
+    def wakeups_per_minute(self):
+        """Timer firings over the last 60 seconds, by source."""
+        cutoff = time.monotonic() - 60
+        return dict(collections.Counter(source for t, source in self.wakeups if t >= cutoff))
+
+# --- DEFERRED IMPORTS ---
+class ImportPreloader(QObject):
+    """Imports matplotlib and reportlab on a daemon thread once the window is up, so their first use
+    does not freeze the UI. Per-module cost lands in `timings` (seconds)."""
+    finished = Signal()
+    MODULES = ("matplotlib.figure", "matplotlib.backends.backend_qtagg", "reportlab.lib.pagesizes", "reportlab.pdfgen.canvas")
+
+    def __init__(self, modules=MODULES):
+        super().__init__()
+        self.modules = modules; self.timings = {}; self.done = threading.Event(); self._thread = None
+
+    def start(self):
+        if self._thread is None: self._thread = threading.Thread(target=self._run, name="ImportPreloader", daemon=True); self._thread.start()
+
+    def _run(self):
+        for name in self.modules:
+            t = time.perf_counter()
+            try: importlib.import_module(name)
+            except ImportError: continue  # reportlab is optional until a PDF export asks for it
+            self.timings[name] = time.perf_counter() - t
+        self.done.set(); self.finished.emit()
+
+# --- CHARTS ---
+class ChartRenderer:
+    """Annual trend + monthly breakdown. Artists are built once and only their data changes on update;
+    styling is applied on theme change only, and the data artists are blitted over a cached background."""
+    MONTHS = [calendar.month_abbr[m] for m in range(1, 13)]
+
+    def __init__(self, tabs, tab_annual, tab_monthly):
+        # Import here to avoid heavy load at startup
+        from matplotlib.backends.backend_qtagg import FigureCanvasQTAgg
+        from matplotlib.figure import Figure
+        self.tabs = tabs; self.year = None
+        self.fig_annual = Figure(figsize=(8, 3), dpi=100); self.canvas_annual = FigureCanvasQTAgg(self.fig_annual)
+        self.fig_monthly = Figure(figsize=(8, 3), dpi=100); self.canvas_monthly = FigureCanvasQTAgg(self.fig_monthly)
+
+        self.ax_annual = self.fig_annual.add_subplot(111)
+        self.line_annual, = self.ax_annual.plot([], [], linewidth=2)
+        self.fill_annual = self.ax_annual.fill_between([0, 1], [0, 0])
+        self.title_annual = self.ax_annual.set_title("", fontsize=10, weight='bold', pad=10)
+        self.ax_annual.set_ylim(0, 105); self.ax_annual.set_ylabel("Completion Rate (%)", fontsize=9)
+
+        self.ax_monthly = self.fig_monthly.add_subplot(111)
+        self.bars_monthly = self.ax_monthly.bar(range(12), [0]*12)
+        self.bar_labels = [self.ax_monthly.text(i, 0, "", ha='center', va='bottom', fontsize=8, fontweight='bold') for i in range(12)]
+        self.title_monthly = self.ax_monthly.set_title("", fontsize=10, weight='bold', pad=10)
+        self.ax_monthly.set_ylabel("Average (%)", fontsize=9); self.ax_monthly.set_ylim(0, 115)
+        self.ax_monthly.set_xticks(range(12)); self.ax_monthly.set_xticklabels(self.MONTHS)
+
+        self.ax_annual.spines['top'].set_visible(False); self.ax_annual.spines['right'].set_visible(False)
+        self.ax_monthly.spines['top'].set_visible(False); self.ax_monthly.spines['right'].set_visible(False)
+        self.ax_monthly.spines['left'].set_visible(False)
+
+        # A panel's background is None until its next full draw; blits fall back to draw_idle until then
+        self.panels = [
+            {"tab": tab_annual, "canvas": self.canvas_annual, "fig": self.fig_annual, "bg": None, "dirty": False,
+             "artists": [self.fill_annual, self.line_annual, self.title_annual]},
+            {"tab": tab_monthly, "canvas": self.canvas_monthly, "fig": self.fig_monthly, "bg": None, "dirty": False,
+             "artists": [*self.bars_monthly, *self.bar_labels, self.title_monthly]}]
+        for p in self.panels:
+            for a in p["artists"]: a.set_animated(True)
+            p["canvas"].mpl_connect('draw_event', lambda event, p=p: self._on_draw(p, event))
+        self.tabs.currentChanged.connect(self._on_tab_changed)
+
+    def apply_theme(self, theme):
+        """Recolours everything; the only path that touches static styling, so it forces a full draw."""
+        fill_rgba = tuple(int(theme['chart_fill'].lstrip('#')[i:i+2], 16)/255. for i in (0, 2, 4)) + (0.15,)
+        for fig, ax in ((self.fig_annual, self.ax_annual), (self.fig_monthly, self.ax_monthly)):
+            fig.patch.set_facecolor(theme['chart_bg']); ax.set_facecolor(theme['chart_bg'])
+            ax.tick_params(axis='x', colors=theme['text_secondary']); ax.tick_params(axis='y', colors=theme['text_secondary'])
+            ax.yaxis.label.set_color(theme['text_secondary']); ax.title.set_color(theme['text_primary']); ax.spines['bottom'].set_color(theme['border'])
+        self.ax_annual.spines['left'].set_color(theme['border'])
+        self.line_annual.set_color(theme['chart_line']); self.fill_annual.set_color(fill_rgba)
+        for bar in self.bars_monthly: bar.set_color(theme['chart_bar'])
+        for lbl in self.bar_labels: lbl.set_color(theme['text_primary'])
+        for p in self.panels: p["bg"] = None; self._render(p)
+
+    def update(self, year, series, title):
+        daily = series["daily"]; days = len(daily); x = np.arange(days)
+        if year != self.year:
+            self.year = year; self.title_monthly.set_text(f"Success Rate by Month ({year})")
+            self.ax_annual.set_xlim(0, days); self.ax_annual.set_xticks(series["month_starts"]); self.ax_annual.set_xticklabels(self.MONTHS, rotation=0, fontsize=8)
+            self.panels[0]["bg"] = None
+        self.line_annual.set_data(x, daily); self.title_annual.set_text(title)
+        self.fill_annual.set_verts([np.column_stack([np.r_[0, x, days - 1], np.r_[0, daily, 0]])])
+        for bar, h, lbl in zip(self.bars_monthly, series["monthly"], self.bar_labels):
+            bar.set_height(h)
+            if h > 1: lbl.set_text(f"{int(h)}%"); lbl.set_y(h + 2); lbl.set_visible(True)
+            else: lbl.set_visible(False)
+        for p in self.panels: self._render(p)
+
+    def _render(self, p):
+        """Blits the panel's data artists, or defers until its tab is shown."""
+        if self.tabs.currentWidget() is not p["tab"]: p["dirty"] = True; return
+        p["dirty"] = False; canvas = p["canvas"]
+        if p["bg"] is None: canvas.draw_idle(); return
+        canvas.restore_region(p["bg"])
+        for a in p["artists"]: p["fig"].draw_artist(a)
+        canvas.blit(p["fig"].bbox)
+
+    def _on_draw(self, p, event):
+        if p["canvas"].is_saving(): return # savefig renders animated artists itself
+        p["bg"] = p["canvas"].copy_from_bbox(p["fig"].bbox)
+        for a in p["artists"]: p["fig"].draw_artist(a)
+
+    def _on_tab_changed(self, _):
+        for p in self.panels:
+            if p["dirty"]: self._render(p)
+
 # --- COMPONENTS ---
 
 class UndoBar(QWidget):
     undoClicked = Signal()
+    redoClicked = Signal()
     
-    def __init__(self, parent=None):
+    def __init__(self, parent, scheduler):
         super().__init__(parent)
+        self.scheduler = scheduler; self.hiding = False  # auto-hide is a Scheduler job, the slides run on ValueAnimator
         self.setFixedHeight(60) 
-        self.setFixedWidth(350)
+        self.setFixedWidth(440)
         self.hide()
         
         layout = QHBoxLayout(self)
@@ -103,49 +1647,67 @@ class UndoBar(QWidget):
         self.btn_undo = QPushButton("UNDO")
         self.btn_undo.setCursor(Qt.PointingHandCursor)
         self.btn_undo.clicked.connect(self.undoClicked.emit)
+        self.btn_redo = QPushButton("REDO")
+        self.btn_redo.setCursor(Qt.PointingHandCursor)
+        self.btn_redo.clicked.connect(self.redoClicked.emit)
         
         layout.addStretch()
         layout.addWidget(self.lbl_text)
         layout.addWidget(self.btn_undo)
+        layout.addWidget(self.btn_redo)
         
-        self.timer = QTimer(self)
-        self.timer.setSingleShot(True)
-        self.timer.timeout.connect(self.hide_animated)
 
-    def show_message(self, text="Item deleted", duration=4000, is_dark=False):
-        theme = THEME_DARK if is_dark else THEME_LIGHT
-        self.setStyleSheet(f"""
-            QWidget {{ background: transparent; }}
-            QLabel {{ color: {theme['undo_text']}; font-weight: bold; font-size: 14px; margin-right: 15px; }}
-            QPushButton {{ color: {theme['undo_btn']}; font-weight: 900; font-size: 14px; border: none; background: transparent; text-align: right; }}
-            QPushButton:hover {{ text-decoration: underline; }}
-        """)
-        self.lbl_text.setText(text)
-        self.show()
-        
-        self.anim = QPropertyAnimation(self, b"pos")
-        parent_rect = self.parent().rect()
-        x_pos = parent_rect.width() - self.width() - 40
-        start_pos = QPoint(x_pos, parent_rect.height())
-        end_pos = QPoint(x_pos, parent_rect.height() - 80)
-        
-        self.anim.setDuration(300)
-        self.anim.setStartValue(start_pos)
-        self.anim.setEndValue(end_pos)
-        self.anim.setEasingCurve(QEasingCurve.OutCubic)
-        self.anim.start()
-        self.timer.start(duration)
+    def show_message(self, text="Item deleted", duration=4000, is_dark=False, can_undo=True, can_redo=False):
+        sheet = theme_sheets(is_dark)["undo_bar"]
+        if self.styleSheet() != sheet: self.setStyleSheet(sheet) # Only restyle when the theme changed
+        self.lbl_text.setText(text); self.btn_undo.setVisible(can_undo); self.btn_redo.setVisible(can_redo)
+        self.scheduler.defer("undo_bar", duration, self.hide_animated)
+        if self.isVisible() and not self.hiding: return # Already up: just update it in place
+        parent_rect = self.parent().rect(); start_y = self.y() if self.isVisible() else parent_rect.height()
+        self.hiding = False; self.move(parent_rect.width() - self.width() - 40, start_y); self.show()
+        ValueAnimator.shared().animate(self, start_y, parent_rect.height() - 80)
 
     def hide_animated(self):
-        self.anim_hide = QPropertyAnimation(self, b"pos")
-        current_pos = self.pos()
-        end_pos = QPoint(current_pos.x(), self.parent().height())
-        self.anim_hide.setDuration(300)
-        self.anim_hide.setStartValue(current_pos)
-        self.anim_hide.setEndValue(end_pos)
-        self.anim_hide.setEasingCurve(QEasingCurve.InCubic)
-        self.anim_hide.finished.connect(self.hide)
-        self.anim_hide.start()
+        if not self.isVisible(): return
+        self.hiding = True; ValueAnimator.shared().animate(self, self.y(), self.parent().height())
+
+    def show_value(self, y):
+        """ValueAnimator frame: slides the bar to `y`, hiding it once it is below the window."""
+        self.move(self.x(), y)
+        if self.hiding and y >= self.parent().height(): self.hiding = False; self.hide()
+
+class TaskBar(QWidget):
+    """Progress strip for background jobs, shown bottom-left while an export or import runs."""
+    cancelClicked = Signal()
+
+    def __init__(self, parent, scheduler):
+        super().__init__(parent)
+        self.scheduler = scheduler  # the auto-hide after finish() is a Scheduler job
+        self.setFixedHeight(60)
+        self.setFixedWidth(460)
+        self.hide()
+
+        layout = QHBoxLayout(self)
+        layout.setContentsMargins(20, 0, 0, 0); layout.setSpacing(12)
+
+        self.lbl_text = QLabel("")
+        self.bar = QProgressBar(); self.bar.setRange(0, 1000); self.bar.setTextVisible(False); self.bar.setFixedHeight(8)
+        self.btn_cancel = QPushButton("CANCEL")
+        self.btn_cancel.setCursor(Qt.PointingHandCursor)
+        self.btn_cancel.clicked.connect(self.cancelClicked.emit)
+
+        layout.addWidget(self.lbl_text); layout.addWidget(self.bar, 1); layout.addWidget(self.btn_cancel)
+
+    def start(self, text, is_dark=False):
+        sheet = theme_sheets(is_dark)["task_bar"]
+        if self.styleSheet() != sheet: self.setStyleSheet(sheet)
+        self.scheduler.cancel("task_bar"); self.lbl_text.setText(text); self.bar.setValue(0); self.btn_cancel.show()
+        self.move(40, self.parent().height() - 80); self.show(); self.raise_()
+
+    def set_progress(self, done, total): self.bar.setValue(int(1000 * done / total) if total else 1000)
+
+    def finish(self, text, duration=3000):
+        self.lbl_text.setText(text); self.btn_cancel.hide(); self.scheduler.defer("task_bar", duration, self.hide)
 
 class HoverHeader(QHeaderView):
     editRequested = Signal(int)
@@ -186,61 +1748,131 @@ class HoverHeader(QHeaderView):
             painter.setPen(QColor("#7F8C8D")); painter.drawText(icon_rect, Qt.AlignCenter, "✏️") 
             painter.restore()
 
+class HabitGrid(QTableView):
+    """Month grid with the DATE/DAY rows pinned above habit rows that scroll inside the view.
+
+    `frozen` is a second view on the same model laid over the first HEADER_ROWS rows; it follows the
+    horizontal scroll and the body scrolls beneath it. Sections are fixed-size, so Qt positions rows
+    arithmetically and only asks the model for the rows on screen, whatever the habit count."""
+    HEADER_ROWS = 2
+
+    def __init__(self, row_height, col_width, parent=None):
+        super().__init__(parent)
+        self.frozen = QTableView(self)
+        for view in (self, self.frozen):
+            view.setFrameShape(QFrame.NoFrame); view.setFocusPolicy(Qt.NoFocus); view.setSelectionMode(QAbstractItemView.NoSelection)
+            view.horizontalHeader().setVisible(False); view.horizontalHeader().setSectionResizeMode(QHeaderView.Fixed)
+        self.setSelectionMode(QAbstractItemView.ExtendedSelection)  # drag for a block, header drag for rows, Ctrl/Shift to extend
+        self.frozen.setVerticalScrollBarPolicy(Qt.ScrollBarAlwaysOff); self.frozen.setHorizontalScrollBarPolicy(Qt.ScrollBarAlwaysOff)
+        self.frozen.viewport().installEventFilter(self)  # wheel over the pinned rows scrolls the body
+        self.horizontalScrollBar().valueChanged.connect(self.frozen.horizontalScrollBar().setValue)
+        self.set_section_sizes(row_height, col_width)
+
+    def set_section_sizes(self, row_height, col_width):
+        for view in (self, self.frozen):
+            view.verticalHeader().setDefaultSectionSize(row_height); view.horizontalHeader().setDefaultSectionSize(col_width)
+        self.updateGeometries()
+
+    def setModel(self, model):
+        super().setModel(model); self.frozen.setModel(model)
+
+    def setVerticalHeader(self, header):
+        super().setVerticalHeader(header); header.setSectionResizeMode(QHeaderView.Fixed)
+        self.frozen.verticalHeader().setSectionResizeMode(QHeaderView.Fixed)
+
+    def set_header_width(self, width):
+        self.verticalHeader().setFixedWidth(width); self.frozen.verticalHeader().setFixedWidth(width)
+
+    def updateGeometries(self):
+        super().updateGeometries()
+        f = self.frameWidth(); height = self.HEADER_ROWS * self.verticalHeader().defaultSectionSize()
+        self.frozen.setGeometry(f, f, self.verticalHeader().width() + self.viewport().width(), height); self.frozen.raise_()
+
+    def eventFilter(self, obj, event):
+        if event.type() == QEvent.Wheel and obj is self.frozen.viewport():
+            QApplication.sendEvent(self.viewport(), event); return True
+        return super().eventFilter(obj, event)
+
 class AnimatedButton(QPushButton):
-    def __init__(self, text, bg_color, text_color="#FFFFFF", is_dropdown=False):
+    """Push button styled by button_css() rules in the theme sheet, addressed by its objectName."""
+    def __init__(self, text, name, is_dropdown=False):
         super().__init__(text)
-        self.bg_color = bg_color; self.text_color = text_color; self.is_dropdown = is_dropdown
-        self.setCursor(Qt.PointingHandCursor); self.update_style()
-    def update_colors(self, bg, text): self.bg_color = bg; self.text_color = text; self.update_style()
-    def update_style(self):
-        padding = "10px 35px 10px 20px" if self.is_dropdown else "10px 20px"
-        self.setStyleSheet(f"""
-            QPushButton {{ background-color: {self.bg_color}; color: {self.text_color}; border-radius: 8px; padding: {padding}; font-weight: 600; font-size: 13px; border: none; text-align: center; }}
-            QPushButton:hover {{ background-color: {self.bg_color}; border: 2px solid #FFFFFF50; padding: { "8px 33px 8px 18px" if self.is_dropdown else "8px 18px" }; }}
-            QPushButton::menu-indicator {{ subcontrol-origin: padding; subcontrol-position: center right; right: 12px; width: 8px; height: 8px; }}
-        """)
+        self.setObjectName(name); self.is_dropdown = is_dropdown
+        self.setCursor(Qt.PointingHandCursor)
+
+class ValueAnimator(QObject):
+    """One frame timer shared by every KPICard (and the undo bar's slide): each value eases from where it is
+    to its target over DURATION_MS, however far apart they are, and the timer only runs while something is
+    in flight. Targets are anything with show_value(int)."""
+    FRAME_MS = 16; DURATION_MS = 450
+    _shared = None
+
+    @classmethod
+    def shared(cls):
+        if cls._shared is None: cls._shared = cls()
+        return cls._shared
+
+    def __init__(self):
+        super().__init__()
+        self.active = {}  # card -> (start value, target value, start time)
+        self.on_frame = None  # called once per frame, for wakeup accounting
+        self.curve = QEasingCurve(QEasingCurve.OutCubic)
+        self.timer = QTimer(self); self.timer.setInterval(self.FRAME_MS); self.timer.timeout.connect(self._tick)
+
+    @staticmethod
+    def _on_screen(card):
+        window = card.window(); return window.isVisible() and not window.isMinimized()
+
+    def animate(self, card, start, target):
+        """Starts easing `card` to `target`; a retarget mid-flight, or a card nobody can see, jumps straight there."""
+        if card in self.active or start == target or not self._on_screen(card):
+            self.active.pop(card, None); card.show_value(target); return
+        self.active[card] = (start, target, time.perf_counter())
+        if not self.timer.isActive(): self.timer.start()
+
+    def _tick(self):
+        now = time.perf_counter()
+        if self.on_frame is not None: self.on_frame()
+        for card, (start, target, t0) in list(self.active.items()):
+            progress = (now - t0) * 1000 / self.DURATION_MS
+            if progress >= 1 or not self._on_screen(card): del self.active[card]; card.show_value(target)
+            else: card.show_value(round(start + (target - start) * self.curve.valueForProgress(progress)))
+        if not self.active: self.timer.stop()
 
 class KPICard(QFrame):
     def __init__(self, key, title, icon):
         super().__init__()
         self.key = key; self.icon_label = QLabel(icon); self.lbl_title = QLabel(title.upper()); self.lbl_value = QLabel("0")
+        self.setObjectName(f"kpi_{key}"); self.icon_label.setObjectName("kpi_icon"); self.lbl_title.setObjectName("kpi_title"); self.lbl_value.setObjectName("kpi_value")
         layout = QVBoxLayout(self); layout.setSpacing(5); layout.setContentsMargins(15, 15, 15, 15)
         header_layout = QHBoxLayout(); header_layout.addStretch(); header_layout.addWidget(self.icon_label); header_layout.addWidget(self.lbl_title); header_layout.addStretch()
         layout.addLayout(header_layout)
         self.lbl_value.setAlignment(Qt.AlignCenter); layout.addWidget(self.lbl_value)
         self.setFixedHeight(100) 
-        self._current_val = 0; self._target_val = 0
-        self.anim_timer = QTimer(self); self.anim_timer.timeout.connect(self._animate_step)
+        self._current_val = 0; self.suffix = ""
 
     def apply_theme(self, is_dark):
-        theme = THEME_DARK if is_dark else THEME_LIGHT
-        style_data = KPI_STYLES_DARK.get(self.key, {"text": "#FFFFFF"}) if is_dark else KPI_STYLES_LIGHT.get(self.key, {"bg": "#FFFFFF", "text": "#000000", "border": "#E0E0E0"})
-        bg_style = f"background-color: {theme['card']};" if is_dark else f"background-color: {style_data['bg']}; border: 1px solid {style_data['border']};"
-        self.setStyleSheet(f"QFrame {{ {bg_style} border-radius: 12px; }} QLabel {{ border: none; background: transparent; }}")
-        apply_shadow(self, blur=10, offset=4, color=theme['shadow'])
-        text_color = style_data['text']
-        self.icon_label.setStyleSheet(f"color: {text_color}; font-size: 20px;")
-        self.lbl_title.setStyleSheet(f"color: {text_color}; font-size: 13px; font-weight: 800; opacity: 0.9;") 
-        self.lbl_value.setStyleSheet(f"color: {text_color}; font-size: 24px; font-weight: 800;")
+        """Colours come from the container sheet (theme_sheets); only the shadow is per card, and it is reused."""
+        color = THEME_DARK['shadow'] if is_dark else THEME_LIGHT['shadow']
+        if self.graphicsEffect() is None: apply_shadow(self, blur=10, offset=4, color=color)
+        else: self.graphicsEffect().setColor(QColor(color))
 
     def set_value(self, text_val):
         try: val = int(''.join(filter(str.isdigit, str(text_val))))
         except: val = 0
         self.suffix = "%" if "%" in str(text_val) else ""
-        self._target_val = val; self.anim_timer.start(15)
+        ValueAnimator.shared().animate(self, self._current_val, val)
 
-    def _animate_step(self):
-        if self._current_val < self._target_val: self._current_val += 1
-        elif self._current_val > self._target_val: self._current_val -= 1
-        else: self.anim_timer.stop()
-        self.lbl_value.setText(f"{self._current_val}{self.suffix}")
+    def show_value(self, val):
+        text = f"{val}{self.suffix}"
+        if text != self.lbl_value.text(): self.lbl_value.setText(text)
+        self._current_val = val
 
 class HabitDialog(QDialog):
     def __init__(self, parent=None, name="", time="", is_dark=False):
         super().__init__(parent)
         self.setWindowTitle("Habit Details"); self.setFixedWidth(380)
-        theme = THEME_DARK if is_dark else THEME_LIGHT
-        self.setStyleSheet(f"QDialog {{ background-color: {theme['card']}; }} QLabel {{ color: {theme['text_primary']}; font-weight: 600; font-size: 13px; }} QLineEdit {{ background: {theme['bg']}; color: {theme['text_primary']}; border: 1px solid {theme['border']}; padding: 8px; border-radius: 6px; }} QPushButton {{ background: {theme['btn_add']}; color: white; padding: 8px 16px; border-radius: 6px; border: none; font-weight: bold; }}")
+        self.setStyleSheet(theme_sheets(is_dark)["habit_dialog"])
         layout = QVBoxLayout(self)
         self.name_input = QLineEdit(name); self.name_input.setPlaceholderText("Habit Name")
         self.time_input = QLineEdit(time); self.time_input.setPlaceholderText("Time")
@@ -249,95 +1881,201 @@ class HabitDialog(QDialog):
         buttons.accepted.connect(self.accept); buttons.rejected.connect(self.reject); layout.addWidget(buttons)
     def get_data(self): return self.name_input.text(), self.time_input.text()
 
+class ExportDialog(QDialog):
+    def __init__(self, parent=None, habit_names=(), year=None, is_dark=False):
+        super().__init__(parent)
+        self.setWindowTitle("Export CSV"); self.setFixedWidth(420)
+        year = year or datetime.date.today().year
+        self.setStyleSheet(theme_sheets(is_dark)["export_dialog"])
+        layout = QVBoxLayout(self)
+        self.from_input = QDateEdit(QDate(year, 1, 1)); self.to_input = QDateEdit(QDate(year, 12, 31))
+        for d in (self.from_input, self.to_input): d.setCalendarPopup(True); d.setDisplayFormat("yyyy-MM-dd")
+        self.habit_list = QListWidget(); self.habit_list.setFixedHeight(150)
+        for name in habit_names:
+            item = QListWidgetItem(name); item.setFlags(item.flags() | Qt.ItemIsUserCheckable); item.setCheckState(Qt.Checked); self.habit_list.addItem(item)
+        self.layout_input = QComboBox(); self.layout_input.addItems(["Wide (one column per habit)", "Long (date, habit, done)"])
+        self.gzip_input = QCheckBox("Compress (.csv.gz)")
+        form = QFormLayout(); form.addRow("From:", self.from_input); form.addRow("To:", self.to_input); form.addRow("Habits:", self.habit_list)
+        form.addRow("Layout:", self.layout_input); form.addRow("", self.gzip_input); layout.addLayout(form)
+        buttons = QDialogButtonBox(QDialogButtonBox.Ok | QDialogButtonBox.Cancel)
+        buttons.accepted.connect(self.accept); buttons.rejected.connect(self.reject); layout.addWidget(buttons)
+    def get_options(self):
+        first, last = sorted((self.from_input.date().toPython(), self.to_input.date().toPython()))
+        habits = [i for i in range(self.habit_list.count()) if self.habit_list.item(i).checkState() == Qt.Checked]
+        return {"first": first, "last": last, "habits": habits, "long": self.layout_input.currentIndex() == 1, "compress": self.gzip_input.isChecked()}
+
+class LeaderboardDialog(QDialog):
+    """Every habit's KPIs in one sortable table; double-clicking a row opens that habit's view."""
+    habitChosen = Signal(int)
+    def __init__(self, parent, model, title, is_dark=False):
+        super().__init__(parent)
+        self.setWindowTitle(title); self.resize(760, 520)
+        self.setStyleSheet(theme_sheets(is_dark)["leaderboard_dialog"])
+        layout = QVBoxLayout(self); self.view = QTableView(); self.view.setModel(model)
+        self.view.setSortingEnabled(True); self.view.sortByColumn(LeaderboardModel.DEFAULT_SORT, Qt.DescendingOrder)
+        self.view.setSelectionBehavior(QAbstractItemView.SelectRows); self.view.setEditTriggers(QAbstractItemView.NoEditTriggers)
+        self.view.verticalHeader().setVisible(False); self.view.verticalHeader().setDefaultSectionSize(30)
+        self.view.horizontalHeader().setSectionResizeMode(QHeaderView.ResizeToContents); self.view.horizontalHeader().setSectionResizeMode(0, QHeaderView.Stretch)
+        self.view.doubleClicked.connect(lambda index: (self.habitChosen.emit(model.habit_at(index.row())), self.accept()))
+        layout.addWidget(self.view)
+        buttons = QDialogButtonBox(QDialogButtonBox.Close); buttons.rejected.connect(self.reject); layout.addWidget(buttons)
+
 # --- MODEL ---
 class HabitModel(QAbstractTableModel):
     dataToggled = Signal(int, int)
+    # Qt enum attribute lookups are slow under PySide6; data() runs per cell and role, so resolve them once
+    DISPLAY, BACKGROUND, FOREGROUND, FONT, ALIGNMENT = Qt.DisplayRole, Qt.BackgroundRole, Qt.ForegroundRole, Qt.FontRole, Qt.TextAlignmentRole
+    ALIGN_CENTER, VERTICAL = Qt.AlignCenter, Qt.Vertical
 
-    def __init__(self, month_data, habit_names, habit_times, year, month, is_dark=False):
+    def __init__(self, history, habit_names, habit_times, year, month, is_dark=False):
         super().__init__()
-        self._month_data = month_data; self._habit_names = habit_names; self._habit_times = habit_times
+        self._history = history; self._habit_names = habit_names; self._habit_times = habit_times
         self._year = year; self._month = month; self.is_dark = is_dark
+        self._font_date = QFont("Segoe UI", 9, QFont.Bold); self._font_day = QFont("Segoe UI", 8)
         self.update_month_properties()
 
     def update_month_properties(self):
-        self.start_date = datetime.date(self._year, self._month, 1)
-        self.days_in_month = len(self._month_data[0]) if self._month_data else 0
-        self.today_idx = -1
-        today = datetime.date.today()
+        """Per-month lookup tables (labels, weekend flags, future mask) so data() is a few indexed reads."""
+        cal = CalendarIndex.of(self._year); self.start_date = datetime.date(self._year, self._month, 1)
+        self.start_idx = cal.day(self._month); self.days_in_month = cal.month_lengths[self._month - 1]
+        self.today = today = datetime.date.today(); self.today_idx = -1
         if today.year == self._year and today.month == self._month: self.today_idx = today.day - 1
-
-    def update_view(self, year, month, month_slice):
+        weekdays = cal.weekdays[self.start_idx:self.start_idx + self.days_in_month].tolist()
+        self._date_labels = [iso[8:] for iso in cal.iso[self.start_idx:self.start_idx + self.days_in_month]]
+        self._day_labels = [calendar.day_abbr[w] for w in weekdays]; self._weekend = [w >= 5 for w in weekdays]
+        if self._year > today.year or (self._year == today.year and self._month > today.month): self._future = [True] * self.days_in_month
+        elif self._year == today.year and self._month == today.month: self._future = [c > self.today_idx for c in range(self.days_in_month)]
+        else: self._future = [False] * self.days_in_month
+        self._open_cols = self._future.index(True) if True in self._future else self.days_in_month  # future days form a suffix
+        self.build_styles()
+
+    def build_styles(self):
+        """Per-theme colours, resolved per column for the two header rows and the cell backgrounds."""
+        theme = THEME_DARK if self.is_dark else THEME_LIGHT
+        color = {k: QColor(v) for k, v in theme.items() if isinstance(v, str) and v.startswith('#')}
+        self._completed = color['completed']; self._row_bg = (color['row_even'], color['row_odd'])
+        cols = range(self.days_in_month)
+        self._header_bg = [color['today_bg'] if c == self.today_idx else color['bg'] for c in cols]
+        self._date_fg = [color['today_text'] if c == self.today_idx else color['date_text'] for c in cols]
+        self._day_fg = [color['today_text'] if c == self.today_idx else color['weekend_text'] if self._weekend[c] else color['day_text'] for c in cols]
+        self._cell_bg = [color['today_bg'] if c == self.today_idx else color['future_bg'] if self._future[c] else None for c in cols]
+        self._header_roles = [
+            {self.DISPLAY: self._date_labels, self.FOREGROUND: self._date_fg, self.FONT: [self._font_date] * self.days_in_month},
+            {self.DISPLAY: self._day_labels, self.FOREGROUND: self._day_fg, self.FONT: [self._font_day] * self.days_in_month}]
+
+    def update_view(self, year, month):
         self.layoutAboutToBeChanged.emit()
-        self._year = year; self._month = month; self._month_data = month_slice
+        self._year = year; self._month = month
         self.update_month_properties(); self.layoutChanged.emit()
 
-    def set_theme_mode(self, is_dark): self.is_dark = is_dark; self.layoutChanged.emit()
+    def refresh_today(self):
+        """Rebuilds the today/future tables once the date rolls over."""
+        if datetime.date.today() != self.today: self.update_view(self._year, self._month)
+
+    def set_theme_mode(self, is_dark):
+        """Only colours change with the theme, so repaint the cells (dataChanged) rather than relayout."""
+        self.is_dark = is_dark; self.build_styles()
+        self.dataChanged.emit(self.index(0, 0), self.index(self.rowCount() - 1, self.columnCount() - 1), [self.BACKGROUND, self.FOREGROUND])
     def rowCount(self, parent=None): return len(self._habit_names) + 2
     def columnCount(self, parent=None): return self.days_in_month
     
     def data(self, index, role=Qt.DisplayRole):
         r, c = index.row(), index.column()
-        theme = THEME_DARK if self.is_dark else THEME_LIGHT
-        if r < 2:
-            is_today = (c == self.today_idx)
-            if role == Qt.BackgroundRole: return QColor(theme['today_bg']) if is_today else QColor(theme['bg'])
-            if role == Qt.TextAlignmentRole: return Qt.AlignCenter
-            d_date = self.start_date + datetime.timedelta(days=c)
-            if r == 0: 
-                if role == Qt.DisplayRole: return str(d_date.day).zfill(2)
-                if role == Qt.ForegroundRole: return QColor(theme['today_text']) if is_today else QColor(theme['date_text'])
-                if role == Qt.FontRole: return QFont("Segoe UI", 9, QFont.Bold)
-            else: 
-                if role == Qt.DisplayRole: return d_date.strftime("%a")
-                if role == Qt.ForegroundRole: 
-                    if is_today: return QColor(theme['today_text'])
-                    return QColor(theme['weekend_text']) if d_date.weekday() >= 5 else QColor(theme['day_text'])
-                if role == Qt.FontRole: return QFont("Segoe UI", 8)
-            return None
-        habit_idx = r - 2
-        if habit_idx >= len(self._month_data): return None
-        val = self._month_data[habit_idx][c]
-        if role == Qt.BackgroundRole:
-            if val == 1: return QColor(theme['completed'])
-            if c == self.today_idx: return QColor(theme['today_bg'])
-            is_future = False
-            today = datetime.date.today()
-            if self._year > today.year or (self._year == today.year and self._month > today.month): is_future = True
-            elif self._year == today.year and self._month == today.month and c > self.today_idx: is_future = True
-            if is_future: return QColor(theme['future_bg'])
-            return QColor(theme['row_even']) if habit_idx % 2 == 0 else QColor(theme['row_odd'])
-        return None
+        if role == self.BACKGROUND:
+            if r < 2: return self._header_bg[c]
+            habit_idx = r - 2
+            if habit_idx >= self._history.row_count(self._year): return None
+            if self._history.get(self._year, habit_idx, self.start_idx + c) == 1: return self._completed
+            return self._cell_bg[c] or self._row_bg[habit_idx & 1]
+        if r >= 2: return None
+        if role == self.ALIGNMENT: return self.ALIGN_CENTER
+        column = self._header_roles[r].get(role)
+        return column[c] if column is not None else None
 
     def headerData(self, section, orientation, role):
-        if orientation == Qt.Vertical and role == Qt.DisplayRole:
+        if orientation == self.VERTICAL and role == self.DISPLAY:
             if section < 2: return ["DATE", "DAY"][section]
             habit_idx = section - 2
             if 0 <= habit_idx < len(self._habit_names): return f"{self._habit_names[habit_idx]}\n{self._habit_times[habit_idx]}"
-        if orientation == Qt.Vertical and role == Qt.FontRole and section >= 2: return QFont("Segoe UI", 9, QFont.Bold)
+        if orientation == self.VERTICAL and role == self.FONT and section >= 2: return self._font_date
         return None
 
     def toggle(self, index):
         r, c = index.row(), index.column()
-        if r < 2: return
-        today = datetime.date.today()
-        if self._year > today.year or (self._year == today.year and self._month > today.month): return
-        if self._year == today.year and self._month == today.month and c > self.today_idx: return
+        if r < 2 or self._future[c]: return
         habit_idx = r - 2
-        new_val = 1 - self._month_data[habit_idx][c]
-        self._month_data[habit_idx][c] = new_val
+        new_val = 1 - self._history.get(self._year, habit_idx, self.start_idx + c)
+        self._history.set(self._year, habit_idx, self.start_idx + c, new_val)
         self.dataChanged.emit(index, index); self.dataToggled.emit(habit_idx, c)
 
+    def write_blocks(self, blocks, mode):
+        """Fills, clears or inverts every cell covered by `blocks` ((top, left, bottom, right) in model
+        coordinates) with one masked write per habit row and one dataChanged over the area touched.
+        Header rows and future days are skipped; returns {habit: mask of year days that changed}."""
+        masks = {}
+        for top, left, bottom, right in blocks:
+            right = min(right, self._open_cols - 1)
+            if right < left: continue
+            mask = ((1 << (right - left + 1)) - 1) << (self.start_idx + left)
+            for habit_idx in range(max(top, 2) - 2, min(bottom - 1, self._history.row_count(self._year))): masks[habit_idx] = masks.get(habit_idx, 0) | mask
+        changed = {}
+        for habit_idx, mask in masks.items():
+            diff = self._history.write_mask(self._year, habit_idx, mask, mode)
+            if diff: changed[habit_idx] = diff
+        if changed:
+            cols = functools.reduce(int.__or__, changed.values()) >> self.start_idx
+            self.dataChanged.emit(self.index(min(changed) + 2, (cols & -cols).bit_length() - 1), self.index(max(changed) + 2, cols.bit_length() - 1), [self.BACKGROUND])
+        return changed
+
+class LeaderboardModel(QAbstractTableModel):
+    """Read-only view of StatsEngine.leaderboard(); sorting reorders a row permutation with one argsort."""
+    COLUMNS = [("Habit", "name"), ("Today", "today"), ("Weekly", "weekly"), ("Monthly", "monthly"), ("Year Total", "total"), ("Best Streak", "best"), ("Current Streak", "current")]
+    DEFAULT_SORT = 3  # monthly rate
+    FORMATS = {"today": lambda v: "✅" if v else "—", "weekly": lambda v: f"{int(v * 100)}%", "monthly": lambda v: f"{int(v * 100)}%",
+               "total": str, "best": lambda v: f"{v} Days", "current": lambda v: f"{v} Days"}
+
+    def __init__(self, names, board):
+        super().__init__()
+        self.names = list(names); self.board = board; self.order = np.arange(len(self.names))
+
+    def rowCount(self, parent=None): return len(self.names)
+    def columnCount(self, parent=None): return len(self.COLUMNS)
+    def habit_at(self, row): return int(self.order[row])
+
+    def data(self, index, role=Qt.DisplayRole):
+        key = self.COLUMNS[index.column()][1]; h = self.order[index.row()]
+        if role == Qt.DisplayRole: return self.names[h] if key == "name" else self.FORMATS[key](self.board[key][h].item())
+        if role == Qt.TextAlignmentRole: return int(Qt.AlignVCenter | (Qt.AlignLeft if key == "name" else Qt.AlignCenter))
+        return None
+
+    def headerData(self, section, orientation, role):
+        if orientation == Qt.Horizontal and role == Qt.DisplayRole: return self.COLUMNS[section][0]
+        return None
+
+    def sort(self, column, order=Qt.AscendingOrder):
+        key = self.COLUMNS[column][1]
+        self.layoutAboutToBeChanged.emit()
+        if key == "name": self.order = np.array(sorted(range(len(self.names)), key=lambda h: self.names[h].lower()), dtype=np.int64)
+        else: self.order = np.argsort(self.board[key], kind="stable")
+        if order == Qt.DescendingOrder: self.order = self.order[::-1]
+        self.layoutChanged.emit()
+
 # --- MAIN APP ---
 class HabitApp(QWidget):
-    def __init__(self):
+    def __init__(self, profile_startup=False, report_wakeups=False):
         super().__init__()
+        self.profile_startup = profile_startup; self.startup_marks = {}; self.startup_report_due = False
+        self.scheduler = Scheduler(self); ValueAnimator.shared().on_frame = functools.partial(self.scheduler.note_wakeup, "animation")
+        self.preloader = ImportPreloader(); self.preloader.finished.connect(self.maybe_load_charts)
         icon_path = resource_path(ICON_NAME)
         if os.path.exists(icon_path): self.setWindowIcon(QIcon(icon_path))
         self.is_dark_mode = False 
         self.row_height = 50; self.col_width = 45
         today = datetime.date.today(); self.view_year = today.year; self.view_month = today.month
-        self.selected_habit_idx = None; self._last_deleted_habit = None  
-        self.chart_update_timer = QTimer(); self.chart_update_timer.setSingleShot(True); self.chart_update_timer.timeout.connect(self.update_charts_data_only)
+        self.selected_habit_idx = None; self.undo_log = UndoLog()
+        self.stats_pool = QThreadPool(self); self.stats_pool.setMaxThreadCount(1); self.view_generation = 0; self.stats_task = None  # see trigger_full_update
+        self.month_cache = MonthViewCache(); self.prefetch_tasks = []; self.stats_error = None  # last background failure reported
+        self.charts = None
         
         # Initialize window variables
         self.saved_geometry = None
@@ -347,11 +2085,13 @@ class HabitApp(QWidget):
         self.setup_ui()
         self.apply_theme()
         
-        # CLOCK SETUP
-        self.clock_timer = QTimer(self)
-        self.clock_timer.timeout.connect(self.update_clock)
-        self.clock_timer.start(1000)
+        # CLOCK SETUP: ticks on second boundaries and pauses while the window is hidden or minimized
+        self.scheduler.tick.connect(self.update_clock); self.scheduler.tick.connect(self.model.refresh_today)
+        self.scheduler.start()
         self.update_clock() # Initial Update
+        QApplication.instance().applicationStateChanged.connect(self.on_application_state)
+        if report_wakeups:
+            self.scheduler.defer("wakeup_report", 60000, self.report_wakeups)
         
         # Restore window state
         if self.saved_geometry:
@@ -364,70 +2104,32 @@ class HabitApp(QWidget):
             
         QTimer.singleShot(100, self.scroll_to_today_column)
         
-        # FIX: Delay chart loading to speed up startup
-        QTimer.singleShot(200, self.lazy_load_charts)
+        # Startup fast path: the month grid paints first; matplotlib/reportlab import in the background
+        # after that, and the charts are built once the stats section scrolls into view
+        self.table.viewport().installEventFilter(self)
+        self.main_scroll.verticalScrollBar().valueChanged.connect(self.maybe_load_charts)
 
     def init_data(self):
-        self.habit_names = []; self.habit_times = []; self.history_data = {} 
-        if os.path.exists(DATA_FILE):
-            try:
-                with open(DATA_FILE, "r") as f: 
-                    d = json.load(f)
-                    self.habit_names = d.get("names", DEFAULT_HABITS.copy())
-                    self.habit_times = d.get("times", [])
-                    self.is_dark_mode = d.get("theme", False)
-                    self.saved_geometry = d.get("window_geometry")
-                    self.saved_maximized = d.get("window_maximized", False)
-                    raw_data = d.get("data", [])
-                    if raw_data and isinstance(raw_data[0], list): self.history_data["2026"] = raw_data
-                    else: self.history_data = d.get("history", {})
-            except: pass
-        if not self.habit_names: self.habit_names = DEFAULT_HABITS.copy()
-        while len(self.habit_times) < len(self.habit_names): self.habit_times.append("Any Time")
+        self.storage = open_storage()
+        state = self.storage.load()
+        self.habit_names = state["names"]; self.habit_times = state["times"]; self.history_data = state["history"]
+        self.is_dark_mode = state["theme"]
+        self.saved_geometry = state["window_geometry"]
+        self.saved_maximized = state["window_maximized"]
         
         # Ensure data consistency on startup
         self.sanitize_data(self.view_year)
+        self.rebuild_aggregates()
 
     def sanitize_data(self, year):
-        """FIX: Ensures history_data perfectly matches habit_names length and year length."""
-        str_year = str(year)
-        days_in_year = 366 if calendar.isleap(year) else 365
-        
-        if str_year not in self.history_data:
-            self.history_data[str_year] = []
-
-        current_data = self.history_data[str_year]
-        target_rows = len(self.habit_names)
-
-        # 1. Add missing rows
-        if len(current_data) < target_rows:
-            for _ in range(target_rows - len(current_data)):
-                current_data.append([0]*days_in_year)
-        
-        # 2. Trim excess rows (if habits were deleted but not cleaned)
-        if len(current_data) > target_rows:
-            self.history_data[str_year] = current_data[:target_rows]
-            
-        # 3. Ensure every row has correct number of days
-        for i in range(len(self.history_data[str_year])):
-            row = self.history_data[str_year][i]
-            if len(row) < days_in_year:
-                row.extend([0] * (days_in_year - len(row)))
-            elif len(row) > days_in_year:
-                self.history_data[str_year][i] = row[:days_in_year]
-
-    def get_month_slice(self, year, month):
-        days_in_month = calendar.monthrange(year, month)[1]
-        start_idx = datetime.date(year, month, 1).timetuple().tm_yday - 1
-        current_year_data = self.history_data[str(year)]
-        data_to_slice = current_year_data[:len(self.habit_names)]
-        return [row[start_idx : start_idx + days_in_month] for row in data_to_slice]
+        """FIX: Ensures history_data perfectly matches habit_names length for the given year."""
+        self.history_data.ensure(year, len(self.habit_names))
 
     def setup_ui(self):
         self.setWindowTitle(f"Habit Dashboard")
         self.resize(1350, 950)
-        self.main_scroll = QScrollArea(self); self.main_scroll.setWidgetResizable(True)
-        self.container = QWidget(); self.layout = QVBoxLayout(self.container)
+        self.main_scroll = QScrollArea(self); self.main_scroll.setWidgetResizable(True); self.main_scroll.setObjectName("main_scroll")
+        self.container = QWidget(); self.container.setObjectName("container"); self.layout = QVBoxLayout(self.container)
         self.layout.setContentsMargins(40, 40, 40, 40); self.layout.setSpacing(35)
         self.main_scroll.setWidget(self.container)
         root_layout = QVBoxLayout(self); root_layout.setContentsMargins(0, 0, 0, 0); root_layout.addWidget(self.main_scroll)
@@ -436,28 +2138,29 @@ class HabitApp(QWidget):
         header_frame = QFrame(); header_layout = QHBoxLayout(header_frame); header_layout.setContentsMargins(0, 0, 0, 0)
         title_box = QVBoxLayout(); title_box.setSpacing(5)
         self.title_lbl = QLabel(f"🎯 Habit Dashboard"); self.subtitle_lbl = QLabel(f"Consistency is key.")
+        self.title_lbl.setObjectName("title"); self.subtitle_lbl.setObjectName("subtitle")
         title_box.addWidget(self.title_lbl); title_box.addWidget(self.subtitle_lbl)
         
         controls_layout = QHBoxLayout(); controls_layout.setSpacing(12)
-        self.btn_prev_month = QPushButton("◀"); self.btn_prev_month.setFixedSize(40, 38); self.btn_prev_month.setCursor(Qt.PointingHandCursor)
+        self.btn_prev_month = QPushButton("◀"); self.btn_prev_month.setFixedSize(40, 38); self.btn_prev_month.setCursor(Qt.PointingHandCursor); self.btn_prev_month.setObjectName("nav_prev")
         self.btn_prev_month.clicked.connect(lambda: self.change_month(-1))
-        self.lbl_month_display = QLabel(f"{calendar.month_name[self.view_month]} {self.view_year}")
+        self.lbl_month_display = QLabel(f"{calendar.month_name[self.view_month]} {self.view_year}"); self.lbl_month_display.setObjectName("month_badge")
         self.lbl_month_display.setAlignment(Qt.AlignCenter); self.lbl_month_display.setFixedSize(160, 38)
-        self.btn_next_month = QPushButton("▶"); self.btn_next_month.setFixedSize(40, 38); self.btn_next_month.setCursor(Qt.PointingHandCursor)
+        self.btn_next_month = QPushButton("▶"); self.btn_next_month.setFixedSize(40, 38); self.btn_next_month.setCursor(Qt.PointingHandCursor); self.btn_next_month.setObjectName("nav_next")
         self.btn_next_month.clicked.connect(lambda: self.change_month(1))
         
         # --- NEW: CLOCK LABEL ---
-        self.lbl_clock = QLabel("00:00:00")
+        self.lbl_clock = QLabel("00:00:00"); self.lbl_clock.setObjectName("clock")
         self.lbl_clock.setAlignment(Qt.AlignCenter)
         self.lbl_clock.setFixedSize(120, 38)
 
-        self.btn_add = AnimatedButton(" + Habit ", "#28A745", is_dropdown=False); self.btn_add.clicked.connect(self.add_habit)
-        self.btn_export = AnimatedButton("Export", "#7E3AF2", is_dropdown=True)
+        self.btn_add = AnimatedButton(" + Habit ", "btn_add"); self.btn_add.clicked.connect(self.add_habit)
+        self.btn_export = AnimatedButton("Export", "btn_export", is_dropdown=True)
         self.menu = QMenu(self)
-        self.menu.addAction("📄 CSV", self.export_csv); self.menu.addAction("📕 PDF", self.export_pdf)
-        self.menu.addSeparator(); self.menu.addAction("💾 Backup", self.backup_data); self.menu.addAction("🔄 Restore", self.restore_data)
+        self.menu.addAction("📄 CSV", self.export_csv); self.menu.addAction("📕 PDF", lambda: self.export_pdf()); self.menu.addAction("📚 PDF (all habits)", lambda: self.export_pdf(all_habits=True))
+        self.menu.addSeparator(); self.menu.addAction("💾 Backup", self.backup_data); self.menu.addAction("🔄 Restore", self.restore_data); self.menu.addAction("📥 Import", self.import_data)
         self.btn_export.setMenu(self.menu)
-        self.btn_theme = QPushButton(""); self.btn_theme.setFixedSize(38, 38); self.btn_theme.setCursor(Qt.PointingHandCursor); self.btn_theme.clicked.connect(self.toggle_theme)
+        self.btn_theme = QPushButton(""); self.btn_theme.setFixedSize(38, 38); self.btn_theme.setCursor(Qt.PointingHandCursor); self.btn_theme.setObjectName("theme_button"); self.btn_theme.clicked.connect(self.toggle_theme)
         
         controls_layout.addWidget(self.btn_prev_month); controls_layout.addWidget(self.lbl_month_display); controls_layout.addWidget(self.btn_next_month)
         
@@ -469,10 +2172,9 @@ class HabitApp(QWidget):
         self.layout.addWidget(header_frame)
 
         # 2. CALENDAR TABLE
-        self.grid_container = QFrame(); grid_layout_inner = QVBoxLayout(self.grid_container); grid_layout_inner.setContentsMargins(0, 0, 0, 0)
-        self.table = QTableView()
-        month_slice = self.get_month_slice(self.view_year, self.view_month)
-        self.model = HabitModel(month_slice, self.habit_names, self.habit_times, self.view_year, self.view_month, self.is_dark_mode)
+        self.grid_container = QFrame(); self.grid_container.setObjectName("grid_container"); grid_layout_inner = QVBoxLayout(self.grid_container); grid_layout_inner.setContentsMargins(0, 0, 0, 0)
+        self.table = HabitGrid(self.row_height, self.col_width)
+        self.model = HabitModel(self.history_data, self.habit_names, self.habit_times, self.view_year, self.view_month, self.is_dark_mode)
         self.model.dataToggled.connect(self.on_data_toggled)
         self.table.setModel(self.model)
         
@@ -480,29 +2182,23 @@ class HabitApp(QWidget):
         self.table.setVerticalHeader(self.hover_header)
         self.hover_header.editRequested.connect(self.edit_habit_by_row)
         
-        # Static Header (No Dragging)
-        v_header = self.table.verticalHeader()
-        v_header.setVisible(True); v_header.setFixedWidth(160)
-        v_header.setDefaultSectionSize(self.row_height); v_header.setSectionResizeMode(QHeaderView.Fixed)
-        self.table.horizontalHeader().setVisible(False); self.table.horizontalHeader().setDefaultSectionSize(self.col_width); self.table.horizontalHeader().setSectionResizeMode(QHeaderView.Fixed)
-        
+        # Static Header (No Dragging); the DATE/DAY rows stay pinned while habit rows scroll inside the grid
+        self.table.set_header_width(160); self.table.set_section_sizes(self.row_height, self.col_width)
         self.table.setSizePolicy(QSizePolicy.Expanding, QSizePolicy.Fixed)
-        self.table.setSizeAdjustPolicy(QAbstractScrollArea.AdjustToContents)
-        self.table.setFrameShape(QFrame.NoFrame)
-        self.table.setFocusPolicy(Qt.NoFocus); self.table.setSelectionMode(QAbstractItemView.NoSelection)
-        self.table.setVerticalScrollBarPolicy(Qt.ScrollBarAlwaysOff); self.table.setHorizontalScrollBarPolicy(Qt.ScrollBarAsNeeded)
+        self.table.setVerticalScrollBarPolicy(Qt.ScrollBarAsNeeded); self.table.setHorizontalScrollBarPolicy(Qt.ScrollBarAsNeeded)
         self.table.verticalHeader().setContextMenuPolicy(Qt.CustomContextMenu)
         self.table.verticalHeader().customContextMenuRequested.connect(self.handle_header_menu)
         self.table.clicked.connect(self.on_cell_clicked)
+        self.table.setContextMenuPolicy(Qt.CustomContextMenu); self.table.customContextMenuRequested.connect(self.handle_cell_menu)
         self.update_table_height()
         grid_layout_inner.addWidget(self.table)
         self.layout.addWidget(self.grid_container)
 
         # 3. STATS CONTROLS
         stats_control_layout = QHBoxLayout()
-        self.stats_title = QLabel("Performance Overview")
+        self.stats_title = QLabel("Performance Overview"); self.stats_title.setObjectName("stats_title")
         self.stats_title.setSizePolicy(QSizePolicy.Fixed, QSizePolicy.Preferred)
-        self.btn_habit_filter = AnimatedButton("Global Overview", "#0EA5E9", is_dropdown=True)
+        self.btn_habit_filter = AnimatedButton("Global Overview", "btn_filter", is_dropdown=True)
         self.habit_menu = QMenu(self)
         self.btn_habit_filter.setMenu(self.habit_menu)
         stats_control_layout.addWidget(self.stats_title)
@@ -530,56 +2226,83 @@ class HabitApp(QWidget):
         
         self.tabs.addTab(self.tab_annual, "Annual Trend"); self.tabs.addTab(self.tab_monthly, "Monthly Breakdown")
         
-        self.chart_container = QFrame(); self.chart_container.setMinimumHeight(450)
+        self.chart_container = QFrame(); self.chart_container.setObjectName("chart_container"); self.chart_container.setMinimumHeight(450)
         chart_main_layout = QVBoxLayout(self.chart_container); chart_main_layout.addWidget(self.tabs)
         self.layout.addWidget(self.chart_container)
         
         # 6. UNDO OVERLAY
-        self.undo_bar = UndoBar(self)
-        self.undo_bar.undoClicked.connect(self.restore_last_deleted)
+        self.undo_bar = UndoBar(self, self.scheduler)
+        self.undo_bar.undoClicked.connect(self.undo); self.undo_bar.redoClicked.connect(self.redo)
+        for keys, slot in ((QKeySequence.Undo, self.undo), (QKeySequence.Redo, self.redo)):
+            action = QAction(self); action.setShortcut(keys); action.triggered.connect(slot); self.addAction(action)
+        self.task_bar = TaskBar(self, self.scheduler); self.file_task = None
+        self.task_bar.cancelClicked.connect(self.cancel_file_task)
 
         self.refresh_habit_menu() 
         # Don't trigger full update yet, wait for charts to lazy load
 
+    def eventFilter(self, obj, event):
+        if event.type() == QEvent.Paint and obj == self.table.viewport() and "first_paint" not in self.startup_marks:
+            self.startup_marks["first_paint"] = time.perf_counter(); obj.removeEventFilter(self)
+            QTimer.singleShot(0, self.on_startup_idle)
+        return super().eventFilter(obj, event)
+
+    def on_startup_idle(self):
+        """First pass of the event loop after the grid painted: the window now takes input."""
+        self.startup_marks["interactive"] = time.perf_counter()
+        if self.profile_startup: self.preloader.finished.connect(self.report_startup)
+        self.preloader.start(); self.maybe_load_charts()
+
+    def maybe_load_charts(self, *_):
+        """Builds the charts once matplotlib is imported and the stats section is on screen."""
+        if self.charts is not None or not self.preloader.done.is_set() or self.chart_container.visibleRegion().isEmpty(): return
+        self.lazy_load_charts()
+
+    def report_startup(self):
+        """--profile-startup: prints the timings as JSON (ms since app.py started executing), then exits.
+        Once the charts are built it waits for show_view to draw their first data, so charts_ready_ms is real."""
+        if self.charts is not None and "charts" not in self.startup_marks: self.startup_report_due = True; return
+        ms = lambda t: round((t - STARTUP_T0) * 1000, 1)
+        report = {"time_to_first_paint_ms": ms(self.startup_marks["first_paint"]), "time_to_interactive_ms": ms(self.startup_marks["interactive"]),
+                  "charts_ready_ms": ms(self.startup_marks["charts"]) if "charts" in self.startup_marks else None,
+                  "import_ms": {k: round(v * 1000, 1) for k, v in IMPORT_TIMES.items()},
+                  "background_import_ms": {k: round(v * 1000, 1) for k, v in self.preloader.timings.items()}}
+        print(json.dumps(report, indent=2)); self.close()
+
     def lazy_load_charts(self):
         """Lazy loads Matplotlib modules to prevent startup freeze."""
-        # Import here to avoid heavy load at startup
-        from matplotlib.backends.backend_qtagg import FigureCanvasQTAgg
-        from matplotlib.figure import Figure
-        
+        if self.charts is not None: return
         # Clear placeholders
         for i in reversed(range(self.lay_annual.count())): 
             self.lay_annual.itemAt(i).widget().setParent(None)
             
-        # Initialize Figures
-        self.fig_annual = Figure(figsize=(8, 3), dpi=100)
-        self.canvas_annual = FigureCanvasQTAgg(self.fig_annual)
-        self.lay_annual.addWidget(self.canvas_annual)
-        
-        self.fig_monthly = Figure(figsize=(8, 3), dpi=100)
-        self.canvas_monthly = FigureCanvasQTAgg(self.fig_monthly)
-        self.lay_monthly.addWidget(self.canvas_monthly)
-        
-        # Setup Axes
-        self.ax_annual = self.fig_annual.add_subplot(111)
-        self.line_annual, = self.ax_annual.plot([], [], linewidth=2)
-        self.fill_annual = None
-        
-        self.ax_monthly = self.fig_monthly.add_subplot(111)
-        self.bars_monthly = self.ax_monthly.bar(range(12), [0]*12)
-        
-        # Labels setup
-        self.bar_labels = []
-        for i in range(12):
-            lbl = self.ax_monthly.text(i, 0, "", ha='center', va='bottom', fontsize=8, fontweight='bold')
-            self.bar_labels.append(lbl)
-
-        self.ax_annual.spines['top'].set_visible(False); self.ax_annual.spines['right'].set_visible(False)
-        self.ax_monthly.spines['top'].set_visible(False); self.ax_monthly.spines['right'].set_visible(False)
-        self.ax_monthly.spines['left'].set_visible(False)
+        self.charts = ChartRenderer(self.tabs, self.tab_annual, self.tab_monthly)
+        self.lay_annual.addWidget(self.charts.canvas_annual); self.lay_monthly.addWidget(self.charts.canvas_monthly)
+        self.charts.apply_theme(THEME_DARK if self.is_dark_mode else THEME_LIGHT)
         
         # Now trigger the first update
-        self.trigger_full_update()
+        self.trigger_full_update() # startup_marks["charts"] is set when its result lands
+
+    # --- IDLE HANDLING ---
+    def on_visibility_changed(self):
+        if self.isVisible() and not self.isMinimized() and QApplication.applicationState() not in (Qt.ApplicationHidden, Qt.ApplicationSuspended): self.scheduler.resume()
+        else: self.scheduler.suspend()
+
+    def on_application_state(self, state): self.on_visibility_changed()
+
+    def changeEvent(self, event):
+        if event.type() == QEvent.WindowStateChange: self.on_visibility_changed()
+        super().changeEvent(event)
+
+    def showEvent(self, event): super().showEvent(event); self.on_visibility_changed()
+    def hideEvent(self, event): super().hideEvent(event); self.on_visibility_changed()
+
+    def report_wakeups(self):
+        """--report-wakeups: prints the last minute's timer firings as one JSON line, then re-arms itself."""
+        counts = self.scheduler.wakeups_per_minute()
+        print(json.dumps({"time": datetime.datetime.now().isoformat(timespec="seconds"), "wakeups_per_minute": sum(counts.values()),
+                          "by_source": counts, "suspended": self.scheduler.suspended, "month_cache": self.month_cache.counters()}), flush=True)
+        self.scheduler.defer("wakeup_report", 60000, self.report_wakeups)
 
     def update_clock(self):
         current_time = datetime.datetime.now().strftime("%H:%M:%S")
@@ -587,63 +2310,47 @@ class HabitApp(QWidget):
 
     def resizeEvent(self, event):
         if self.undo_bar.isVisible(): self.undo_bar.move((self.width() - self.undo_bar.width()) - 40, self.height() - 80)
-        super().resizeEvent(event)
+        if self.task_bar.isVisible(): self.task_bar.move(40, self.height() - 80)
+        super().resizeEvent(event); QTimer.singleShot(0, self.maybe_load_charts)
 
     def change_month(self, delta):
-        new_month = self.view_month + delta; new_year = self.view_year
-        if new_month > 12: new_month = 1; new_year += 1
-        elif new_month < 1: new_month = 12; new_year -= 1
-        self.view_month = new_month; self.view_year = new_year
+        self.view_year, self.view_month = CalendarIndex.shift_month(self.view_year, self.view_month, delta)
         
         self.sanitize_data(self.view_year) # Ensure data exists for new year
         
         self.lbl_month_display.setText(f"{calendar.month_name[self.view_month]} {self.view_year}")
-        new_slice = self.get_month_slice(self.view_year, self.view_month)
-        self.model.update_view(self.view_year, self.view_month, new_slice)
-        self.table.horizontalHeader().setDefaultSectionSize(self.col_width)
+        self.model.update_view(self.view_year, self.view_month)
+        self.table.set_section_sizes(self.row_height, self.col_width)
         self.scroll_to_today_column(); self.trigger_full_update()
 
     def refresh_habit_menu(self):
         self.habit_menu.clear()
         def make_action(text, idx):
             action = QAction(text, self); action.triggered.connect(lambda: self.set_habit_view(idx, text)); return action
-        self.habit_menu.addAction(make_action("Global Overview", None)); self.habit_menu.addSeparator()
+        self.habit_menu.addAction(make_action("Global Overview", None))
+        leaderboard = QAction("🏆 Leaderboard", self); leaderboard.triggered.connect(self.show_leaderboard); self.habit_menu.addAction(leaderboard); self.habit_menu.addSeparator()
         for i, name in enumerate(self.habit_names): self.habit_menu.addAction(make_action(name, i))
 
     def set_habit_view(self, idx, text): self.selected_habit_idx = idx; self.btn_habit_filter.setText(text); self.trigger_full_update()
 
+    def show_leaderboard(self):
+        if not self.habit_names: return
+        self.sanitize_data(self.view_year)
+        model = LeaderboardModel(self.habit_names, self.kpi.leaderboard(self.view_year, self.view_month, datetime.date.today()))
+        d = LeaderboardDialog(self, model, f"Leaderboard: {calendar.month_name[self.view_month]} {self.view_year}", self.is_dark_mode)
+        d.habitChosen.connect(lambda h: self.set_habit_view(h, self.habit_names[h])); d.exec_()
+
     def toggle_theme(self): 
-        self.is_dark_mode = not self.is_dark_mode; self.apply_theme(); self.save_data(); self.trigger_full_update() 
+        self.is_dark_mode = not self.is_dark_mode; self.apply_theme(); self.log_change("theme", v=self.is_dark_mode) # Only colours change; apply_theme redraws the charts
 
     def apply_theme(self):
-        theme = THEME_DARK if self.is_dark_mode else THEME_LIGHT
-        self.setStyleSheet(f"""
-            * {{ font-family: 'Segoe UI', sans-serif; }}
-            QMenu {{ background: {theme['card']}; border: 1px solid {theme['border']}; }}
-            QMenu::item {{ color: {theme['text_primary']}; padding: 6px 20px; }}
-            QMenu::item:selected {{ background: {theme.get('row_odd', '#EEE')}; }}
-            QTabWidget::pane {{ border: 1px solid {theme['border']}; background: {theme['card']}; border-radius: 8px; }}
-            QTabBar::tab {{ background: {theme['bg']}; color: {theme['text_secondary']}; padding: 10px 20px; margin-right: 4px; border-top-left-radius: 6px; border-top-right-radius: 6px; }}
-            QTabBar::tab:selected {{ background: {theme['card']}; color: {theme['text_primary']}; font-weight: bold; }}
-        """)
-        self.container.setStyleSheet(f"background-color: {theme['bg']};"); self.main_scroll.setStyleSheet(f"background-color: {theme['bg']}; border: none;")
-        self.title_lbl.setStyleSheet(f"color: {theme['text_primary']}; font-size: 34px; font-weight: 800;")
-        self.subtitle_lbl.setStyleSheet(f"color: {theme['text_secondary']}; font-size: 18px;")
-        self.stats_title.setStyleSheet(f"color: {theme['text_primary']}; font-size: 26px; font-weight: 800;")
-        nav_style = f"background-color: {theme['btn_nav_bg']}; color: {theme['btn_nav_text']}; border: 1px solid {theme['btn_nav_border']}; border-radius: 8px; font-weight: bold; font-size: 16px;"
-        self.btn_prev_month.setStyleSheet(f"QPushButton {{ {nav_style} }} QPushButton:hover {{ border-color: {theme['text_primary']}; }}")
-        self.btn_next_month.setStyleSheet(f"QPushButton {{ {nav_style} }} QPushButton:hover {{ border-color: {theme['text_primary']}; }}")
-        self.lbl_month_display.setStyleSheet(f"background-color: {theme['date_badge_bg']}; color: {theme['date_badge_text']}; border: 1px solid {theme['date_badge_border']}; border-radius: 8px; font-weight: 700; font-size: 15px;")
-        
-        # CLOCK STYLING
-        self.lbl_clock.setStyleSheet(f"background-color: {theme['clock_bg']}; color: {theme['clock_text']}; border: 1px solid {theme['clock_border']}; border-radius: 8px; font-weight: 700; font-size: 15px;")
-        
-        self.btn_add.update_colors(theme['btn_add'], "#FFFFFF"); self.btn_export.update_colors(theme['btn_export'], "#FFFFFF"); self.btn_habit_filter.update_colors(theme['btn_filter_bg'], theme['btn_filter_text'])
-        self.btn_theme.setText("☀️" if self.is_dark_mode else "🌙"); self.btn_theme.setStyleSheet(f"QPushButton {{ background-color: {theme['card']}; border: 1px solid {theme['border']}; border-radius: 19px; font-size: 16px; }} QPushButton:hover {{ border: 1px solid {theme['text_secondary']}; }}")
-        for c in [self.grid_container, self.chart_container]: c.setStyleSheet(f"background: {theme['card']}; border: 1px solid {theme['border']}; border-radius: 12px;"); c.setGraphicsEffect(None)
-        self.table.setStyleSheet(f"QTableView {{ border: none; background: {theme['card']}; gridline-color: transparent; border-radius: 12px; }} QHeaderView::section {{ background: {theme['card']}; color: {theme['text_primary']}; border: none; border-bottom: 1px solid {theme['border']}; border-right: 1px solid {theme['border']}; padding-left: 10px; }}")
+        # Both sheets are compiled once per theme (theme_sheets), so a switch is two setStyleSheet calls
+        theme = THEME_DARK if self.is_dark_mode else THEME_LIGHT; sheets = theme_sheets(self.is_dark_mode)
+        self.setStyleSheet(sheets["window"]); self.container.setStyleSheet(sheets["container"])
+        self.btn_theme.setText("☀️" if self.is_dark_mode else "🌙")
         self.model.set_theme_mode(self.is_dark_mode)
         for card in [self.card_today, self.card_streak, self.card_weekly, self.card_monthly, self.card_total]: card.apply_theme(self.is_dark_mode)
+        if self.charts is not None: self.charts.apply_theme(theme)
 
     def scroll_to_today_column(self):
         today = datetime.date.today()
@@ -656,8 +2363,8 @@ class HabitApp(QWidget):
         if d.exec_() == QDialog.Accepted:
             n, t = d.get_data()
             if n:
-                self.habit_names[habit_idx] = n; self.habit_times[habit_idx] = t; self.save_data()
-                self.model.headerDataChanged.emit(Qt.Vertical, row, row); self.refresh_habit_menu()
+                old_name, old_time = self.habit_names[habit_idx], self.habit_times[habit_idx]
+                self.set_habit_details(habit_idx, n, t); self.undo_log.record(f"Edit '{n}'", "edit", habit_idx, old_name, old_time, n, t)
 
     def handle_header_menu(self, pos):
         row = self.table.verticalHeader().logicalIndexAt(pos)
@@ -671,171 +2378,272 @@ class HabitApp(QWidget):
             if reply == QMessageBox.Yes: self.delete_habit(habit_idx)
 
     def delete_habit(self, habit_idx):
-        name = self.habit_names[habit_idx]
-        self._last_deleted_habit = { "index": habit_idx, "name": name, "time": self.habit_times[habit_idx], "history": {y: self.history_data[y][habit_idx] for y in self.history_data} }
-        if self.selected_habit_idx == habit_idx: self.selected_habit_idx = None; self.btn_habit_filter.setText("Global Overview")
-        self.habit_names.pop(habit_idx); self.habit_times.pop(habit_idx)
-        for y in self.history_data: self.history_data[y].pop(habit_idx)
-        self.save_data(); new_slice = self.get_month_slice(self.view_year, self.view_month); self.model.update_view(self.view_year, self.view_month, new_slice)
-        self.update_table_height(); self.refresh_habit_menu(); self.trigger_full_update(); self.undo_bar.show_message(f"Deleted '{name}'", is_dark=self.is_dark_mode)
-
-    def restore_last_deleted(self):
-        if not self._last_deleted_habit: return
-        data = self._last_deleted_habit; idx = data["index"]
-        if idx > len(self.habit_names): idx = len(self.habit_names)
-        self.habit_names.insert(idx, data["name"]); self.habit_times.insert(idx, data["time"])
-        for y in self.history_data: row_data = data["history"].get(y, [0] * (366 if calendar.isleap(int(y)) else 365)); self.history_data[y].insert(idx, row_data)
-        self._last_deleted_habit = None; self.undo_bar.hide(); self.save_data()
-        self.sanitize_data(self.view_year)
-        new_slice = self.get_month_slice(self.view_year, self.view_month); self.model.update_view(self.view_year, self.view_month, new_slice)
-        self.update_table_height(); self.refresh_habit_menu(); self.trigger_full_update()
+        name, time_str = self.habit_names[habit_idx], self.habit_times[habit_idx]
+        rows = self.remove_habit(habit_idx)
+        self.undo_log.record(f"Delete '{name}'", "delete", habit_idx, name, time_str, pack_rows(rows))
+        self.undo_bar.show_message(f"Deleted '{name}'", is_dark=self.is_dark_mode)
 
     def add_habit(self):
         d = HabitDialog(self, is_dark=self.is_dark_mode)
         if d.exec_() == QDialog.Accepted:
             n, t = d.get_data()
             if n:
-                self.habit_names.append(n); self.habit_times.append(t)
-                self.sanitize_data(self.view_year) # Adds rows automatically
-                self.save_data(); new_slice = self.get_month_slice(self.view_year, self.view_month); self.model.update_view(self.view_year, self.view_month, new_slice)
-                self.update_table_height(); self.refresh_habit_menu(); self.trigger_full_update()
+                idx = len(self.habit_names); self.insert_habit_at(idx, n, t); self.undo_log.record(f"Add '{n}'", "add", idx, n, t)
+
+    # --- EDIT PRIMITIVES (shared by user actions and undo/redo; each costs O(change)) ---
+    def set_cell(self, year, habit_idx, day, val):
+        self.history_data.ensure(year, len(self.habit_names)); self.history_data.set(year, habit_idx, day, val)
+        if year == self.view_year and self.model.start_idx <= day < self.model.start_idx + self.model.days_in_month:
+            index = self.model.index(habit_idx + 2, day - self.model.start_idx); self.model.dataChanged.emit(index, index)
+        self.on_cell_changed(year, habit_idx, day, val)
+
+    def set_cells(self, year, cells):
+        """Writes (habit, day, value) triples straight into the store; one dataChanged covers the visible ones."""
+        self.history_data.ensure(year, len(self.habit_names))
+        for habit_idx, day, val in cells: self.history_data.set(year, habit_idx, day, val)
+        cols = [day - self.model.start_idx for _, day, _ in cells if 0 <= day - self.model.start_idx < self.model.days_in_month] if year == self.view_year else []
+        if cols:
+            rows = [h + 2 for h, day, _ in cells if 0 <= day - self.model.start_idx < self.model.days_in_month]
+            self.model.dataChanged.emit(self.model.index(min(rows), min(cols)), self.model.index(max(rows), max(cols)), [self.model.BACKGROUND])
+        self.on_cells_changed(year, cells)
+
+    def on_cells_changed(self, year, cells):
+        """One journal record and one stats refresh for a whole batch of cells."""
+        self.log_change("cells", y=year, cells=[list(c) for c in cells])
+        for habit_idx, day, val in cells: self.kpi.apply_toggle(year, habit_idx, day, val)
+        self.update_kpis(); self.scheduler.defer("charts", 300, self.trigger_full_update)
+
+    def on_cell_changed(self, year, habit_idx, day, val):
+        self.log_change("toggle", y=year, h=habit_idx, d=day, v=val); self.kpi.apply_toggle(year, habit_idx, day, val); self.update_kpis(); self.scheduler.defer("charts", 300, self.trigger_full_update)
+
+    def set_habit_details(self, habit_idx, name, time_str):
+        self.habit_names[habit_idx] = name; self.habit_times[habit_idx] = time_str; self.log_change("edit", h=habit_idx, name=name, time=time_str)
+        self.model.headerDataChanged.emit(Qt.Vertical, habit_idx + 2, habit_idx + 2); self.refresh_habit_menu()
+
+    def remove_habit(self, habit_idx):
+        """Removes one model row (no full view reset) and returns the habit's packed rows by year."""
+        self.model.beginRemoveRows(QModelIndex(), habit_idx + 2, habit_idx + 2)
+        rows = self.history_data.pop_habit(habit_idx); self.habit_names.pop(habit_idx); self.habit_times.pop(habit_idx)
+        self.model.endRemoveRows(); self.kpi.remove_habit(habit_idx)
+        if self.selected_habit_idx == habit_idx: self.selected_habit_idx = None; self.btn_habit_filter.setText("Global Overview")
+        elif self.selected_habit_idx is not None and self.selected_habit_idx > habit_idx: self.selected_habit_idx -= 1
+        self.log_change("delete", h=habit_idx); self.on_habits_changed()
+        return rows
+
+    def insert_habit_at(self, habit_idx, name, time_str, rows=None):
+        habit_idx = min(habit_idx, len(self.habit_names))
+        self.model.beginInsertRows(QModelIndex(), habit_idx + 2, habit_idx + 2)
+        self.habit_names.insert(habit_idx, name); self.habit_times.insert(habit_idx, time_str)
+        placed = self.history_data.insert_habit(habit_idx, rows); self.sanitize_data(self.view_year) # Adds the row if the view year was empty
+        self.model.endInsertRows(); self.kpi.insert_habit(habit_idx)
+        if self.selected_habit_idx is not None and self.selected_habit_idx >= habit_idx: self.selected_habit_idx += 1
+        if rows or habit_idx < len(self.habit_names) - 1: self.log_change("insert", h=habit_idx, name=name, time=time_str, rows={str(y): row.hex() if row is not None else None for y, row in placed.items()})
+        else: self.log_change("add", name=name, time=time_str)
+        self.on_habits_changed()
+
+    def on_habits_changed(self):
+        self.update_table_height(); self.refresh_habit_menu(); self.trigger_full_update()
+
+    def replace_state(self, names, times, history):
+        """Swaps in a whole dataset (restore, import and their undo/redo): one model reset, fresh aggregates, one full save."""
+        self.model.beginResetModel()
+        self.habit_names[:] = names; self.habit_times[:] = times; self.history_data = self.model._history = history; self.month_cache = MonthViewCache()
+        while len(self.habit_times) < len(self.habit_names): self.habit_times.append("Any Time")
+        self.sanitize_data(self.view_year); self.model.endResetModel()
+        if self.selected_habit_idx is not None and self.selected_habit_idx >= len(self.habit_names): self.selected_habit_idx = None; self.btn_habit_filter.setText("Global Overview")
+        self.update_table_height(); self.refresh_habit_menu(); self.rebuild_aggregates(); self.trigger_full_update(); self.save_data(full=True)
+
+    def record_state_change(self, label, before):
+        """One undo step for a restore or import, holding the dataset from before and after it."""
+        if self.undo_log.record(label, "state", before, pack_state(self.habit_names, self.habit_times, self.history_data)): self.show_undo_state(label)
+        else: self.undo_bar.show_message(f"{label} (too large to undo)", is_dark=self.is_dark_mode, can_undo=False, can_redo=False)
+
+    # --- UNDO / REDO ---
+    def undo(self):
+        rec = self.undo_log.undo()
+        if rec is not None: self.apply_record(rec, reverse=True); self.show_undo_state(f"Undid: {rec[0]}")
+
+    def redo(self):
+        rec = self.undo_log.redo()
+        if rec is not None: self.apply_record(rec, reverse=False); self.show_undo_state(f"Redid: {rec[0]}")
+
+    def show_undo_state(self, text):
+        self.undo_bar.show_message(text, is_dark=self.is_dark_mode, can_undo=self.undo_log.can_undo(), can_redo=self.undo_log.can_redo())
+
+    def apply_record(self, rec, reverse):
+        """Replays an UndoLog record forwards (redo) or backwards (undo)."""
+        _, op, *f = rec
+        if op == "toggle":
+            year, habit_idx, day, val = f; self.set_cell(year, habit_idx, day, 1 - val if reverse else val)
+        elif op == "cells":
+            year, blob = f; cells = np.frombuffer(blob, dtype=np.int32).reshape(-1, 3).tolist()
+            self.set_cells(year, [(h, d, 1 - v) for h, d, v in cells] if reverse else cells)
+        elif op == "edit":
+            habit_idx, old_name, old_time, new_name, new_time = f
+            self.set_habit_details(habit_idx, *((old_name, old_time) if reverse else (new_name, new_time)))
+        elif op == "add":
+            habit_idx, name, time_str = f
+            if reverse: self.remove_habit(habit_idx)
+            else: self.insert_habit_at(habit_idx, name, time_str)
+        elif op == "delete":
+            habit_idx, name, time_str, blob = f
+            if reverse: self.insert_habit_at(habit_idx, name, time_str, unpack_rows(blob))
+            else: self.undo_log.amend(habit_idx, name, time_str, pack_rows(self.remove_habit(habit_idx)))  # rows may have loaded since
+        elif op == "state":
+            self.replace_state(*unpack_state(f[0] if reverse else f[1]))
 
     def update_table_height(self):
-        total_rows = len(self.habit_names) + 2
+        # Grows with the habit list up to GRID_VISIBLE_HABITS rows, then the grid scrolls instead
+        total_rows = min(len(self.habit_names), GRID_VISIBLE_HABITS) + HabitGrid.HEADER_ROWS
         scrollbar_height = self.style().pixelMetric(QStyle.PM_ScrollBarExtent)
         h = (total_rows * self.row_height) + scrollbar_height + 2
         self.table.setFixedHeight(h)
 
-    def on_cell_clicked(self, index): self.model.toggle(index)
+    def on_cell_clicked(self, index):
+        # A plain click ticks one cell; Ctrl/Shift clicks only grow the selection for a range edit
+        if QApplication.keyboardModifiers() & (Qt.ControlModifier | Qt.ShiftModifier): return
+        self.table.clearSelection(); self.model.toggle(index)
+
+    def handle_cell_menu(self, pos):
+        blocks = [(r.top(), r.left(), r.bottom(), r.right()) for r in self.table.selectionModel().selection()]
+        if not blocks:
+            index = self.table.indexAt(pos)
+            if not index.isValid(): return
+            blocks = [(index.row(), index.column(), index.row(), index.column())]
+        menu = QMenu(self); actions = {menu.addAction("✅ Fill"): "fill", menu.addAction("⬜ Clear"): "clear", menu.addAction("🔁 Invert"): "invert"}
+        mode = actions.get(menu.exec_(self.table.viewport().mapToGlobal(pos)))
+        if mode: self.edit_range(blocks, mode)
+
+    def edit_range(self, blocks, mode):
+        """Range edit: one write per habit row, one dataChanged, one journal record, one stats refresh, one undo step."""
+        year = self.view_year; changed = self.model.write_blocks(blocks, mode)
+        cells = [(h, d, self.history_data.get(year, h, d)) for h, diff in sorted(changed.items()) for d in HistoryStore._iter_bits(diff)]
+        if not cells: return
+        self.on_cells_changed(year, cells); self.table.clearSelection()
+        self.undo_log.record(f"{mode.capitalize()} {len(cells)} cells", "cells", year, np.array(cells, dtype=np.int32).tobytes())
     def on_data_toggled(self, habit_idx, col_in_month):
-        start_of_month_idx = datetime.date(self.view_year, self.view_month, 1).timetuple().tm_yday - 1; global_idx = start_of_month_idx + col_in_month
-        val = self.model._month_data[habit_idx][col_in_month]; self.history_data[str(self.view_year)][habit_idx][global_idx] = val
-        self.save_data(); self.update_kpis(); self.chart_update_timer.start(300)
+        # HabitModel writes straight into history_data, only persistence, stats and undo are left here
+        day = self.model.start_idx + col_in_month; val = self.history_data.get(self.view_year, habit_idx, day)
+        self.undo_log.record(f"{'Tick' if val else 'Untick'} '{self.habit_names[habit_idx]}' on {CalendarIndex.of(self.view_year).iso[day]}", "toggle", self.view_year, habit_idx, day, val)
+        self.on_cell_changed(self.view_year, habit_idx, day, val)
+
+    def log_change(self, op, **fields):
+        """Persists a single edit through the storage backend (a journal line or one SQL transaction)."""
+        if self.storage.log(op, **fields): self.save_data()
 
     # --- SAVE/RESTORE WINDOW STATE LOGIC ---
-    def save_data(self):
-        # 1. Capture current window state
-        geo = self.saveGeometry().toBase64().data().decode()
-        is_max = self.isMaximized()
-        
-        data = { 
+    def snapshot_state(self):
+        return {
             "names": self.habit_names, 
             "times": self.habit_times, 
             "history": self.history_data, 
             "theme": self.is_dark_mode,
-            "window_geometry": geo,
-            "window_maximized": is_max
+            "window_geometry": self.saveGeometry().toBase64().data().decode(),
+            "window_maximized": self.isMaximized()
         }
-        with open(DATA_FILE, "w") as f: json.dump(data, f)
+
+    def save_data(self, full=False):
+        """Hands the current state to the storage backend; `full` rewrites everything, not just settings."""
+        self.storage.save(self.snapshot_state(), full)
 
     def closeEvent(self, event):
         # This ensures state is saved when user clicks X
-        self.save_data()
+        self.cancel_file_task(); self.view_generation += 1; self.stats_pool.clear(); self.stats_pool.waitForDone(); QThreadPool.globalInstance().waitForDone()
+        self.save_data(); self.storage.close() # Blocks until everything is committed
         event.accept()
 
     def backup_data(self):
         path, _ = QFileDialog.getSaveFileName(self, "Backup", f"Habit_Backup_{datetime.date.today()}.json", "JSON (*.json)")
         if path:
-            self.save_data() # Ensure current state is saved first
-            with open(DATA_FILE, "r") as src, open(path, "w") as dst:
-                dst.write(src.read())
+            self.storage.flush() # Ensure pending writes have landed first
+            write_json_atomic(path, self.snapshot_state())
 
     def restore_data(self):
         path, _ = QFileDialog.getOpenFileName(self, "Restore", "", "JSON (*.json)")
-        if path:
-            try:
-                with open(path, "r") as f:
-                    d = json.load(f); self.habit_names = d.get("names", []); self.habit_times = d.get("times", []); self.is_dark_mode = d.get("theme", False)
-                    raw = d.get("data", []); self.history_data = {"2026": raw} if raw and isinstance(raw[0], list) else d.get("history", {})
-                    self.sanitize_data(self.view_year)
-                    self.model.update_view(self.view_year, self.view_month, self.get_month_slice(self.view_year, self.view_month))
-                    self.update_table_height(); self.apply_theme(); self.save_data(); self.refresh_habit_menu()
-            except: pass
+        if not path: return
+        try:  # Parse and validate everything first, so a bad file changes nothing
+            with open(path, "r") as f: d = json.load(f)
+            if not isinstance(d, dict): raise ValueError("not a habit backup")
+            names, times = d.get("names", []), d.get("times", [])
+            if not all(isinstance(v, list) and all(isinstance(s, str) for s in v) for v in (names, times)): raise ValueError("names and times must be lists of text")
+            raw = d.get("data", []); history = {"2026": raw} if raw and isinstance(raw[0], list) else d.get("history", {})
+            if not isinstance(history, dict): raise ValueError("history must map years to rows")
+            history = HistoryStore.from_json(history)
+        except (OSError, ValueError, KeyError, TypeError) as e:
+            QMessageBox.warning(self, "Restore", f"Could not restore from {os.path.basename(path)}:\n{e}"); return
+        before = pack_state(self.habit_names, self.habit_times, self.history_data)
+        self.is_dark_mode = bool(d.get("theme", False)); self.apply_theme()
+        self.replace_state(names, times, history); self.record_state_change("Restore backup", before)
+
+    def rebuild_aggregates(self):
+        """Drops the incremental KPI state; needed after structural changes (add/delete/restore)."""
+        self.kpi = KpiAggregates(self.history_data, len(self.habit_names))
 
     def calculate_stats(self, habit_idx=None):
-        n = len(self.habit_names)
-        if n == 0: return {}
-        
-        # --- 1. SET DATE ANCHORS ---
-        real_today = datetime.date.today()
-        
-        # ref_date follows the UI navigation for Monthly, Total, and Streak cards
-        if self.view_year == real_today.year and self.view_month == real_today.month:
-            ref_date = real_today
-        else:
-            last_day = calendar.monthrange(self.view_year, self.view_month)[1]
-            ref_date = datetime.date(self.view_year, self.view_month, last_day)
-
-        # Helper to fetch data safely across different years/months
-        def get_val_on_date(d, h_idx):
-            y_str = str(d.year)
-            # Ensure data exists for the year of the date being checked
-            if y_str not in self.history_data: self.sanitize_data(d.year)
-            
-            day_idx = d.timetuple().tm_yday - 1
-            year_data = self.history_data[y_str]
-            
-            # Bounds check for the day_idx (handles leap years vs non-leap years)
-            if day_idx < 0 or day_idx >= len(year_data[0]):
-                return 0
-
-            if h_idx is None:
-                return sum(year_data[r][day_idx] for r in range(n)) / n if n > 0 else 0
-            return year_data[h_idx][day_idx]
-
-        # --- 2. TODAY CARD (LOCKED TO REAL-WORLD TODAY) ---
-        today_score = get_val_on_date(real_today, habit_idx)
-        today_display = f"{int(today_score * 100)}%"
-
-        # --- 3. WEEKLY AVG (LOCKED TO CURRENT REAL WEEK) ---
-        days_since_monday = real_today.weekday()
-        current_week_vals = []
-        for i in range(days_since_monday + 1):
-            check_date = real_today - datetime.timedelta(days=days_since_monday - i)
-            current_week_vals.append(get_val_on_date(check_date, habit_idx))
-        
-        weekly_avg = int((sum(current_week_vals) / len(current_week_vals)) * 100) if current_week_vals else 0
-
-        # --- 4. MONTHLY AVG (ADAPTIVE TO UI NAVIGATION) ---
-        monthly_vals = []
-        # Calculate from day 1 of viewed month up to the reference date
-        for i in range(1, ref_date.day + 1):
-            check_date = datetime.date(self.view_year, self.view_month, i)
-            monthly_vals.append(get_val_on_date(check_date, habit_idx))
-            
-        monthly_avg = int((sum(monthly_vals) / len(monthly_vals)) * 100) if monthly_vals else 0
-
-        # --- 5. TOTAL & STREAK (ADAPTIVE TO UI NAVIGATION) ---
+        return self.kpi.stats(habit_idx, self.view_year, self.view_month, datetime.date.today())
+    def trigger_full_update(self):
+        """Shows the KPI cards and charts for the current view: from month_cache when it has them, otherwise
+        computed on stats_pool. Every call starts a new generation: tasks still queued for older views are
+        dropped and results that land late are ignored."""
+        self.view_generation += 1; self.stats_pool.clear()
+        n = len(self.habit_names); habit_idx = self.selected_habit_idx
         self.sanitize_data(self.view_year)
-        curr_year_data = self.history_data[str(self.view_year)]
-        
-        # Total tasks/days for the viewed year
-        if habit_idx is None:
-            total_count = sum(sum(row) for row in curr_year_data)
-        else:
-            total_count = sum(curr_year_data[habit_idx])
-
-        # Best streak in the viewed year up to the reference date
-        streak = 0; curr = 0
-        ref_idx_limit = ref_date.timetuple().tm_yday
-        for c in range(ref_idx_limit):
-            success = all(curr_year_data[r][c] == 1 for r in range(n)) if habit_idx is None else curr_year_data[habit_idx][c] == 1
-            if success:
-                curr += 1
-                streak = max(streak, curr)
-            else:
-                curr = 0
+        if n == 0 or (habit_idx is not None and habit_idx >= self.history_data.row_count(self.view_year)): return
+        key = self.view_key(self.view_year, self.view_month); cached = self.month_cache.get(key, need_series=self.charts is not None)
+        if cached is not None: self.show_view(cached); return
+        self.stats_task = self.stats_task_for(key, self.view_generation, self.is_current_view)
+        self.stats_task.signals.finished.connect(self.on_view_computed); self.stats_task.signals.failed.connect(self.on_view_failed)
+        self.stats_pool.start(self.stats_task)
+
+    def view_key(self, year, month):
+        return (year, month, self.selected_habit_idx, datetime.date.today(), self.history_data.version)
+
+    def stats_task_for(self, key, generation, is_current):
+        """StatsTask over a copy of just the years the view reads (its own, and the real week's)."""
+        year, _, _, today, _ = key; years = {year, today.year, (today - datetime.timedelta(days=today.weekday())).year}
+        return StatsTask(key, generation, is_current, self.history_data.copy(years), len(self.habit_names), charts=self.charts is not None)
+
+    def is_current_view(self, generation): return generation == self.view_generation  # polled from the worker
+    def is_current_version(self, version): return version == self.history_data.version  # polled from the worker
+
+    def on_view_computed(self, result):
+        if self.is_current_version(result["key"][-1]): self.month_cache.put(result["key"], result["stats"], result["series"])
+        if result["generation"] != self.view_generation: return # The view changed (or was edited) while this was computing
+        self.show_view(result)
+
+    def show_view(self, view):
+        self.show_stats(view["stats"])
+        if view["series"] is not None:
+            self.show_series(view["series"]); self.startup_marks.setdefault("charts", time.perf_counter())
+            if self.startup_report_due: self.startup_report_due = False; self.report_startup()
+        self.scheduler.defer("prefetch", 250, self.prefetch_neighbours)
+
+    def prefetch_neighbours(self):
+        """Idle job: computes the months either side of the view into month_cache, behind any real request."""
+        if self.charts is None or not self.habit_names: return
+        version = self.history_data.version; self.prefetch_tasks = []
+        for delta in (1, -1):
+            key = self.view_key(*CalendarIndex.shift_month(self.view_year, self.view_month, delta))
+            if key in self.month_cache: continue
+            task = self.stats_task_for(key, version, self.is_current_version)  # an edit makes it stop early
+            task.signals.finished.connect(self.on_prefetched); self.prefetch_tasks.append(task); self.stats_pool.start(task)
+
+    def on_prefetched(self, result):
+        if self.is_current_version(result["generation"]): self.month_cache.put(result["key"], result["stats"], result["series"])
+
+    def on_view_failed(self, generation, message):
+        """Falls back to computing the view on the UI thread; failures of views already left are dropped."""
+        if generation != self.view_generation: return
+        self.update_kpis(); self.update_charts_data_only()
+        if message != self.stats_error:  # one dialog per distinct error, not one per month paged through
+            self.stats_error = message
+            QMessageBox.warning(self, "Dashboard", f"The dashboard could not be updated in the background:\n{message}\n\nIt was computed directly instead.")
 
-        return {
-            "today": today_display,       # Always real-world today
-            "streak": f"{streak} Days",   # Context-aware best streak
-            "weekly": f"{weekly_avg}%",   # Always real-world week
-            "monthly": f"{monthly_avg}%", # Context-aware month avg
-            "total": str(total_count)     # Context-aware year total
-        }
-    def trigger_full_update(self): self.update_kpis(); self.update_charts_data_only()
     def update_kpis(self):
-        stats = self.calculate_stats(self.selected_habit_idx)
+        """Synchronous KPI refresh from the incremental aggregates, for edits; supersedes in-flight view results."""
+        self.view_generation += 1; self.show_stats(self.calculate_stats(self.selected_habit_idx))
+
+    def show_stats(self, stats):
         if not stats: return
 
         # --- MODIFIED SECTION START ---
@@ -848,92 +2656,86 @@ class HabitApp(QWidget):
 
         self.card_today.set_value(stats["today"]); self.card_streak.set_value(stats["streak"]); self.card_weekly.set_value(stats["weekly"]); self.card_monthly.set_value(stats["monthly"]); self.card_total.set_value(stats["total"])
     def update_charts_data_only(self):
-        if not hasattr(self, 'ax_annual'): return # Charts not yet loaded
+        if self.charts is None: return # Charts not yet loaded
         
-        target_habit_idx = self.selected_habit_idx; n = len(self.habit_names); theme = THEME_DARK if self.is_dark_mode else THEME_LIGHT
+        target_habit_idx = self.selected_habit_idx; n = len(self.habit_names)
         
         # SAFEGUARD: Ensure data exists and is valid size
         self.sanitize_data(self.view_year)
-        current_data = self.history_data[str(self.view_year)]
-        days_in_year = len(current_data[0])
-        
-        if target_habit_idx is not None:
-            if target_habit_idx >= len(current_data): return 
-            daily_avgs = [current_data[target_habit_idx][c] * 100 for c in range(days_in_year)]
-            chart_title = f"Consistency Trend: {self.habit_names[target_habit_idx]} ({self.view_year})"
-        else:
-            daily_avgs = [sum(current_data[r][c] for r in range(n))/n*100 if n > 0 else 0 for c in range(days_in_year)]
-            chart_title = f"Consistency Trend: Global ({self.view_year})"
-        
-        self.line_annual.set_data(range(days_in_year), daily_avgs); self.line_annual.set_color(theme['chart_line'])
-        self.ax_annual.set_title(chart_title, color=theme['text_primary'], fontsize=10, weight='bold', pad=10)
-        self.ax_annual.set_ylim(0, 105); self.ax_annual.set_xlim(0, days_in_year)
-        self.ax_annual.set_ylabel("Completion Rate (%)", color=theme['text_secondary'], fontsize=9)
-        self.ax_annual.tick_params(axis='x', colors=theme['text_secondary']); self.ax_annual.tick_params(axis='y', colors=theme['text_secondary'])
-        self.ax_annual.spines['bottom'].set_color(theme['border']); self.ax_annual.spines['left'].set_color(theme['border'])
-        self.fig_annual.patch.set_facecolor(theme['chart_bg']); self.ax_annual.set_facecolor(theme['chart_bg'])
-        
-        if self.fill_annual: self.fill_annual.remove()
-        fill_rgba = tuple(int(theme['chart_fill'].lstrip('#')[i:i+2], 16)/255. for i in (0, 2, 4)) + (0.15,)
-        self.fill_annual = self.ax_annual.fill_between(range(days_in_year), daily_avgs, color=fill_rgba)
-        
-        month_starts = [datetime.date(self.view_year, m, 1).timetuple().tm_yday - 1 for m in range(1, 13)]
-        self.ax_annual.set_xticks(month_starts); self.ax_annual.set_xticklabels([calendar.month_abbr[m] for m in range(1, 13)], rotation=0, fontsize=8)
-        self.canvas_annual.draw_idle()
-
-        monthly_data = {}
-        for c in range(days_in_year):
-            d_date = datetime.date(self.view_year, 1, 1) + datetime.timedelta(days=c); m = d_date.month
-            if m not in monthly_data: monthly_data[m] = []
-            if target_habit_idx is not None: monthly_data[m].append(current_data[target_habit_idx][c] * 100)
-            else: monthly_data[m].append(sum(current_data[r][c] for r in range(n))/n*100 if n > 0 else 0)
-        
-        month_avgs = [sum(monthly_data[m])/len(monthly_data[m]) if m in monthly_data else 0 for m in range(1, 13)]
-        
-        for bar, h, lbl in zip(self.bars_monthly, month_avgs, self.bar_labels):
-            bar.set_height(h); bar.set_color(theme['chart_bar'])
-            if h > 1: lbl.set_text(f"{int(h)}%"); lbl.set_y(h + 2); lbl.set_color(theme['text_primary']); lbl.set_visible(True)
-            else: lbl.set_visible(False)
-            
-        self.ax_monthly.set_title(f"Success Rate by Month ({self.view_year})", color=theme['text_primary'], fontsize=10, weight='bold', pad=10)
-        self.ax_monthly.set_ylabel("Average (%)", color=theme['text_secondary'], fontsize=9)
-        self.ax_monthly.tick_params(axis='x', colors=theme['text_secondary']); self.ax_monthly.tick_params(axis='y', colors=theme['text_secondary'])
-        self.ax_monthly.spines['bottom'].set_color(theme['border']); self.fig_monthly.patch.set_facecolor(theme['chart_bg']); self.ax_monthly.set_facecolor(theme['chart_bg'])
-        self.ax_monthly.set_xticks(range(12)); self.ax_monthly.set_xticklabels([calendar.month_abbr[m] for m in range(1, 13)]); self.ax_monthly.set_ylim(0, 115)
-        self.canvas_monthly.draw_idle()
+        if n == 0 or (target_habit_idx is not None and target_habit_idx >= self.history_data.row_count(self.view_year)): return 
+        self.show_series(self.kpi.chart_series(self.view_year, target_habit_idx))
+
+    def show_series(self, series):
+        target_habit_idx = self.selected_habit_idx
+        if target_habit_idx is not None: chart_title = f"Consistency Trend: {self.habit_names[target_habit_idx]} ({self.view_year})"
+        else: chart_title = f"Consistency Trend: Global ({self.view_year})"
+        self.charts.update(self.view_year, series, chart_title)
 
     def export_csv(self):
-        path, _ = QFileDialog.getSaveFileName(self, "Save CSV", f"Habits_{self.view_year}.csv", "CSV (*.csv)")
-        if path:
-            current_data = self.history_data[str(self.view_year)]
-            with open(path, "w", newline="") as f:
-                writer = csv.writer(f); writer.writerow(["--- HABIT DATA ---"]); writer.writerow(["Date"] + [f"{n}" for n in self.habit_names]); start = datetime.date(self.view_year, 1, 1)
-                for i in range(len(current_data[0])): d = start + datetime.timedelta(days=i); row = [d.strftime("%Y-%m-%d")] + ["Yes" if current_data[r][i] else "No" for r in range(len(self.habit_names))]; writer.writerow(row)
-            QMessageBox.information(self, "Export", "CSV saved successfully!")
-
-    def export_pdf(self):
-        # LAZY IMPORT REPORTLAB
-        from reportlab.lib.pagesizes import letter; from reportlab.pdfgen import canvas
-        path, _ = QFileDialog.getSaveFileName(self, "Save PDF", f"Habit_Report_{self.view_year}.pdf", "PDF (*.pdf)")
+        if self.file_task is not None: return # One background file job at a time
+        d = ExportDialog(self, self.habit_names, self.view_year, self.is_dark_mode)
+        if d.exec_() != QDialog.Accepted: return
+        opts = d.get_options(); first, last = opts["first"], opts["last"]
+        name = f"Habits_{first.year}" if first.year == last.year else f"Habits_{first.year}-{last.year}"
+        if opts["compress"]: path, _ = QFileDialog.getSaveFileName(self, "Save CSV", f"{name}.csv.gz", "Gzipped CSV (*.csv.gz)")
+        else: path, _ = QFileDialog.getSaveFileName(self, "Save CSV", f"{name}.csv", "CSV (*.csv)")
         if not path: return
-        try:
-            stats = self.calculate_stats(self.selected_habit_idx)
-            self.fig_annual.savefig("temp_annual.png", facecolor=self.fig_annual.get_facecolor(), dpi=150)
-            self.fig_monthly.savefig("temp_monthly.png", facecolor=self.fig_monthly.get_facecolor(), dpi=150)
-            c = canvas.Canvas(path, pagesize=letter); w, h = letter
-            c.setFont("Helvetica-Bold", 24); c.drawString(50, h-50, f"Habit Report {self.view_year}")
-            subtitle = "Global Overview" if self.selected_habit_idx is None else self.habit_names[self.selected_habit_idx]
-            c.setFont("Helvetica", 12); y_text = h - 90; c.drawString(50, y_text, f"• Report: {subtitle}")
-            y_start = h - 120; c.drawString(50, y_start, f"• Today's Completion: {stats.get('today', 'N/A')}"); c.drawString(300, y_start, f"• Best Streak: {stats.get('streak', 'N/A')}")
-            y_start -= 25; c.drawString(50, y_start, f"• Weekly Average: {stats.get('weekly', 'N/A')}"); c.drawString(300, y_start, f"• Monthly Average: {stats.get('monthly', 'N/A')}")
-            y_start -= 25; c.drawString(50, y_start, f"• Total Completions: {stats.get('total', 'N/A')}")
-            c.drawImage("temp_annual.png", 50, h-400, width=500, height=200, preserveAspectRatio=True); c.drawImage("temp_monthly.png", 50, h-650, width=500, height=200, preserveAspectRatio=True)
-            c.save()
-            if os.path.exists("temp_annual.png"): os.remove("temp_annual.png")
-            if os.path.exists("temp_monthly.png"): os.remove("temp_monthly.png")
-            QMessageBox.information(self, "Export", "PDF saved successfully!")
-        except Exception as e: QMessageBox.critical(self, "Error", str(e))
+        # The worker gets a private copy of just the exported years, so editing can go on meanwhile
+        history = self.history_data.copy(range(first.year, last.year + 1))
+        self.start_file_task(ExportTask(write_csv, path, history, list(self.habit_names), opts["habits"], first, last, long=opts["long"], compress=opts["compress"]),
+                             "Exporting CSV…", self.on_export_finished); self.export_done_text = "CSV saved."
+
+    def export_pdf(self, all_habits=False):
+        if self.file_task is not None: return # One background file job at a time
+        if not self.habit_names: QMessageBox.information(self, "Export PDF", "Add a habit before exporting a report."); return
+        name = f"Habit_Report_{self.view_year}_All" if all_habits else f"Habit_Report_{self.view_year}"
+        path, _ = QFileDialog.getSaveFileName(self, "Save PDF", f"{name}.pdf", "PDF (*.pdf)")
+        if not path: return
+        # Stats read the viewed year plus the real today and its week, which may fall in other years
+        today = datetime.date.today(); years = {self.view_year, today.year, (today - datetime.timedelta(days=today.weekday())).year}
+        self.start_file_task(ExportTask(write_pdf, path, self.history_data.copy(years), list(self.habit_names), self.view_year, self.view_month,
+                                        self.selected_habit_idx, all_habits, THEME_DARK if self.is_dark_mode else THEME_LIGHT, today),
+                             "Building PDF…", self.on_export_finished); self.export_done_text = "PDF saved."
+
+    def start_file_task(self, task, text, on_finished):
+        """Runs an export/import task on the thread pool with the progress strip; one at a time."""
+        self.file_task = task
+        task.signals.progress.connect(self.task_bar.set_progress); task.signals.finished.connect(on_finished); task.signals.failed.connect(self.on_file_task_failed)
+        self.task_bar.start(text, self.is_dark_mode); QThreadPool.globalInstance().start(task)
+
+    def cancel_file_task(self):
+        if self.file_task is not None: self.file_task.cancel.set()
+
+    def on_export_finished(self, path):
+        self.file_task = None; self.task_bar.finish(self.export_done_text if path else "Export cancelled.")
+
+    def on_file_task_failed(self, message):
+        self.file_task = None; self.task_bar.hide(); QMessageBox.critical(self, "Error", message)
+
+    def import_data(self):
+        if self.file_task is not None: return # One background file job at a time
+        path, _ = QFileDialog.getOpenFileName(self, "Import", "", "Habit data (*.csv *.json *.jsonl *.ndjson *.gz);;All files (*)")
+        if path: self.start_file_task(ImportTask(path, list(self.habit_names)), "Reading import…", self.on_import_read)
+
+    def on_import_read(self, plan):
+        self.file_task = None
+        if plan is None: self.task_bar.finish("Import cancelled."); return
+        self.task_bar.hide()
+        if self.habit_names != plan.names[:plan.n_existing]: QMessageBox.warning(self, "Import", "Habits changed while the file was read. Please import again."); return
+        cells, changes, conflicts = plan.compare(self.history_data)
+        new = plan.new_habits; years = sorted(plan.staged)
+        summary = (f"Records read: {plan.records:,} ({plan.skipped:,} skipped)\n"
+                   f"Days covered: {cells:,} across {len(years)} year(s){f' ({years[0]}–{years[-1]})' if years else ''}\n"
+                   f"New habits: {len(new)}{': ' + ', '.join(new[:5]) + (' …' if len(new) > 5 else '') if new else ''}\n"
+                   f"Days that will change: {changes:,}\n"
+                   f"Conflicts (completed days the file marks not done): {conflicts:,}")
+        if not changes and not new: QMessageBox.information(self, "Import", summary + "\n\nNothing to import."); return
+        if QMessageBox.question(self, "Import", summary + "\n\nApply this import?", QMessageBox.Yes | QMessageBox.No) != QMessageBox.Yes: return
+        # One model reset and one full save for the whole import, however many cells it touches
+        before = pack_state(self.habit_names, self.habit_times, self.history_data)
+        names, times = list(self.habit_names), list(self.habit_times); plan.apply(names, times, self.history_data)
+        self.replace_state(names, times, self.history_data); self.record_state_change("Import", before)
 
 if __name__ == "__main__":
     app = QApplication(sys.argv); app.setFont(QFont("Segoe UI", 10))
-    window = HabitApp(); window.show(); sys.exit(app.exec())
\ No newline at end of file
+    window = HabitApp(profile_startup="--profile-startup" in sys.argv, report_wakeups="--report-wakeups" in sys.argv); window.show(); sys.exit(app.exec())
\ No newline at end of file
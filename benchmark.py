@@ -0,0 +1,169 @@
+"""Headless benchmark for the Habit Dashboard hot paths.
+
+Generates synthetic habit_data.json datasets (habits x years x density), times the app's hot paths
+under the offscreen Qt platform and writes a JSON report. Pass --compare with an earlier report to
+flag regressions.
+
+    python benchmark.py                                   # 10/100/1000 habits x 1/5/20 years
+    python benchmark.py --habits 100 --years 5 --out after.json --compare before.json
+"""
+import sys, os, json, time, argparse, tempfile, shutil, platform, statistics, datetime, calendar, importlib, importlib.util
+
+def parse_args(argv=None):
+    p = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    ints = lambda s: [int(v) for v in s.split(",")]; floats = lambda s: [float(v) for v in s.split(",")]
+    p.add_argument("--habits", type=ints, default=[10, 100, 1000], help="comma-separated habit counts")
+    p.add_argument("--years", type=ints, default=[1, 5, 20], help="comma-separated history lengths in years")
+    p.add_argument("--density", type=floats, default=[0.5], help="mean completion rate(s); each habit varies around it")
+    p.add_argument("--repeat", type=int, default=5, help="timed runs per measurement (min and median are reported)")
+    p.add_argument("--backend", default="shards", choices=["shards", "json", "sqlite"], help="storage backend (HABIT_STORAGE)")
+    p.add_argument("--seed", type=int, default=0)
+    p.add_argument("--out", default="benchmark_report.json", help="where to write the JSON report")
+    p.add_argument("--compare", help="earlier report to compare against")
+    p.add_argument("--threshold", type=float, default=1.25, help="median slowdown ratio counted as a regression")
+    p.add_argument("--min-delta", type=float, default=0.5, help="ignore slowdowns smaller than this many ms (timer noise)")
+    return p.parse_args(argv)
+
+def make_dataset(path, n_habits, n_years, density, seed):
+    """Writes a habit_data.json with per-habit completion rates spread around `density`."""
+    import numpy as np
+    rng = np.random.default_rng(seed); last = datetime.date.today().year
+    rates = np.clip(density * rng.uniform(0.25, 1.75, n_habits), 0.0, 1.0)
+    history = {}
+    for year in range(last - n_years + 1, last + 1):
+        days = 366 if calendar.isleap(year) else 365
+        history[str(year)] = (rng.random((n_habits, days)) < rates[:, None]).astype(np.uint8).tolist()
+    data = {"names": [f"Habit {i + 1}" for i in range(n_habits)], "times": ["Any Time"] * n_habits, "theme": False, "history": history}
+    with open(path, "w") as f: json.dump(data, f)
+
+def measure(fn, repeat, setup=None):
+    """Runs fn `repeat` times (after an optional per-run setup) and returns min/median in ms."""
+    samples = []
+    for _ in range(repeat):
+        if setup: setup()
+        t = time.perf_counter(); fn(); samples.append((time.perf_counter() - t) * 1000)
+    return {"min": round(min(samples), 3), "median": round(statistics.median(samples), 3)}
+
+def run_case(app, qa, n_habits, n_years, density, args):
+    make_dataset(app.DATA_FILE, n_habits, n_years, density, args.seed)
+    timings = {}; w = app.HabitApp()  # first start migrates habit_data.json into the chosen backend
+    year, month = w.view_year, w.view_month; years = list(range(year - n_years + 1, year + 1))
+
+    def reload():
+        w.storage.close(); w.init_data()
+    timings["init_data"] = measure(reload, args.repeat)
+    w.close(); w = app.HabitApp(); w.resize(1350, 950); w.show(); qa.processEvents()
+
+    def touch_all_years():
+        for y in years: w.sanitize_data(y)
+    timings["sanitize_data_cold"] = measure(touch_all_years, 1)  # first touch loads lazily stored years
+    timings["sanitize_data"] = measure(lambda: w.sanitize_data(year), args.repeat)
+    timings["calculate_stats_cold"] = measure(lambda: (w.rebuild_aggregates(), w.calculate_stats(None)), args.repeat)  # aggregates build lazily
+    timings["calculate_stats_global"] = measure(lambda: w.calculate_stats(None), args.repeat)
+    timings["calculate_stats_habit"] = measure(lambda: w.calculate_stats(0), args.repeat)
+    clear_series = lambda: w.kpi._series_cache.clear()
+    timings["chart_data_global"] = measure(lambda: w.kpi.chart_series(year, None), args.repeat, clear_series)
+    timings["chart_data_habit"] = measure(lambda: w.kpi.chart_series(year, 0), args.repeat, clear_series)
+
+    settle = lambda: (w.stats_pool.waitForDone(), qa.processEvents())  # wait for the stats worker and apply its result
+    timings["view_update"] = measure(lambda: (w.trigger_full_update(), settle()), args.repeat, clear_series)
+    def page_burst():  # rapid ◀/▶ clicks: only the last view's result is computed and applied
+        for delta in (1, 1, 1, -1, -1, -1): w.change_month(delta)
+        settle()
+    timings["month_paging_burst"] = measure(page_burst, args.repeat)
+    def back_and_prefetch():  # each run pages forward once from the current month, so step back first
+        if (w.view_year, w.view_month) != (year, month): w.change_month(-1); settle()
+        w.prefetch_neighbours(); settle()  # what the idle job does 250 ms after a view is shown
+    timings["month_page_prefetched"] = measure(lambda: (w.change_month(1), settle()), args.repeat, back_and_prefetch)
+    w.change_month(-1); settle()
+    assert (w.view_year, w.view_month) == (year, month), "later cases must run on the current (editable) month"
+
+    def toggle_and_save():
+        before = w.history_data.get(year, 0, w.model.start_idx)
+        w.model.toggle(w.model.index(2, 0)); assert w.history_data.get(year, 0, w.model.start_idx) != before, "toggle hit a locked cell"
+        w.save_data(); w.storage.flush()
+    timings["save_data"] = measure(toggle_and_save, args.repeat)
+    timings["save_data_full"] = measure(lambda: (w.save_data(full=True), w.storage.flush()), args.repeat)
+
+    csv_path = os.path.abspath("export.csv"); first, last = datetime.date(years[0], 1, 1), datetime.date(year, 12, 31)
+    habits = list(range(len(w.habit_names)))
+    export = lambda **k: app.write_csv(csv_path, w.history_data.copy(years), w.habit_names, habits, first, last, **k)
+    timings["export_csv"] = measure(export, args.repeat)  # the worker body, every year, wide layout
+    timings["export_csv_long_gz"] = measure(lambda: export(long=True, compress=True), args.repeat)
+    export()  # the gzip run above left compressed bytes under csv_path
+    timings["import_read"] = measure(lambda: app.ImportPlan.read(csv_path, w.habit_names), args.repeat)  # re-reads the wide export
+    if importlib.util.find_spec("reportlab"):  # optional dependency, only needed for PDF export
+        pdf = lambda **k: app.write_pdf(os.path.abspath("report.pdf"), w.history_data.copy([year]), w.habit_names, year, month, **k)
+        timings["export_pdf"] = measure(pdf, args.repeat)
+        timings["export_pdf_all_habits"] = measure(lambda: pdf(all_habits=True), 1)
+
+    timings["leaderboard"] = measure(lambda: app.LeaderboardModel(w.habit_names, w.kpi.leaderboard(year, month)).sort(3, app.Qt.DescendingOrder), args.repeat)
+    model = w.model; roles = [model.DISPLAY, model.BACKGROUND, model.FOREGROUND, model.FONT, model.ALIGNMENT]
+    cells = [model.index(r, c) for r in range(model.rowCount()) for c in range(model.columnCount())]
+    def sweep():
+        for ix in cells:
+            for role in roles: model.data(ix, role)
+    timings["model_data_sweep"] = measure(sweep, args.repeat)
+    timings["table_repaint"] = measure(w.table.viewport().repaint, args.repeat)
+    timings["theme_toggle"] = measure(lambda: (w.toggle_theme(), qa.processEvents()), args.repeat)  # includes the re-polish Qt does on the next event pass
+    block = [(2, 0, w.model.rowCount() - 1, w.model.columnCount() - 1)]  # every habit x the visible month
+    last = {}
+    def check_flipped():  # the previous run must have inverted every habit's open days of the current month
+        rows = [w.history_data.packed_row(year, h) for h in range(len(w.habit_names))]
+        if last: assert all(a != b for a, b in zip(rows, last["rows"])), "range_invert changed nothing"
+        last["rows"] = rows
+    timings["range_invert"] = measure(lambda: w.edit_range(block, "invert"), args.repeat, check_flipped); check_flipped()
+    timings["undo_redo_delete"] = measure(lambda: (w.delete_habit(0), w.undo()), args.repeat)  # row remove + compressed snapshot, then reinsert
+    bar = w.table.verticalScrollBar()  # alternate between the ends of the habit list
+    timings["grid_scroll"] = measure(lambda: (bar.setValue(bar.maximum() - bar.value()), w.table.viewport().repaint()), args.repeat)
+    w.close(); qa.processEvents()
+    return {"habits": n_habits, "years": n_years, "density": density, "cells_per_month": len(cells), "month_cache": w.month_cache.counters(), "timings_ms": timings}
+
+def compare(report, baseline, threshold, min_delta):
+    """Prints median ratios against `baseline`; returns the number of regressions beyond `threshold` (and `min_delta` ms)."""
+    regressions = 0
+    for case, result in report["cases"].items():
+        old = baseline.get("cases", {}).get(case)
+        if old is None: continue
+        for name, t in result["timings_ms"].items():
+            prev = old["timings_ms"].get(name)
+            if not prev or not prev["median"]: continue
+            ratio = t["median"] / prev["median"]; flag = ratio > threshold and t["median"] - prev["median"] > min_delta
+            regressions += flag
+            print(f"{case:<22} {name:<24} {prev['median']:>10.2f} -> {t['median']:>10.2f} ms  x{ratio:5.2f}{'  REGRESSION' if flag else ''}")
+    return regressions
+
+def main(argv=None):
+    args = parse_args(argv)
+    os.environ.setdefault("QT_QPA_PLATFORM", "offscreen"); os.environ["HABIT_STORAGE"] = args.backend
+    out_path = os.path.abspath(args.out); baseline_path = os.path.abspath(args.compare) if args.compare else None
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    import app
+    from PySide6.QtWidgets import QApplication
+    for name in app.ImportPreloader.MODULES:  # import up front so the app's background preload does not skew timings
+        try: importlib.import_module(name)
+        except ImportError: pass
+    qa = QApplication.instance() or QApplication(sys.argv)
+    report = {"meta": {"created": datetime.datetime.now().isoformat(timespec="seconds"), "python": platform.python_version(),
+                       "platform": platform.platform(), "backend": args.backend, "repeat": args.repeat, "seed": args.seed}, "cases": {}}
+    cwd = os.getcwd()
+    for n_habits in args.habits:
+        for n_years in args.years:
+            for density in args.density:
+                case = f"h{n_habits}_y{n_years}_d{density:g}"; work = tempfile.mkdtemp(prefix="habit-bench-")
+                try:
+                    os.chdir(work)  # the app keeps its data files in the working directory
+                    report["cases"][case] = result = run_case(app, qa, n_habits, n_years, density, args)
+                finally:
+                    os.chdir(cwd); shutil.rmtree(work, ignore_errors=True)
+                print(case, " ".join(f"{k}={v['median']:.2f}" for k, v in result["timings_ms"].items()), flush=True)
+    with open(out_path, "w") as f: json.dump(report, f, indent=2)
+    print(f"report written to {out_path}")
+    if baseline_path:
+        with open(baseline_path) as f: regressions = compare(report, json.load(f), args.threshold, args.min_delta)
+        print(f"{regressions} regression(s) beyond x{args.threshold:g}")
+        return 1 if regressions else 0
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
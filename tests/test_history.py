@@ -0,0 +1,109 @@
+"""HistoryStore habit deletes/inserts on lazily loaded years, and KpiAggregates kept in step with them.
+
+Run with `python -m pytest -q` (needs numpy and PySide6, like the app itself)."""
+import os, sys, random, datetime
+import pytest
+
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import app
+from test_stats import baseline_stats, random_history, views
+
+def lazy_store(history, **kwargs):
+    """A HistoryStore whose years come from `history` ({"2025": rows}) only when first touched, like ShardedStorage."""
+    packed = app.HistoryStore.from_json(history); loads = []
+    def loader(year): loads.append(year); return [bytearray(row) for row in packed._years[year]]
+    return app.HistoryStore(loader=loader, known_years=packed.years(), **kwargs), loads
+
+def as_lists(store, n):
+    for y in store.years(): store.ensure(y, n)
+    return {str(y): [store.range(y, h) for h in range(n)] for y in store.years()}
+
+def test_delete_and_undo_leave_unloaded_years_on_disk():
+    rng = random.Random(1); history = random_history(rng, 4, (2024, 2025)); store, loads = lazy_store(history)
+    store.ensure(2025, 4); loads.clear()
+    rows = store.pop_habit(1)
+    assert loads == [] and rows[2024] is None and rows[2025] == bytes(app.HistoryStore.from_json(history)._years[2025][1])
+    assert app.unpack_rows(app.pack_rows(rows)) == rows
+    store.insert_habit(1, rows)
+    assert loads == [] and store.pending == {2024: []}
+    assert as_lists(store, 4) == history
+
+def test_queued_delete_detaches_the_row_when_its_year_loads():
+    rng = random.Random(2); history = random_history(rng, 3, (2024, 2025)); store, _ = lazy_store(history)
+    first = store.pop_habit(0); second = store.pop_habit(1)  # habits 0 and 2 of the file
+    store.ensure(2024, 1)  # loads 2024 and applies both queued removals
+    assert 2024 in store.dirty and store.range(2024, 0) == history["2024"][1]
+    store.insert_habit(1, second); store.insert_habit(0, first)
+    assert as_lists(store, 3) == history
+
+def test_queued_edits_survive_a_reload():
+    """What ShardedStorage persists in the manifest (pending) replays onto the unchanged year file."""
+    rng = random.Random(3); history = random_history(rng, 4, (2023, 2024)); store, _ = lazy_store(history)
+    moved = app.HistoryStore.from_json(history).packed_row(2024, 2)
+    store.pop_habit(2); store.insert_habit(0, {2023: bytes(app.HistoryStore.row_size(2023)), 2024: moved})
+    reloaded, _ = lazy_store(history, pending=store.pending)
+    expected = {y: [r[2], *r[:2], r[3]] for y, r in history.items()}; expected["2023"][0] = [0] * app.HistoryStore.days_in(2023)
+    assert as_lists(reloaded, 4) == as_lists(store, 4) == expected
+
+def test_habit_loader_reads_rows_instead_of_queueing():
+    rng = random.Random(4); history = random_history(rng, 2, (2024,)); packed = app.HistoryStore.from_json(history)
+    store, loads = lazy_store(history, habit_loader=lambda idx: {2024: packed.packed_row(2024, idx)})
+    rows = store.pop_habit(1)
+    assert loads == [] and not store.pending and rows == {2024: packed.packed_row(2024, 1)}
+    assert store.insert_habit(1, rows) == rows and not store.pending
+
+@pytest.mark.parametrize("seed", range(10))
+def test_kpi_insert_and_remove_match_per_day_loop(seed):
+    rng = random.Random(seed); today = datetime.date(2025, 1, 4); n = rng.choice((1, 2, 4))
+    history = random_history(rng, n, (2024, 2025)); store = app.HistoryStore.from_json(history); kpi = app.KpiAggregates(store, n)
+    for _ in range(6):
+        for view_year, view_month in views(today): kpi.stats(None, view_year, view_month, today)  # warm every cached aggregate
+        if n and rng.random() < 0.5:
+            h = rng.randrange(n); store.pop_habit(h); kpi.remove_habit(h); n -= 1
+            for rows in history.values(): rows.pop(h)
+        else:
+            h = rng.randrange(n + 1); rows = {int(y): app.HistoryStore.from_json(random_history(rng, 1, (int(y),))).packed_row(int(y), 0) for y in history}
+            store.insert_habit(h, rows); kpi.insert_habit(h); n += 1
+            for y, year_rows in history.items(): year_rows.insert(h, store.range(int(y), h))
+        for view_year, view_month in views(today):
+            for habit_idx in [None, *range(n)]:
+                assert kpi.stats(habit_idx, view_year, view_month, today) == baseline_stats(history, n, habit_idx, view_year, view_month, today)
+
+def test_state_blob_round_trip():
+    rng = random.Random(5); history = random_history(rng, 3, (2024, 2025)); store, _ = lazy_store(history)
+    names, times, restored = app.unpack_state(app.pack_state(["a", "b", "c"], ["x", "y", "z"], store))
+    assert (names, times) == (["a", "b", "c"], ["x", "y", "z"]) and restored.to_json() == history
+
+def test_undo_log_refuses_a_step_over_the_limit():
+    log = app.UndoLog(limit=1000)
+    assert log.record("edit", "toggle", 2025, 0, 0, 1)
+    assert not log.record("restore", "state", bytes(600), bytes(600)) and not log.can_undo()
+
+def test_a_replacement_store_never_repeats_a_version():
+    """MonthViewCache keys carry the version, so a restored store must not reuse the old one's."""
+    old = app.HistoryStore.from_json({"2025": [[1] * 365]}); seen = {old.version}
+    for d in range(5): old.set(2025, 0, d, 0); seen.add(old.version)
+    new = app.HistoryStore.from_json({"2025": [[0] * 365]}); new.set(2025, 0, 0, 1)
+    assert new.version not in seen
+
+def test_snapshot_writer_survives_a_serialization_error(tmp_path):
+    writer = app.SnapshotWriter(str(tmp_path / "data.json"), delay_ms=0)
+    writer.submit({"names": [object()]}); writer.flush()
+    assert isinstance(writer.last_error, TypeError) and writer._thread.is_alive()
+    writer.submit({"names": ["ok"]}); writer.flush()
+    assert writer.last_error is None and (tmp_path / "data.json").read_text() == '{"names": ["ok"]}'
+    writer.close()
+
+@pytest.mark.parametrize("engine_cls", [app.StatsEngine, app.KpiAggregates])
+def test_reading_stats_never_dirties_the_store(engine_cls):
+    """With ShardedStorage a dirty year is a shard write, so looking at stats must leave the store alone."""
+    store, _ = lazy_store(random_history(random.Random(6), 2, (2024,))); today = datetime.date(2025, 1, 4)
+    engine = engine_cls(store, 3)  # one habit more than the file has rows for
+    for view_year, view_month in views(today): engine.stats(None, view_year, view_month, today); engine.stats(2, view_year, view_month, today)
+    assert not store.take_dirty() and store.years() == [2024] and store.row_count(2024) == 2
+
+def test_insert_into_a_short_year_keeps_the_index():
+    store = app.HistoryStore.from_json({"2024": [[1] * 366]}); row = app.HistoryStore.from_json({"2024": [[0, 1] * 183]}).packed_row(2024, 0)
+    store.insert_habit(3, {2024: row})
+    assert store.row_count(2024) == 4 and store.packed_row(2024, 3) == row and store.range(2024, 1) == [0] * 366
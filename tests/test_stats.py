@@ -0,0 +1,97 @@
+"""StatsEngine / KpiAggregates against the original per-day calculate_stats loop.
+
+Run with `python -m pytest -q` (needs numpy and PySide6, like the app itself)."""
+import os, sys, random, datetime, calendar
+import pytest
+
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import app
+
+def baseline_stats(history, n, habit_idx, view_year, view_month, real_today):
+    """The pre-StatsEngine HabitApp.calculate_stats, lifted out of the widget: `history` maps str(year) to
+    n rows of 0/1 per day, and missing years count as all zeros (what sanitize_data used to create)."""
+    if n == 0: return {}
+    def year_rows(year):
+        return history.get(str(year)) or [[0] * app.HistoryStore.days_in(year) for _ in range(n)]
+    if view_year == real_today.year and view_month == real_today.month: ref_date = real_today
+    else: ref_date = datetime.date(view_year, view_month, calendar.monthrange(view_year, view_month)[1])
+
+    def get_val_on_date(d, h_idx):
+        year_data = year_rows(d.year); day_idx = d.timetuple().tm_yday - 1
+        if day_idx < 0 or day_idx >= len(year_data[0]): return 0
+        if h_idx is None: return sum(year_data[r][day_idx] for r in range(n)) / n
+        return year_data[h_idx][day_idx]
+
+    today_display = f"{int(get_val_on_date(real_today, habit_idx) * 100)}%"
+    days_since_monday = real_today.weekday()
+    week = [get_val_on_date(real_today - datetime.timedelta(days=days_since_monday - i), habit_idx) for i in range(days_since_monday + 1)]
+    weekly_avg = int((sum(week) / len(week)) * 100)
+    month = [get_val_on_date(datetime.date(view_year, view_month, i), habit_idx) for i in range(1, ref_date.day + 1)]
+    monthly_avg = int((sum(month) / len(month)) * 100)
+
+    curr_year_data = year_rows(view_year)
+    total_count = sum(sum(row) for row in curr_year_data) if habit_idx is None else sum(curr_year_data[habit_idx])
+    streak = curr = 0
+    for c in range(ref_date.timetuple().tm_yday):
+        success = all(curr_year_data[r][c] == 1 for r in range(n)) if habit_idx is None else curr_year_data[habit_idx][c] == 1
+        if success: curr += 1; streak = max(streak, curr)
+        else: curr = 0
+    return {"today": today_display, "streak": f"{streak} Days", "weekly": f"{weekly_avg}%", "monthly": f"{monthly_avg}%", "total": str(total_count)}
+
+def random_history(rng, n, years):
+    """Per-habit completion rates from empty to full, so all-done days (global streaks) actually occur."""
+    history = {}
+    for year in years:
+        rates = [rng.choice((0.0, 0.3, 0.7, 0.95, 1.0)) for _ in range(n)]
+        history[str(year)] = [[int(rng.random() < rate) for _ in range(app.HistoryStore.days_in(year))] for rate in rates]
+    return history
+
+# Week starts that fall in the previous year (2024-12-30 is a Monday), leap days, mid-year and year end
+TODAYS = [datetime.date(2025, 1, 1), datetime.date(2025, 1, 4), datetime.date(2024, 2, 29), datetime.date(2024, 12, 31),
+          datetime.date(2025, 7, 16), datetime.date(2021, 1, 3)]
+
+def views(today):
+    """The current month plus past and future months, including ones in neighbouring years."""
+    yield today.year, today.month
+    for delta in (-13, -1, 1, 2, 11):
+        yield app.CalendarIndex.shift_month(today.year, today.month, delta)
+
+@pytest.mark.parametrize("seed", range(30))
+@pytest.mark.parametrize("engine_cls", [app.StatsEngine, app.KpiAggregates])
+def test_stats_match_per_day_loop(seed, engine_cls):
+    rng = random.Random(seed); today = TODAYS[seed % len(TODAYS)]
+    n = rng.choice((1, 1, 2, 3, 5, 8))
+    history = random_history(rng, n, range(today.year - 1, today.year + 1))  # the following year stays absent
+    engine = engine_cls(app.HistoryStore.from_json(history), n)
+    for view_year, view_month in views(today):
+        for habit_idx in [None, *range(n)]:
+            assert engine.stats(habit_idx, view_year, view_month, today) == baseline_stats(history, n, habit_idx, view_year, view_month, today), (view_year, view_month, habit_idx)
+
+@pytest.mark.parametrize("seed", range(10))
+def test_incremental_toggles_match_per_day_loop(seed):
+    """KpiAggregates patched cell by cell agrees with a from-scratch baseline on the edited data."""
+    rng = random.Random(seed); today = TODAYS[seed % len(TODAYS)]; n = rng.choice((1, 2, 4))
+    history = random_history(rng, n, range(today.year - 1, today.year + 1))
+    store = app.HistoryStore.from_json(history); kpi = app.KpiAggregates(store, n)
+    for view_year, view_month in views(today): kpi.stats(None, view_year, view_month, today)  # warm every cached aggregate
+    for _ in range(200):
+        year = rng.choice((today.year - 1, today.year)); h = rng.randrange(n); d = rng.randrange(app.HistoryStore.days_in(year))
+        val = 1 - history[str(year)][h][d]; history[str(year)][h][d] = val
+        store.set(year, h, d, val); kpi.apply_toggle(year, h, d, val)
+    for view_year, view_month in views(today):
+        for habit_idx in [None, *range(n)]:
+            assert kpi.stats(habit_idx, view_year, view_month, today) == baseline_stats(history, n, habit_idx, view_year, view_month, today)
+
+@pytest.mark.parametrize("seed", range(5))
+def test_habit_stats_match_single_habit_stats(seed):
+    rng = random.Random(seed); today = TODAYS[seed % len(TODAYS)]; n = 6
+    engine = app.StatsEngine(app.HistoryStore.from_json(random_history(rng, n, range(today.year - 1, today.year + 1))), n)
+    for view_year, view_month in views(today):
+        assert engine.habit_stats(view_year, view_month, today) == [engine.stats(h, view_year, view_month, today) for h in range(n)]
+
+@pytest.mark.parametrize("engine_cls", [app.StatsEngine, app.KpiAggregates])
+def test_zero_habits(engine_cls):
+    engine = engine_cls(app.HistoryStore(), 0); today = datetime.date(2025, 1, 4)
+    assert engine.stats(None, today.year, today.month, today) == baseline_stats({}, 0, None, today.year, today.month, today) == {}
+    assert engine.habit_stats(today.year, today.month, today) == []